@@ -2,48 +2,320 @@ from typing import Any, Text, Dict, List
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet, FollowupAction
+import functools
 import logging
-import re
+import os
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from actions.lexicon_store import lexicons, start_reload_watcher
+from actions.log import configure_logging
+from actions.mapper_cache import MappedOrderCache
+from actions.menu import menu
+from actions.message_prep import prepared_messages
+from actions.metrics import metrics
+from actions.numerals import korean_number, parse_korean_number
+from actions.order_journal import create_journal_from_env
+from actions.segmenter import modify_segmenter
+from actions.session_store import OrderSessionStore, create_backend_from_env
+
+# 로거 설정 (레벨과 출력 형식은 LOG_LEVEL, LOG_LEVELS, LOG_DEBUG_SAMPLE_RATE, LOG_FORMAT 환경 변수로 조정)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# 추가 옵션을 정규화된 키로 변환하는 메서드
+# "샷, 휘핑크림", ["휘핑크림", "샷"], "샷, 샷" 처럼 표기가 달라도 같은 옵션 조합이면 같은 키가 된다
+def normalize_option_key(options):
+    if not options:
+        return ()
+    if isinstance(options, str):
+        options = options.split(",")
+    return tuple(sorted({opt.strip() for opt in options if opt and opt.strip()}))
+
+# 주문을 변경하는 OrderManager 메서드에 붙이는 데코레이터
+# 트랜잭션(주문 관리자의 잠금 포함) 안에서 실행해 변경 도중의 상태가 저장(to_dict)되지 않고,
+# 예외가 나면 그때까지의 변경을 되돌린다
+def order_mutation(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+# 되돌리기/다시 실행 기록을 남기는 최대 단계 수
+UNDO_LIMIT = int(os.getenv("ORDER_UNDO_LIMIT", "20"))
+
+# 변경 기록에서 주문 초기화를 나타내는 표시
+RESET = object()
+
+
+# dict에서 key 바로 뒤의 키 반환 메서드 (마지막이면 None)
+# 아래 두 메서드는 장바구니의 음료 수만큼 훑는다. 키오스크 장바구니에서는 이 수가 한 자릿수라서
+# 위치 색인을 따로 유지하지 않고, 음료가 없어지거나 되돌리기로 다시 생길 때만 호출한다
+def _next_key(mapping, key):
+    found = False
+    for item_key in mapping:
+        if found:
+            return item_key
+        found = item_key == key
+    return None
+
+
+# dict의 before 키 앞에 새 항목을 넣은 dict 반환 메서드
+def _insert_before(mapping, before, key, value):
+    inserted = {}
+    for item_key, item_value in mapping.items():
+        if item_key == before:
+            inserted[key] = value
+        inserted[item_key] = item_value
+    return inserted
+
+
+# 잔 위치 구간 목록에서 앞쪽 quantity 잔에 해당하는 구간 목록 반환 메서드
+# 구간은 (시작 위치, 잔 수)이며, 한 번에 추가한 잔들이 한 구간이 되므로 구간 수는 잔 수가 아니라 추가 횟수를 따른다
+def _first_ranges(ranges, quantity):
+    taken = []
+    for start, count in ranges:
+        if quantity <= 0:
+            break
+        used = min(count, quantity)
+        taken.append((start, used))
+        quantity -= used
+    return taken
+
+
+# 구간 목록에 구간들을 더한 목록 반환 메서드 (위치 순으로 정렬하고 바로 이어지는 구간은 합친다)
+def _merge_ranges(ranges, added):
+    merged = []
+    for start, count in sorted(list(ranges) + list(added)):
+        if merged and merged[-1][0] + merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], merged[-1][1] + count)
+        else:
+            merged.append((start, count))
+    return merged
+
+
+# 구간 목록에서 구간들을 뺀 목록 반환 메서드 (removed의 구간은 ranges 안에 있어야 한다)
+def _remove_ranges(ranges, removed):
+    remaining = list(ranges)
+    for removed_start, removed_count in removed:
+        removed_end = removed_start + removed_count
+        pieces = []
+        for start, count in remaining:
+            end = start + count
+            if start < removed_start:
+                pieces.append((start, min(end, removed_start) - start))
+            if removed_end < end:
+                left = max(start, removed_end)
+                pieces.append((left, end - left))
+        remaining = pieces
+    return remaining
 
-# 로거 설정
-logging.basicConfig(level=logging.DEBUG)
 
 # 현재 주문 목록을 저장
 class OrderManager:
     # 주문 관련 정보를 저장할 딕셔너리 초기화
     def __init__(self):
         self.orders = {}  # 음료별 주문 수량을 저장하는 딕셔너리
-        self.temperatures = {}  # 음료별 온도를 저장하는 딕셔너리
-        self.sizes = {}  # 음료별 사이즈를 저장하는 딕셔너리
-        self.additional_option = {}  # 음료별 추가 옵션을 저장하는 딕셔너리
-        self.hot_drinks = ["허브티"]  # 항상 핫으로만 제공되는 음료 리스트
-        self.ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]  # 항상 아이스로만 제공되는 음료 리스트
-    
+        # 음료별 주문 항목을 {(온도, 사이즈, 옵션 키): 잔 수} 형태로 저장하는 딕셔너리
+        # 잔마다 값을 따로 저장하지 않고 같은 조합의 음료는 수량만 센다
+        self.line_items = {}
+        # 음료별 항목의 잔 위치 구간 {음료: {항목 키: [(시작 위치, 잔 수), ...]}}
+        # 잔 단위 목록을 쓰던 때와 같은 요약 순서(항목마다 가장 앞에 남은 잔의 자리)를 유지하는 데 사용
+        self.cup_ranges = {}
+        self._next_position = 0  # 다음에 추가하는 잔의 위치 (추가할 때마다 잔 수만큼 증가)
+        self.revision = 0  # 주문이 바뀔 때마다 1씩 증가 (영속 저장소가 변경 여부 판단에 사용)
+        # 주문 요약 캐시: 음료별 요약 문장과 전체 요약 문장 (바뀐 음료의 문장만 다시 만든다)
+        self._summary_parts = {}
+        self._summary = None
+        self.lock = threading.RLock()
+        self.completed_order = None  # 주문 완료 후 포장/매장 선택을 기다리는 주문 (주문 기록부에 남길 내용)
+        # 진행 중인 트랜잭션의 변경 기록 (트랜잭션 밖에서는 None)
+        # 잔 변경: (음료, 항목 키, 위치 구간, 추가 여부, 뒤 음료), 초기화: (RESET, 이전 orders, 이전 line_items, 이전 cup_ranges)
+        self._operations = None
+        self.undo_stack = deque(maxlen=UNDO_LIMIT)  # 끝난 트랜잭션의 변경 기록 (되돌리기용)
+        self.redo_stack = deque(maxlen=UNDO_LIMIT)  # 되돌린 트랜잭션의 변경 기록 (다시 실행용)
+
+    # 주문 항목에 잔 위치 구간을 더하거나 빼는 메서드 (모든 주문 변경은 이 메서드를 거친다)
+    # 요약은 잔 단위 목록을 쓰던 때처럼 항목마다 가장 앞에 남은 잔의 자리에 나오므로,
+    # 잔을 빼거나 옮겨 항목의 첫 위치가 바뀌면 음료 안의 항목 순서를 첫 위치 순으로 다시 맞춘다
+    # before_drink가 주어지면 새로 생기는 음료를 before_drink 자리에 넣어 음료 순서를 유지한다
+    def _change_cups(self, drink_type, key, ranges, adding, before_drink=None):
+        items = self.line_items.get(drink_type)
+        if items is None:
+            items = {}
+            if before_drink in self.line_items:
+                self.line_items = _insert_before(self.line_items, before_drink, drink_type, items)
+                self.orders = _insert_before(self.orders, before_drink, drink_type, 0)
+            else:
+                self.line_items[drink_type] = items
+                self.orders[drink_type] = 0
+            self.cup_ranges[drink_type] = {}
+        variants = self.cup_ranges[drink_type]
+        delta = sum(count for _, count in ranges)
+        if not adding:
+            delta = -delta
+        # 되돌릴 때 같은 자리에 다시 넣을 수 있도록, 음료가 없어질 경우 바로 뒤의 음료를 기록
+        next_drink = None
+        if self._operations is not None and self.orders[drink_type] + delta <= 0:
+            next_drink = _next_key(self.line_items, drink_type)
+
+        old_ranges = variants.get(key, [])
+        new_ranges = _merge_ranges(old_ranges, ranges) if adding else _remove_ranges(old_ranges, ranges)
+        if new_ranges:
+            variants[key] = new_ranges
+            items[key] = items.get(key, 0) + delta
+            if new_ranges[0] != (old_ranges[:1] or [None])[0]:
+                ordered = sorted(items, key=lambda item_key: variants[item_key][0][0])
+                if ordered != list(items):
+                    self.line_items[drink_type] = {item_key: items[item_key] for item_key in ordered}
+        else:
+            variants.pop(key, None)
+            items.pop(key, None)
+
+        self.orders[drink_type] += delta
+        # 음료 수량이 0 이하일 경우 해당 음료 정보를 삭제
+        if self.orders[drink_type] <= 0:
+            del self.orders[drink_type]
+            del self.line_items[drink_type]
+            del self.cup_ranges[drink_type]
+        self.revision += 1
+        self._summary_parts.pop(drink_type, None)
+        self._summary = None
+        if self._operations is not None:
+            self._operations.append((drink_type, key, tuple(ranges), adding, next_drink))
+
+    # 주문 전체를 비우는 메서드 (이전 dict는 그대로 변경 기록에 남겨 상수 시간에 되돌린다)
+    # 이미 비어 있는 주문을 비우면 아무것도 기록하지 않는다 (되돌리기가 눈에 보이지 않는 단계가 되지 않도록)
+    def _reset(self, orders=None, line_items=None, cup_ranges=None):
+        if not self.line_items and not orders and not line_items:
+            return
+        if self._operations is not None:
+            self._operations.append((RESET, self.orders, self.line_items, self.cup_ranges))
+        self.orders = orders if orders is not None else {}
+        self.line_items = line_items if line_items is not None else {}
+        self.cup_ranges = cup_ranges if cup_ranges is not None else {}
+        self.revision += 1
+        self._summary_parts = {}
+        self._summary = None
+
+    # 여러 변경을 하나로 묶는 트랜잭션
+    # 블록 안에서 예외가 나면 블록에서 기록된 변경만 역순으로 되돌리고, 정상 종료하면 한 단계로 되돌리기 기록에 남긴다
+    # 중첩해서 사용하면 가장 바깥 트랜잭션에 합쳐지며, 안쪽 블록의 실패는 안쪽 블록 시작 시점까지만 되돌린다
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            outer = self._operations
+            operations = outer if outer is not None else []
+            savepoint = len(operations)
+            self._operations = operations
+            try:
+                yield self
+            except BaseException:
+                failed = operations[savepoint:]
+                del operations[savepoint:]
+                self._revert(failed)
+                raise
+            finally:
+                self._operations = outer
+            if outer is None and operations:
+                self.undo_stack.append(operations)
+                self.redo_stack.clear()
+
+    # 변경 기록을 역순으로 되돌리는 메서드 (되돌리면서 한 변경 기록을 반환)
+    def _revert(self, operations):
+        previous, self._operations = self._operations, []
+        reverted = self._operations
+        try:
+            for operation in reversed(operations):
+                if operation[0] is RESET:
+                    self._reset(operation[1], operation[2], operation[3])
+                else:
+                    drink_type, key, ranges, adding, next_drink = operation
+                    self._change_cups(drink_type, key, ranges, not adding, before_drink=next_drink)
+        finally:
+            self._operations = previous
+        return reverted
+
+    # 마지막 변경 되돌리기 메서드 (되돌릴 변경이 없으면 False)
+    def undo(self):
+        with self.lock:
+            if not self.undo_stack:
+                return False
+            self.redo_stack.append(self._revert(self.undo_stack.pop()))
+            return True
+
+    # 되돌린 변경 다시 실행 메서드 (다시 실행할 변경이 없으면 False)
+    def redo(self):
+        with self.lock:
+            if not self.redo_stack:
+                return False
+            self.undo_stack.append(self._revert(self.redo_stack.pop()))
+            return True
+
+    # 주문 상태를 JSON으로 저장할 수 있는 dict로 변환하는 메서드 (항목 순서와 잔 위치 구간 유지)
+    def to_dict(self):
+        with self.lock:
+            return {
+                "line_items": [
+                    [drink, [
+                        [temp, size, list(options), count, [list(r) for r in self.cup_ranges[drink][(temp, size, options)]]]
+                        for (temp, size, options), count in items.items()
+                    ]]
+                    for drink, items in self.line_items.items()
+                ],
+                "completed_order": self.completed_order,
+            }
+
+    # to_dict()로 저장한 상태에서 주문 관리자를 복원하는 메서드
+    @classmethod
+    def from_dict(cls, data):
+        manager = cls()
+        for drink, items in data.get("line_items", []):
+            manager.line_items[drink] = {}
+            manager.cup_ranges[drink] = {}
+            for item in items:
+                temp, size, options, count = item[:4]
+                key = (temp, size, tuple(options))
+                # 위치 구간이 없는 이전 형식은 저장된 항목 순서대로 잔이 이어져 있던 것으로 본다
+                ranges = [tuple(r) for r in item[4]] if len(item) > 4 else [(manager._next_position, count)]
+                manager.line_items[drink][key] = count
+                manager.cup_ranges[drink][key] = ranges
+                manager._next_position = max(manager._next_position, ranges[-1][0] + ranges[-1][1])
+            manager.orders[drink] = sum(manager.line_items[drink].values())
+        manager.completed_order = data.get("completed_order")
+        return manager
+
+    # 같은 음료의 한 항목에서 다른 항목으로 앞쪽 잔부터 수량을 옮기는 메서드 (옵션 추가/제거)
+    # 옮긴 잔은 자리를 그대로 유지한다 (먼저 더하고 나중에 빼서 음료가 잠시라도 없어지지 않게 함)
+    def _move_count(self, drink_type, from_key, to_key, quantity):
+        if from_key == to_key or quantity <= 0:
+            return
+        ranges = _first_ranges(self.cup_ranges[drink_type][from_key], quantity)
+        self._change_cups(drink_type, to_key, ranges, True)
+        self._change_cups(drink_type, from_key, ranges, False)
+
     # 커피 추가 메서드
+    @order_mutation
     def add_order(self, drink_type, quantity, temperature=None, size=None, additional_options=None):
-        logging.warning(drink_type)
+        logger.debug("%s", drink_type)
         drink_type = standardize_drink_name(drink_type)  # 음료 이름 표준화
-        
-        # 새로운 음료 주문을 추가하거나 기존 주문에 수량을 추가하는 메서드
-        if drink_type not in self.orders:
-            # 음료 타입이 처음 주문될 경우 초기화
-            self.orders[drink_type] = 0
-            self.temperatures[drink_type] = []
-            self.sizes[drink_type] = []
-            self.additional_option[drink_type] = []
-            
 
-        # 음료 타입에 대한 온도, 사이즈, 추가 옵션을 각각 quantity 수만큼 리스트에 추가
-        self.orders[drink_type] += quantity
-        self.temperatures[drink_type].extend([temperature] * quantity)
-        self.sizes[drink_type].extend([size] * quantity)
-        self.additional_option[drink_type].extend([additional_options] * quantity)
+        # 새로운 음료 주문을 추가하거나 기존 주문에 수량을 추가하는 메서드
+        if quantity and quantity > 0:
+            ranges = [(self._next_position, quantity)]
+            self._next_position += quantity
+            self._change_cups(drink_type, (temperature, size, normalize_option_key(additional_options)), ranges, True)
 
     # 커피 변경 메서드
+    @order_mutation
     def modify_order(self, old_drink_type, new_drink_type, quantity, temperature=None, size=None, additional_options=None):
         old_drink_type = standardize_drink_name(old_drink_type)  # 음료 이름 표준화
         new_drink_type = standardize_drink_name(new_drink_type)  # 음료 이름 표준화
-        
+
         # 기존 주문을 새로운 주문으로 수정하는 메서드
         if old_drink_type in self.orders:
             # 기존 음료 주문을 제거
@@ -52,233 +324,225 @@ class OrderManager:
         self.add_order(new_drink_type, quantity, temperature, size, additional_options)
 
     # 커피 제거 메서드
+    @order_mutation
     def subtract_order(self, drink_type, quantity, temperature=None, size=None, additional_options=None):
         drink_type = standardize_drink_name(drink_type)  # 음료 이름 표준화
         # 주문에서 특정 음료의 수량을 감소시키는 메서드
         if drink_type in self.orders:
             if quantity is None:
                 quantity = 1
-            # 조건에 맞는 음료의 인덱스를 저장할 리스트
-            indices_to_remove = []
-            # 조건에 맞는 음료의 인덱스를 찾기(이미 매핑이 된 상태로 디폴트 값을 넣었음)
-            for i in range(len(self.temperatures[drink_type])):
-                if (self.temperatures[drink_type][i] == temperature) and (self.sizes[drink_type][i] == size) and (self.additional_option[drink_type][i] == additional_options):
-                    indices_to_remove.append(i)
-                    if len(indices_to_remove) == quantity:
-                        break
-                            
-            if len(indices_to_remove) < quantity:
+            # 조건에 맞는 음료 항목 찾기(이미 매핑이 된 상태로 디폴트 값을 넣었음)
+            key = (temperature, size, normalize_option_key(additional_options))
+            if self.line_items[drink_type].get(key, 0) < quantity:
                 # 음료 수량이 부족할 경우 예외 발생 -> 즉, 초과
                 raise ValueError(f"{drink_type}의 수량이 충분하지 않습니다.")
-            else:
-                # 음료 정보에서 해당 인덱스의 항목들을 제거
-                for index in reversed(indices_to_remove):
-                    del self.temperatures[drink_type][index]
-                    del self.sizes[drink_type][index]
-                    del self.additional_option[drink_type][index]
-                self.orders[drink_type] -= quantity
-                # 음료 수량이 0 이하일 경우 해당 음료 정보를 삭제
-                if self.orders[drink_type] <= 0:
-                    del self.orders[drink_type]
-                    del self.temperatures[drink_type]
-                    del self.sizes[drink_type]
-                    del self.additional_option[drink_type]
+            # 같은 조합의 잔 중 앞쪽 잔부터 뺀다
+            self._change_cups(drink_type, key, _first_ranges(self.cup_ranges[drink_type][key], quantity), False)
         else:
             raise ValueError(f"{drink_type}은(는) 주문에 없습니다.")
 
     # 커피 추가옵션 추가 메서드
+    @order_mutation
     def add_additional_options(self, drink_type, quantity, temperature, size, current_options, add_additional_options):
         # 음료 이름을 표준화하여 데이터베이스의 일관성과 맞추기
         drink_type = standardize_drink_name(drink_type)
-        logging.warning(f"추가옵션 추가 실행")  # 추가 옵션 추가 작업 시작을 로그에 기록
-        logging.warning(f"{drink_type, quantity, temperature, size, current_options, add_additional_options}")
+        logger.debug("추가옵션 추가 실행")  # 추가 옵션 추가 작업 시작을 로그에 기록
+        logger.debug("%s", (drink_type, quantity, temperature, size, current_options, add_additional_options))
 
         if drink_type in self.orders:  # 주어진 음료가 현재 주문에 존재하는지 확인
-            indices_to_modify = []  # 수정할 인덱스를 저장할 리스트 초기화
-
-            # add_additional_options가 문자열인지 확인하고, 문자열이면 split 처리
-            if isinstance(add_additional_options, str):
-                add_additional_options_list = [opt.strip() for opt in add_additional_options.split(",")]
-            else:
-                add_additional_options_list = [opt.strip() for opt in add_additional_options]
-
-            # current_options도 리스트로 변환
-            if isinstance(current_options, str):
-                current_options_list = [opt.strip() for opt in current_options.split(",")]
-            else:
-                current_options_list = [opt.strip() for opt in current_options]
-
-            # 현재 옵션과 추가 옵션 비교 및 처리
-            for i in range(len(self.additional_option[drink_type])):  # 모든 주문 항목을 반복
-                current_temp = self.temperatures[drink_type][i]  # 현재 항목의 온도 정보 가져오기
-                current_size = self.sizes[drink_type][i]  # 현재 항목의 사이즈 정보 가져오기
-                existing_options = self.additional_option[drink_type][i].split(", ") if self.additional_option[drink_type][i] else []  # 현재 항목의 옵션 목록 가져오기
-                logging.warning(f"현재 옵션: {existing_options}, 현재 온도: {current_temp}, 현재 사이즈: {current_size}")  # 현재 옵션, 온도, 사이즈 로그 기록
-                logging.warning(f"추가해야할 옵션: {add_additional_options_list}")  # 추가해야할 옵션 로그 기록
-                logging.warning(f"현재 옵션 self: {current_options_list}, 현재 옵션: {existing_options}")
-
-                if current_temp == temperature and current_size == size:
-                    if set(current_options_list) == set(existing_options):
-                        # 기존 옵션에 새로운 옵션 추가
-                        updated_options = list(set(existing_options) | set(add_additional_options_list))
-                        self.additional_option[drink_type][i] = ", ".join(updated_options)
-                        logging.warning(f"수정된 옵션: {self.additional_option[drink_type][i]}")
-                        indices_to_modify.append(i)
-
-                        if len(indices_to_modify) == quantity:
-                            logging.warning(f"수정 완료: {indices_to_modify}")
-                            break
-
-                if len(indices_to_modify) < quantity:
-                    self.add_order(drink_type,quantity,temperature,size,add_additional_options)
-                    #raise ValueError(f"{drink_type}의 추가 옵션 수량이 충분하지 않습니다.")
+            current_key = normalize_option_key(current_options)
+            add_key = normalize_option_key(add_additional_options)
+            from_key = (temperature, size, current_key)
+
+            # 온도, 사이즈, 현재 옵션이 같은 항목에서 최대 quantity 잔까지 옵션 추가
+            modified = min(self.line_items[drink_type].get(from_key, 0), quantity)
+            updated_key = tuple(sorted(set(current_key) | set(add_key)))
+            logger.debug("수정된 옵션: %s, 수정된 잔 수: %s", updated_key, modified)
+            self._move_count(drink_type, from_key, (temperature, size, updated_key), modified)
+
+            if modified < quantity:
+                # 옵션을 추가할 음료가 부족하면 모자란 만큼 새로 주문
+                self.add_order(drink_type, quantity - modified, temperature, size, add_additional_options)
+                #raise ValueError(f"{drink_type}의 추가 옵션 수량이 충분하지 않습니다.")
         else:
             self.add_order(drink_type,quantity,temperature,size,add_additional_options)
             #raise ValueError(f"{drink_type}은(는) 주문에 없습니다.")
 
     # 커피 추가옵션 제거 메서드
+    @order_mutation
     def remove_additional_options(self, drink_type, quantity, temperature, size, current_options, last_remove_option):
         drink_type = standardize_drink_name(drink_type)  # 음료 이름 표준화
-        logging.warning(f"추가옵션 제거 실행")
-        logging.warning(f"현재 옵션: {current_options}, 제거 옵션: {last_remove_option}")
+        logger.debug("추가옵션 제거 실행")
+        logger.debug("현재 옵션: %s, 제거 옵션: %s", current_options, last_remove_option)
 
         if drink_type in self.get_orders():
-            indices_to_modify = []
+            current_key = normalize_option_key(current_options)
+            from_key = (temperature, size, current_key)
 
-            for i in range(len(self.additional_option[drink_type])):
-                current_temp = self.temperatures[drink_type][i]
-                current_size = self.sizes[drink_type][i]
-                current_options_list = self.additional_option[drink_type][i].split(", ") if self.additional_option[drink_type][i] else []
-
-                logging.warning(f"현재 옵션: {current_options_list}, 온도: {current_temp}, 사이즈: {current_size}")
-
-                if current_temp == temperature and current_size == size:
-                    if set(current_options_list) == set(current_options):
-                        # Remove the specified option
-                        updated_options = [opt for opt in current_options_list if opt != last_remove_option]
-                        logging.warning(f"제거 후 옵션: {updated_options}")
-
-                        self.additional_option[drink_type][i] = ", ".join(updated_options)
-                        indices_to_modify.append(i)
-                        if len(indices_to_modify) == quantity:
-                            break
-
-            if len(indices_to_modify) < quantity:
+            if self.line_items[drink_type].get(from_key, 0) < quantity:
                 raise ValueError(f"{drink_type}의 추가 옵션 수량이 충분하지 않습니다.")
+
+            # Remove the specified option
+            updated_key = tuple(opt for opt in current_key if opt != last_remove_option)
+            logger.debug("제거 후 옵션: %s", updated_key)
+            self._move_count(drink_type, from_key, (temperature, size, updated_key), quantity)
         else:
             raise ValueError(f"{drink_type}은(는) 주문에 없습니다.")
 
     # 주문 취소 메서드
+    @order_mutation
     def cancel_order(self):
         # 현재 모든 주문을 취소하고 초기화하는 메서드
         canceled_orders = self.orders.copy()  # 기존 주문을 백업
-        self.orders = {}
-        self.temperatures = {}
-        self.sizes = {}
-        self.additional_option = {}
+        self._reset()
         return canceled_orders  # 취소된 주문 반환
 
     # 주문 내역 초기화 메서드
+    @order_mutation
     def clear_order(self):
         # 현재 주문을 초기화하는 메서드
-        self.orders.clear()
-        self.temperatures.clear()
-        self.sizes.clear()
-        self.additional_option.clear()
+        self._reset()
+
+    # 주문 완료 메서드
+    # 현재 주문을 항목별 기록으로 옮겨 completed_order에 보관하고 장바구니를 비운다
+    # 주문 변경과 달리 트랜잭션으로 묶지 않는다 (완료한 주문은 되돌리기 대상이 아님)
+    def finish_order(self):
+        with self.lock:
+            self.completed_order = {
+                "order_id": uuid.uuid4().hex,
+                "completed_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+                "items": [
+                    {"drink": drink, "temperature": temp, "size": size, "options": list(options), "quantity": count}
+                    for drink, items in self.line_items.items()
+                    for (temp, size, options), count in items.items()
+                ],
+            }
+            self.clear_order()
+            # 완료된 주문은 되돌릴 수 없도록 되돌리기/다시 실행 기록도 비운다
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+            return self.completed_order
+
+    # 포장/매장 선택을 기다리던 주문을 꺼내는 메서드 (없으면 None)
+    def pop_completed_order(self):
+        with self.lock:
+            completed_order, self.completed_order = self.completed_order, None
+            if completed_order is not None:
+                self.revision += 1  # 영속 저장소에서도 꺼낸 주문이 지워지도록
+            return completed_order
 
     # 주문 내역 반환 메서드
     def get_orders(self):
         # 현재 주문 정보를 반환하는 메서드
         return self.orders
-    
+
     def get_temperatures(self):
-        # 현재 주문 정보를 반환하는 메서드
-        return self.temperatures
-    
+        # 음료별 온도를 잔 단위 리스트로 반환하는 메서드
+        return {drink: [key[0] for key, count in items.items() for _ in range(count)] for drink, items in self.line_items.items()}
+
     def get_sizes(self):
-        # 현재 주문 정보를 반환하는 메서드
-        return self.sizes
+        # 음료별 사이즈를 잔 단위 리스트로 반환하는 메서드
+        return {drink: [key[1] for key, count in items.items() for _ in range(count)] for drink, items in self.line_items.items()}
 
     # 주문 확인 후 출력 메서드
-    # def get_order_summary(self):
-    #     # 현재 주문 정보를 생성하여 반환하는 메서드
-    #     summary = []
-    #     # self.orders의 모든 음료 항목(음료 종류와 수량)에 대해 반복해 각 음료의 온도, 사이즈, 추가 옵션 정보를 가져옵니다.
-    #     for drink, quantity in self.orders.items():
-    #         temperatures = self.temperatures.get(drink, [None] * quantity)
-    #         sizes = self.sizes.get(drink, [None] * quantity)
-    #         options = self.additional_option.get(drink, [None] * quantity)
-
-    #         drink_summary = {}
-    #         for i in range(quantity):
-    #             temp = temperatures[i] if i < len(temperatures) else None
-    #             size = sizes[i] if i < len(sizes) else None
-    #             option = options[i] if i < len(options) else None
-    #             key = (temp, size, option)
-    #             if key in drink_summary:
-    #                 drink_summary[key] += 1
-    #             else:
-    #                 drink_summary[key] = 1
-
-    #         for (temp, size, option), count in drink_summary.items():
-    #             summary_item = f"{drink}"
-    #             if size:
-    #                 summary_item = f"{summary_item} {size} 사이즈"
-    #             if temp:
-    #                 summary_item = f"{temp} {summary_item}"
-    #             if option:
-    #                 # 여러 옵션을 "추가"라는 단어와 함께 출력
-    #                 options_list = option.split(", ")
-    #                 options_str = "".join([f" {opt} 추가" for opt in options_list])
-    #                 summary_item = f"{summary_item}{options_str}"
-    #             summary_item = f"{summary_item} {number_to_korean(count)}잔"
-    #             summary.append(summary_item.strip())
-    #     return ", ".join(summary)
+    # 요약 문장은 다음 주문 변경 전까지 캐시하고, 바뀐 음료의 문장만 다시 만든다
     def get_order_summary(self):
-        # 현재 주문 정보를 생성하여 반환하는 메서드
-        summary = []
-        # self.orders의 모든 음료 항목(음료 종류와 수량)에 대해 반복해 각 음료의 온도, 사이즈, 추가 옵션 정보를 가져옵니다.
-        for drink, quantity in self.orders.items():
-            temperatures = self.temperatures.get(drink, [None] * quantity)
-            sizes = self.sizes.get(drink, [None] * quantity)
-            options = self.additional_option.get(drink, [None] * quantity)
-
-            drink_summary = {}
-            for i in range(quantity):
-                temp = temperatures[i] if i < len(temperatures) else None
-                size = sizes[i] if i < len(sizes) else None
-                option = options[i] if i < len(options) else None
-                key = (temp, size, option)
-                if key in drink_summary:
-                    drink_summary[key] += 1
-                else:
-                    drink_summary[key] = 1
-
-            for (temp, size, option), count in drink_summary.items():
-                summary_item = f"{drink}"
-                if size:
-                    summary_item = f"{summary_item} {size} 사이즈"
-                if temp:
-                    summary_item = f"{temp} {summary_item}"
-                if option:
-                    # 중복된 옵션을 제거하고 한 번만 표시
-                    options_list = list(set(option.split(", ")))
-                    options_str = " ".join([f"{opt} 추가" for opt in options_list])
-                    summary_item = f"{summary_item} {options_str}"
-                summary_item = f"{summary_item} {number_to_korean(count)}잔"
-                summary.append(summary_item.strip())
-        return ", ".join(summary)
-
-order_manager = OrderManager()  # OrderManager 인스턴스 생성
+        with self.lock:
+            if self._summary is None:
+                parts = self._summary_parts
+                summary = []
+                for drink, items in self.line_items.items():
+                    part = parts.get(drink)
+                    if part is None:
+                        part = parts[drink] = render_drink_summary(drink, items)
+                    summary.append(part)
+                self._summary = ", ".join(summary)
+            return self._summary
+
+
+# 음료 하나의 주문 요약 문장을 만드는 메서드 ("아이스 아메리카노 라지 사이즈 샷 추가 두잔, ...")
+def render_drink_summary(drink, items):
+    summary = []
+    # 음료별로 (온도, 사이즈, 추가 옵션) 조합과 잔 수가 이미 묶여 있으므로 항목 수만큼만 반복
+    for (temp, size, options), count in items.items():
+        summary_item = f"{drink}"
+        if size:
+            summary_item = f"{summary_item} {size} 사이즈"
+        if temp:
+            summary_item = f"{temp} {summary_item}"
+        if options:
+            # 옵션 키는 이미 중복이 제거되어 있음
+            options_str = " ".join([f"{opt} 추가" for opt in options])
+            summary_item = f"{summary_item} {options_str}"
+        summary_item = f"{summary_item} {number_to_korean(count)}잔"
+        summary.append(summary_item.strip())
+    return ", ".join(summary)
+
+# 대화(sender_id)별 OrderManager 저장소 (키오스크마다 장바구니를 따로 관리)
+order_sessions = OrderSessionStore(
+    OrderManager,
+    capacity=int(os.getenv("ORDER_SESSION_CAPACITY", "512")),  # 동시에 유지할 최대 대화 수
+    ttl=float(os.getenv("ORDER_SESSION_TTL", "1800")),  # 유휴 대화 만료 시간(초)
+    backend=create_backend_from_env(OrderManager.from_dict),  # ORDER_STORE_BACKEND=sqlite면 재시작 후에도 장바구니 유지
+)
+
+# 완료된 주문 기록부 (ORDER_JOURNAL_PATH를 지정했을 때만 사용, 아니면 None)
+order_journal = create_journal_from_env()
+
+
+# 완료된 주문을 주문 기록부에 남기는 메서드 (주문 완료 시점에 바로 기록하므로 세션이 만료되어도 빠지지 않음)
+def journal_completed_order(sender_id, completed_order):
+    if order_journal is None or not completed_order:
+        return
+    order_journal.append({
+        "record": "order",
+        "order_id": completed_order["order_id"],
+        "sender_id": sender_id,
+        "completed_at": completed_order["completed_at"],
+        "items": completed_order["items"],
+        "total_quantity": sum(item["quantity"] for item in completed_order["items"]),
+    })
+
+
+# 완료된 주문의 포장/매장 선택을 후속 레코드로 남기는 메서드 (order_id로 주문 레코드와 연결)
+def journal_takeout(sender_id, completed_order, takeout):
+    if order_journal is None or not completed_order:
+        return
+    order_journal.append({
+        "record": "takeout",
+        "order_id": completed_order["order_id"],
+        "sender_id": sender_id,
+        "completed_at": completed_order["completed_at"],
+        "recorded_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "takeout": takeout,
+    })
+
+# 엔티티 값 끝에 붙어 함께 추출되는 조사/어미
+ENTITY_SUFFIXES = ("사이즈로", "사이즈", "으로", "으", "걸로", "로", "는", "은", "해주세요", "해서", "해", "한거", "이랑", "도", "주시고", "주고")
+
+
+# 엔티티 값에서 접미사를 하나 제거하는 메서드 (drink_type 엔티티는 그대로 반환)
+def strip_entity_suffix(entity_type, value):
+    if entity_type == 'drink_type':
+        return value
+    for suffix in ENTITY_SUFFIXES:
+        if value.endswith(suffix):
+            return value[:-len(suffix)]
+    return value
+
 
 # 엔티티 매핑
 class OrderMapper:
     def __init__(self, entities, is_temperature_change=False, is_size_change=False):
-        self.entities = sorted(entities, key=lambda x: x['start'])
+        # 전달받은 엔티티(읽기 전용일 수 있음)는 그대로 두고 복사본에서 접미사를 지운다
+        self.entities = [dict(entity) for entity in sorted(entities, key=lambda x: x['start'])]
+        # 엔티티 종류별 개수를 한 번만 세어 두기
+        self.entity_counts = {}
+        for entity in self.entities:
+            self.entity_counts[entity['entity']] = self.entity_counts.get(entity['entity'], 0) + 1
         self.is_temperature_change = is_temperature_change  # 온도 변경 기능 실행 여부 플래그
         self.is_size_change = is_size_change  # 사이즈 변경 기능 실행 여부 플래그
         self.drinks = []
-        self.suffixes = ("사이즈로", "사이즈", "으로", "으", "걸로", "로", "는", "은", "해주세요", "해서", "해", "한거", "이랑", "도", "주시고", "주고")
         if self.check_multi_order():
             self.check_multiple_option()
         else:
@@ -309,14 +573,7 @@ class OrderMapper:
     # 엔티티 값에서 제거할 접미사 제거 메서드
     def clean_entity_values(self):
         for entity in self.entities:
-            # drink_type 엔티티가 아닌 경우에만 접미사 제거
-            if entity['entity'] != 'drink_type':
-                value = entity["value"]
-                for suffix in self.suffixes:
-                    if value.endswith(suffix):
-                        value = value[:-len(suffix)]
-                        break
-                entity["value"] = value
+            entity["value"] = strip_entity_suffix(entity['entity'], entity["value"])
 
 
     def check_multiple_option(self):
@@ -378,7 +635,7 @@ class OrderMapper:
                         'additional_options': [value] if entity_type == 'additional_options' else []
                     }
 
-        logging.warning(f"처리된 order_Conf: {order_Conf}")
+        logger.debug("처리된 order_Conf: %s", order_Conf)
 
         # order_Conf의 데이터를 order로 통합하고 표준화
         for order_key, order_data in order_Conf.items():
@@ -402,15 +659,14 @@ class OrderMapper:
                     }
                     drinks.append(drink_entry)
 
-        logging.warning(f'최종 처리된 drinks: {drinks}')
+        logger.debug("최종 처리된 drinks: %s", drinks)
         self._complete_order(drinks)
     
     # 음료와 온도, 잔 수, 사이즈, 추가옵션 매핑 메서드
     def _map_entities(self):
         self.clean_entity_values()
+        self._build_neighbor_index()
         current_order = self._initialize_order()
-        drink_type_count_temp = self._count_drink_types()
-        drink_type_count_size = self._count_drink_types()
         temperature_entities_count = self._count_temperature_entities()
         apply_default_temperature = self.is_temperature_change and temperature_entities_count == 1
         size_entities_count = self._count_size_entities()
@@ -418,6 +674,7 @@ class OrderMapper:
 
         # 중복 방지를 위한 처리된 엔티티의 범위를 추적
         processed_ranges = set()
+        overlapping_drinks = self._find_overlapping_drinks()
 
         for i, entity in enumerate(self.entities):
             # 이미 처리된 범위에 있는 엔티티는 건너뛰기
@@ -425,26 +682,14 @@ class OrderMapper:
                 continue
 
             if entity['entity'] == 'drink_type':
-                # 현재 엔티티와 겹치는 다른 drink_type 엔티티가 있는지 확인
-                overlapping = False
-                for other_entity in self.entities:
-                    if (other_entity['entity'] == 'drink_type' and 
-                        other_entity is not entity and 
-                        ((other_entity['start'] <= entity['start'] <= other_entity['end']) or
-                        (entity['start'] <= other_entity['start'] <= entity['end']))):
-                        # 겹치는 엔티티가 발견되면, 더 긴 엔티티를 선택
-                        overlapping = True
-                        if (other_entity['end'] - other_entity['start']) > (entity['end'] - entity['start']):
-                            processed_ranges.add((entity['start'], entity['end']))
-                            processed_ranges.add((other_entity['start'], other_entity['end']))
-                            entity = other_entity
-                        else:
-                            processed_ranges.add((entity['start'], entity['end']))
-                            processed_ranges.add((other_entity['start'], other_entity['end']))
-                        break
-
-                if not overlapping:
-                    processed_ranges.add((entity['start'], entity['end']))
+                # 현재 엔티티와 겹치는 다른 drink_type 엔티티가 있는지 확인 (미리 계산해 둔 값 사용)
+                other_entity = overlapping_drinks.get(i)
+                processed_ranges.add((entity['start'], entity['end']))
+                if other_entity is not None:
+                    # 겹치는 엔티티가 발견되면, 더 긴 엔티티를 선택
+                    processed_ranges.add((other_entity['start'], other_entity['end']))
+                    if (other_entity['end'] - other_entity['start']) > (entity['end'] - entity['start']):
+                        entity = other_entity
 
                 if current_order['drink_type']:
                     self._complete_order(current_order)
@@ -494,7 +739,7 @@ class OrderMapper:
 
             elif entity['entity'] == 'quantity':
                 quantity = standardize_quantity(entity['value'])
-                current_order['quantity'] = int(quantity) if quantity.isdigit() else korean_to_number(quantity)
+                current_order['quantity'] = korean_to_number(quantity)
 
             elif entity['entity'] == 'size':
                 current_order['size'] = standardize_size(entity['value'])
@@ -507,21 +752,64 @@ class OrderMapper:
 
     # 음료 타입 엔티티 개수 반환 메서드
     def _count_drink_types(self):
-        return sum(1 for entity in self.entities if entity['entity'] == 'drink_type')
+        return self.entity_counts.get('drink_type', 0)
 
     # 사이즈 엔티티 개수 반환 메서드
     def _count_size_entities(self):
-        return sum(1 for entity in self.entities if entity['entity'] == 'size')
+        return self.entity_counts.get('size', 0)
     
     # 온도 엔티티 개수 반환 메서드
     def _count_temperature_entities(self):
-        return sum(1 for entity in self.entities if entity['entity'] == 'temperature')
+        return self.entity_counts.get('temperature', 0)
     
     def _count_quantity_entities(self):
-        return sum(1 for entity in self.entities if entity['entity'] == 'quantity')
+        return self.entity_counts.get('quantity', 0)
     
     def _count_additional_options_entities(self):
-        return sum(1 for entity in self.entities if entity['entity'] == 'additional_options')
+        return self.entity_counts.get('additional_options', 0)
+
+    # 각 위치에서 뒤쪽으로 가장 가까운 엔티티 인덱스를 미리 계산하는 메서드
+    # (drink_type마다 엔티티 리스트를 다시 훑지 않도록 뒤에서부터 한 번만 계산)
+    def _build_neighbor_index(self):
+        count = len(self.entities)
+        self._next_temperature = [None] * count  # i 뒤의 첫 temperature 인덱스
+        self._next_size_or_drink = [None] * count  # i 뒤의 첫 size 또는 drink_type 인덱스
+        self._next_drink = [None] * count  # i 뒤의 첫 drink_type 인덱스
+        next_temperature = next_size_or_drink = next_drink = None
+        for i in range(count - 1, -1, -1):
+            self._next_temperature[i] = next_temperature
+            self._next_size_or_drink[i] = next_size_or_drink
+            self._next_drink[i] = next_drink
+            entity_type = self.entities[i]['entity']
+            if entity_type == 'temperature':
+                next_temperature = i
+            elif entity_type == 'size':
+                next_size_or_drink = i
+            elif entity_type == 'drink_type':
+                next_size_or_drink = i
+                next_drink = i
+
+    # drink_type 엔티티마다 처음으로 겹치는 다른 drink_type 엔티티를 찾는 메서드
+    # 시작 위치 순으로 한 번만 훑으면서, 앞쪽 엔티티 중 아직 현재 위치까지 이어지는 것만 큐에 남겨 둔다
+    def _find_overlapping_drinks(self):
+        overlapping = {}
+        active = deque()  # 앞에서 나온 drink_type 엔티티 (리스트 순서 유지)
+        for i, entity in enumerate(self.entities):
+            if entity['entity'] != 'drink_type':
+                continue
+            # 시작 위치는 계속 커지므로 한 번 끝난 엔티티는 다시 겹칠 수 없다
+            while active and active[0]['end'] < entity['start']:
+                active.popleft()
+            if active:
+                # 앞쪽 엔티티 중 리스트에서 가장 먼저 나온 것과 겹친다
+                overlapping[i] = active[0]
+            else:
+                # 뒤쪽 엔티티는 바로 다음 drink_type만 확인하면 된다
+                next_index = self._next_drink[i]
+                if next_index is not None and self.entities[next_index]['start'] <= entity['end']:
+                    overlapping[i] = self.entities[next_index]
+            active.append(entity)
+        return overlapping
 
     # 사이즈 매핑 알고리즘 메서드
     def _find_next_or_previous_size_entity(self, current_index):
@@ -538,12 +826,10 @@ class OrderMapper:
         if current_index > 0 and self.entities[current_index - 1]['entity'] == 'size':
             return standardize_size(self.entities[current_index - 1]['value'])
 
-        # 잔 수(quantity) 엔티티 바로 뒤의 엔티티가 size인 경우
-        for i in range(current_index + 1, len(self.entities)):
-            if self.entities[i]['entity'] == 'size':
-                return standardize_size(self.entities[i]['value'])
-            if self.entities[i]['entity'] == 'drink_type':
-                break
+        # 잔 수(quantity) 엔티티 바로 뒤의 엔티티가 size인 경우 (다음 drink_type 전까지)
+        next_index = self._next_size_or_drink[current_index]
+        if next_index is not None and self.entities[next_index]['entity'] == 'size':
+            return standardize_size(self.entities[next_index]['value'])
         return None
      #(매핑 수정 9번 문제점)
     def _find_next_drink_entity(self, current_index):
@@ -567,11 +853,11 @@ class OrderMapper:
             return self._map_temperature(self.entities[current_index - 1]['value'])
         
         # 뒤의 엔티티 중에서 temperature를 찾음
-        for i in range(current_index + 1, len(self.entities)):
-            if self.entities[i]['entity'] == 'temperature':
-                if i + 1 < len(self.entities) and self.entities[i + 1]['entity'] == 'drink_type':
-                    return None
-                return self._map_temperature(self.entities[i]['value'])
+        i = self._next_temperature[current_index]
+        if i is not None:
+            if i + 1 < len(self.entities) and self.entities[i + 1]['entity'] == 'drink_type':
+                return None
+            return self._map_temperature(self.entities[i]['value'])
         return None
 
     # 온도 값 표준화(아이스, 핫) 후 매핑 메서드
@@ -579,8 +865,7 @@ class OrderMapper:
         return standardize_temperature(value)
 
     def _complete_order(self, orders):
-        hot_drinks = ["허브티"]
-        ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]
+        catalog = menu.catalog
 
         # orders가 딕셔너리인 경우 리스트로 변환
         if isinstance(orders, dict):
@@ -594,26 +879,22 @@ class OrderMapper:
             quantity = order.get('quantity', 1)
             additional_options = order.get('additional_options', [])
 
-            if drink_type in hot_drinks:
-                temperature = "핫"
-            elif drink_type in ice_only_drinks:
-                temperature = "아이스"
-            else:
-                if not temperature:
-                    temperature = "핫"
+            # 온도가 고정된 음료는 고정 온도, 그 외에는 말한 온도(없으면 기본 온도) 사용
+            fixed_temperature = catalog.fixed_temperature(drink_type)
+            if fixed_temperature is not None:
+                temperature = fixed_temperature
+            elif not temperature:
+                temperature = catalog.default_temperature
             
             if not size:
-                size = "미디움"
+                size = catalog.default_size
                 
             if not quantity or quantity == []:
                 quantity = 1
 
             # 문자열을 숫자로 변환 (필요한 경우)
             if isinstance(quantity, str):
-                try:
-                    quantity = int(quantity)
-                except ValueError:
-                    quantity = korean_to_number(quantity)
+                quantity = korean_to_number(quantity)
 
             # additional_options 처리
             if isinstance(additional_options, str):
@@ -635,7 +916,7 @@ class OrderMapper:
 
     # 완성된 음료 주문 데이터 반환 메서드
     def get_mapped_data(self):
-        logging.warning(self.drinks)
+        logger.debug("%s", self.drinks)
         """
         -완성된 음
         """
@@ -647,441 +928,65 @@ class OrderMapper:
         return temperatures, drink_types, sizes, quantities, additional_options
 
 
+# NLU가 음료 엔티티를 놓친 발화는 표준화 사전으로 만든 검색기로 엔티티를 보충 (ENTITY_SPOTTER=0이면 사용하지 않음)
+@metrics.timed("entity_spotter")
+def spot_entities(text):
+    return lexicons.current.spotter.spot(text)
+
+
+if os.getenv("ENTITY_SPOTTER", "1") != "0":
+    prepared_messages.fallback = spot_entities
+
+
+# 같은 엔티티 묶음의 OrderMapper 결과를 재사용하는 캐시
+# 캐시에 없어서 OrderMapper를 새로 실행한 경우의 시간을 order_mapper 단계로 기록
+# 사전이나 메뉴가 바뀌면 매핑 결과가 달라질 수 있으므로 두 버전을 캐시 키에 포함한다
+mapped_orders = MappedOrderCache(
+    metrics.timed("order_mapper")(OrderMapper),
+    maxsize=int(os.getenv("MAPPER_CACHE_SIZE", "1024")),
+    version=lambda: (lexicons.version, menu.version),
+)
+
 
 def korean_to_number(korean: str) -> int:
-    # 한국어 수량을 숫자로 변환하는 메서드
-    # dictionary.get(key, default), 딕셔너리에서 :의 왼쪽은 키값(key) 오른쪽은 값(value)이다
-    korean_number_map = {
-            "한": 1,
-            "두": 2,
-            "세": 3,
-            "네": 4,
-            "다섯": 5,
-            "여섯": 6,
-            "일곱": 7,
-            "여덟": 8,
-            "아홉": 9,
-            "열": 10
-        }
-    return korean_number_map.get(korean, 1)  # korean 문자열이 사전에 존재하지 않으면 기본값으로 1을 반환
+    # 한국어 수량을 숫자로 변환하는 메서드 ("스무", "열다섯", "이십오", "12" 등 999까지)
+    # 수로 읽을 수 없는 문자열이면 기본값으로 1을 반환하고, 999를 넘으면 ValueError(QuantityOutOfRange) 발생
+    return parse_korean_number(korean) or 1
 
-# 숫자를 한국어 수량으로 변환하는 메서드
+# 숫자를 한국어 수량으로 변환하는 메서드 (korean_to_number의 역변환, 1000 이상은 숫자 문자열)
 def number_to_korean(number: int) -> str:
-    number_korean_map = {
-        1: "한",
-        2: "두",
-        3: "세",
-        4: "네",
-        5: "다섯",
-        6: "여섯",
-        7: "일곱",
-        8: "여덟",
-        9: "아홉",
-        10: "열"
-    }
-    return number_korean_map.get(number, str(number))  # 기본값으로 숫자 문자열을 반환
+    return korean_number(number)
 
 # 음료 종류 및 띄어쓰기 표준화 메서드
+@metrics.timed("normalize_drink_type")
 def standardize_drink_name(name):
-    # 음료 이름 변형을 표준 이름으로 매핑하는 사전
-    drink_name_map = {
-        # 아메리카노 변형
-        "아모리카노": "아메리카노",
-        "아메이카노": "아메리카노",
-        "아메리까도": "아메리카노",
-        "아메리카도": "아메리카노",
-        "아메이까노": "아메리카노",
-        "아메리카든": "아메리카노",
-        "아메리카로": "아메리카노",
-        "아메리카나": "아메리카노",
-        "아메리카누": "아메리카노",
-        "아모니카노": "아메리카노",
-
-        # 카페라떼 변형
-        "카페랃떼": "카페라떼",
-        "카페라테": "카페라떼",
-        "카페라뗴": "카페라떼",
-        "카폐라떼": "카페라떼",
-        "카페랃떼": "카페라떼",
-        "카페라터": "카페라떼",
-        "카페라태": "카페라떼",
-        "카페라디": "카페라떼",
-        "카페나떼": "카페라떼",
-        "카페다떼": "카페라떼",
-        "카페라트": "카페라떼",
-        "카페랏테": "카페라떼",
-        "카페랒떼": "카페라떼",
-        "라떼": "카페라떼",
-        "라뗴": "카페라떼",
-        "라때": "카페라떼",
-
-        # 에스프레소 변형
-        "에스프래쏘": "에스프레소",
-        "에스프레쏘": "에스프레소",
-        "에스프라소": "에스프레소",
-        "에스프래소": "에스프레소",
-        "에스플레소": "에스프레소",
-        "에스프러소": "에스프레소",
-        "에스프레수": "에스프레소",
-        "에스프래수": "에스프레소",
-        "에스프래쇼": "에스프레소",
-        "에수프레소": "에스프레소",
-        "에스페로": "에스프레소",
-
-        # 카푸치노 변형
-        "카프치노": "카푸치노",
-        "카포치노": "카푸치노",
-        "카푸치도": "카푸치노",
-        "카푸치로": "카푸치노",
-        "카프치로": "카푸치노",
-        "카부치노": "카푸치노",
-        "카푸취노": "카푸치노",
-        "카푸티노": "카푸치노",
-        "카푸친누": "카푸치노",
-        "카프티노": "카푸치노",
-
-        # 마끼아또 변형
-        "카라멜마기아또": "카라멜마끼아또",
-        "카라멜마끼야또": "카라멜마끼아또",
-        "카라멜마키아또": "카라멜마끼아또",
-        "카라멜막혔더": "카라멜마끼아또",
-        "마키아또": "카라멜마끼아또",
-        "마끼야도": "카라멜마끼아또",
-        "마키야또": "카라멜마끼아또",
-        "마끼아도": "카라멜마끼아또",
-        "마키아도": "카라멜마끼아또",
-        "마키야도": "카라멜마끼아또",
-        "마까아또": "카라멜마끼아또",
-        "마끼아또": "카라멜마끼아또",
-        "라벨마끼아또": "카라멜마끼아또",
-        "카메라맡기어도": "카라멜마끼아또",
-        "카라멜마기야도": "카라멜마끼아또",
-        
-        # 말차라떼 변형
-        "말자라떼": "말차라떼",     # 띄어쓰기 버전 추가
-        "말자라떼": "말차라떼",
-        "말차라태": "말차라떼",
-        "말자라테": "말차라떼",
-        "말자라태": "말차라떼",
-        "말짜라떼": "말차라떼",
-        "말짜라태": "말차라떼",
-        "말짜라테": "말차라떼",
-        "말타라떼": "말차라떼",
-        "말타라태": "말차라떼",
-        "말사라떼": "말차라떼",
-        "말잘할때": "말차라떼",
-        "마찰할때": "말차라떼",
-        "말찾았대": "말차라떼",
-        "말잘했다": "말차라떼",
-
-        # 허브티 변형
-        "허부티": "허브티",
-        "허브치": "허브티",
-        "허브디": "허브티",
-        "허브테": "허브티",
-        "허브트": "허브티",
-        "허브틔": "허브티",
-        "허부트": "허브티",
-        "허브태": "허브티",
-        "허부테": "허브티",
-        "허브탸": "허브티",
-        "허벅지": "허브티",
-        "허버트": "허브티",
-        "호텔": "허브티",
-
-        # 밀크티 변형
-        "밀크치": "밀크티",
-        "밀크테": "밀크티",
-        "밀크디": "밀크티",
-        "밀크태": "밀크티",
-        "밀크틔": "밀크티",
-        "밀크트": "밀크티",
-        "밀크탸": "밀크티",
-        "밀크떼": "밀크티",
-        "밀크때": "밀크티",
-
-        # 딸기스무디 변형
-        "딸기스므디": "딸기스무디",   # 띄어쓰기 버전 추가
-        "달기스무디": "딸기스무디",
-        "따기스무디": "딸기스무디",
-        "딸기스므디": "딸기스무디",
-        "딸기수무디": "딸기스무디",
-        "딸기스무지": "딸기스무디",
-        "딸기스므지": "딸기스무디",
-        "달기수무디": "딸기스무디",
-        "따기수무지": "딸기스무디",
-        "딸기스무데": "딸기스무디",
-        "달기스무데": "딸기스무디",
-        "다기스무디": "딸기스무디",
-
-        # 망고스무디 변형
-        "망그스무디": "망고스무디",
-        "맹고스무디": "망고스무디",
-        "망고스므디": "망고스무디",
-        "망고수무디": "망고스무디",
-        "망고스무지": "망고스무디",
-        "맹고스므디": "망고스무디",
-        "망그수무디": "망고스무디",
-        "맹고스무지": "망고스무디",
-        "망고스무데": "망고스무디",
-        "맹고스무데": "망고스무디",
-        "망고스머리": "망고스무디",
-        "망고스뮤비": "망고스무디",
-
-        # 쿠키앤크림 변형
-        "쿠키 엔 크림": "쿠키앤크림",  # 띄어쓰기 버전 추가
-        "쿠키엔크림": "쿠키앤크림",
-        "쿠키앤크링": "쿠키앤크림",
-        "쿠키엔크링": "쿠키앤크림",
-        "쿠키앤그림": "쿠키앤크림",
-        "쿠키엔그림": "쿠키앤크림",
-        "쿠킹앤크림": "쿠키앤크림",
-        "쿠킹엔크림": "쿠키앤크림",
-        "쿠키안크림": "쿠키앤크림",
-        "쿠키앤크린": "쿠키앤크림",
-        "쿠키엔크린": "쿠키앤크림",
-        "쿠킹크림": "쿠키앤크림",
-        "쿠킹그림": "쿠키앤크림",
-        "쿠앤크": "쿠키앤크림",
-
-        # 레몬에이드 변형
-        "레문에이드": "레몬에이드",
-        "래몬에이드": "레몬에이드", 
-        "레몬애이드": "레몬에이드",
-        "레몬에이들": "레몬에이드",
-        "레문애이드": "레몬에이드",
-        "래몬애이드": "레몬에이드",
-        "레몬에이즈": "레몬에이드",
-        "래문에이드": "레몬에이드",
-        "레몬에이트": "레몬에이드",
-        "레문에이듭": "레몬에이드",
-        "레모네이드": "레몬에이드",
-        "네모에이드": "레몬에이드",
-
-        # 키위주스 변형
-        "키윗주스": "키위주스",
-        "키위쥬스": "키위주스",
-        "큐위주스": "키위주스",
-        "키위즈스": "키위주스",
-        "키위쥬쓰": "키위주스",
-        "키윗쥬스": "키위주스",
-        "큐위쥬스": "키위주스",
-        "키위주쓰": "키위주스",
-        "키위쭈스": "키위주스",
-        "키위쮜스": "키위주스",
-        "키즈스": "키위주스",
-        "tv스투스": "키위주스",
-        "Tv스투스": "키위주스",
-        "TV스투스": "키위주스",
-        "tv쥬스": "키위주스",
-        "Tv쥬스": "키위주스",
-        "TV쥬스": "키위주스",
-
-        # 토마토주스 변형
-        "토마도주스": "토마토주스",
-        "토마토쥬스": "토마토주스",
-        "토마토즈스": "토마토주스",
-        "토마토쥬쓰": "토마토주스",
-        "토마도쥬스": "토마토주스",
-        "토마토주쓰": "토마토주스",
-        "토마도쮜스": "토마토주스",
-        "토마토쮜스": "토마토주스",
-        "토마토쭈스": "토마토주스",
-        "토마도주쓰": "토마토주스",
-        "토마토소스": "토마토주스",
-
-        # 띄어쓰기 있는 버전 추가
-        "토마토쥬스": "토마토주스",
-        "토마토즈스": "토마토주스",
-        "토마토쥬쓰": "토마토주스",
-        "토마도쥬스": "토마토주스",
-        "토마토주쓰": "토마토주스",
-        "토마도쮜스": "토마토주스",
-        "토마토쮜스": "토마토주스",
-        "토마토쭈스": "토마토주스",
-        "토마토소스": "토마토주스",
-
-        # 기타 음료 변형
-        "아포가토": "아포카토",
-        "아보카도": "아포카토",
-        "아프리카": "아포카토",
-        "초콜릿": "초콜릿라떼",
-        "초콜릿대": "초콜릿라떼",
-        "바닐라떼": "바닐라라떼",
-        "바닐라레떼": "바닐라라떼",
-        
-        #카페 모카
-        "카페북한": "카페모카",
-
-        #키위주스
-        "TV스투스": "키위주스",
-        "TV쥬스": "키위주스",
-        "tv스투스": "키위주스",
-        "tv쥬스": "키위주스",
-
-        #복숭아 아이스티 
-        "복숭아ost": "복숭아아이스티",
-        "복숭아st": "복숭아아이스티",
-        "복숭아St": "복숭아아이스티",
-        "복숭아ST": "복숭아아이스티",
-        "복숭아에스티": "복숭아아이스티",
-        "복숭아하이스틸": "복숭아아이스티",
-        "복숭아아이스크림": "복숭아아이스티",
-
-        "복수아티": "복숭아티",
-        "복숭하티": "복숭아티",
-        "북숭아티": "복숭아티",
-        "복숭앗티": "복숭아티",
-        "복성아티": "복숭아티",
-        "북성아티": "복숭아티",
-        "복숭화티": "복숭아티",
-        "복숭어티": "복숭아티",
-        "복슝아티": "복숭아티",
-        "복송아티": "복숭아티",
-        "복숑아티": "복숭아티",
-        "복숭이티": "복숭아티",
-        
-        # 바닐라라떼 관련 추가
-        "바닐라떼": "바닐라라떼",
-        "바닐라레떼": "바닐라라떼",
-        
-        # 새롭게 추가될 변형들
-        "아메": "아메리카노",    # 두 글자 메뉴
-        "아라": "카페라떼",     # 아이스 라떼 -> 커스텀으로 
-        "에스": "에스프레소",    # 두 글자 메뉴
-        "카푸": "카푸치노",     # 두 글자 메뉴
-        "모카": "카페모카",     # 두 글자 메뉴
-        "카라": "카라멜마끼아또",  # 두 글자 메뉴
-        "바라": "바닐라라떼",    # 두 글자 메뉴
-        "초라": "초콜릿라떼",    # 두 글자 메뉴
-        
-        "아삿추": "아샷추",
-        "아샤추": "아샷추",
-        "아삭추": "아샷추",
-        "아솟추": "아샷추",
-        "아삳추": "아삿츄",
-        "아샷츄": "아샷추",
-        "아삿슈": "아샷추",
-        "아삿수": "아샷추",
-        "아샷슈": "아샷추",
-        "아샷수": "아샷추",
-        "아시아추": "아샷추",
-        "아시아츄": "아샷추",
-        "아사이추": "아샷추"
-    }
-
-    # 공백과 쉼표 제거
-    # re.sub는 (패턴, 교체할 값, 검색할 대상 문자열, 교체할 최대횟수(선택), 동작 수정 플래그(선택)) 으로 동작한다.
-    standardized_name = re.sub(r'[\s,]+', '', name)
-    # 매핑 사전을 사용하여 표준 이름으로 변환
-    if standardized_name in drink_name_map:
-        return drink_name_map[standardized_name]
-    else:
-        return standardized_name
+    # 현재 음료 이름 사전으로 표준화 (공백과 쉼표 제거 후 매핑)
+    return lexicons.current.drinks.standardize(name)
 
 # 온도를 표준화하는 메서드
+@metrics.timed("normalize_temperature")
 def standardize_temperature(value):
-    hot_terms = [
-        "핫", "따뜻한", "따듯한", "뜨거운", "뜨뜻한", "뜨겁게", "따뜻하게", "따듯하게",
-        "따듯함", "뜨거움", "핫트", "따땃함", "따슨", "따순느", "뜨겁그", "따슷한",
-        "따순한", "뜨뜻함", "따뜻힌", "핫또", "따신", "따뜻히", "뜨거히", "하수", "hot"
-    ]
-    
-    ice_terms = [
-        "아이스", "차가운", "시원한", "시원하게", "차갑게", "차가움", "시원함", "차갑음",
-        "아이씨", "아이스르", "시원하그", "아이스트", "차갑은", "시원은", "아이써",
-        "시원히", "차갑히", "아이수", "차가이", "시원혀", "아이스으"
-    ]
-    
-    if value in ice_terms:
-        return "아이스"
-    elif value in hot_terms:
-        return "핫"
-    return value
+    return lexicons.current.normalizer.normalize("temperature", value)
 
 # 잔 수를 표준화하는 메서드
+@metrics.timed("normalize_quantity")
 def standardize_quantity(value):
-    if value in ["한", "앉", "안", "환", "완", "라", "하나", "하낫", "한자", "한단", "하나째", "하나슷"]:
-        return "한"
-    elif value in ["두", "도", "투", "둘슷", "둘째", "두자", "투자"]:
-        return "두"
-    elif value in ["세", "재", "대", "서흣", "셋째", "세자", "세상", "세계", "재산"]:
-        return "세"
-    elif value in ["네", "내", "너얼", "넷째", "내전", "내산", "내장"]:
-        return "네"
-    elif value in ["다섯", "das", "다서", "다섯슷", "다섯째"]:
-        return "다섯"
-    elif value in ["여섯", "여섯슷", "여섯째"]:
-        return "여섯"
-    elif value in ["일곱", "일굽", "일곱슷", "일곱째"]:
-        return "일곱"
-    elif value in ["여덟", "여덜", "여덟슷", "여덟째"]:
-        return "여덟"
-    elif value in ["아홉", "아홉슷", "아홉째"]:
-        return "아홉"
-    elif value in ["열", "열슷", "열째"]:
-        return "열"
-    elif value in ["1"]:
-        return "한"
-    elif value in ["2"]:
-        return "두"
-    elif value in ["3"]:
-        return "세"
-    elif value in ["4"]:
-        return "네"
-    elif value in ["5"]:
-        return "다섯"
-    elif value in ["6"]:
-        return "여섯"
-    elif value in ["7"]:
-        return "일곱"
-    elif value in ["8"]:
-        return "여덟"
-    elif value in ["9"]:
-        return "아홉"
-    elif value in ["10"]:
-        return "열"
-    return value
+    return lexicons.current.normalizer.normalize("quantity", value)
 
 # 사이즈를 표준화하는 메서드
+@metrics.timed("normalize_size")
 def standardize_size(value):
-    if value in ["미디움", "보통", "중간", "기본", "톨", "비디오", "토"]:
-        return "미디움"
-    elif value in ["라지", "큰", "크게", "라의", "라디오", "라디"]:
-        return "라지"
-    elif value in ["엑스라지", "엑스라이즈", "제1 큰", "가장 큰", "제1 크게", "맥시멈"]:
-        return "엑스라지"
-    return value
+    return lexicons.current.normalizer.normalize("size", value)
 
 # 추가옵션를 표준화하는 메서드
+@metrics.timed("normalize_additional_options")
 def standardize_option(value):
-    if value in ["샤츠", "셔츠", "사추", "샤타나", "4추", "삿", "샷트", "삿추", 
-                 "솟트", "샤트추가", "샤추가", "싯", "솟추", "삿으", "샷으", 
-                 "사아트", "소옷", "삿트"]:
-        return "샷"
-    elif value in ["카라멜실업", "실룩실룩", "가라멜시럽", "카라멜시로", 
-                  "카라멜씨럽", "카라메르시럽", "카라멜시롭", "시롭추가", 
-                  "카라멜시리얼", "카나멜시럽", "카나멜시로", "씨럽추가"]:
-        return "카라멜시럽"
-    elif value in ["바닐라실업", "바닐라씨럽", "바니나시럽", "바닐라시로프", 
-                   "바닐라시롭", "바닐라시리얼"]:
-        return "바닐라시럽"
-    elif value in ["비비크림", "휘프크림", "휘핑크링", "휘핑프림", "휘프링", 
-                   "휘핑크린", "휘팽크림", "휘핑그림", "휘프킹", "휘팽", 
-                   "휘삐", "휘삥", "휘삔"]:
-        return "휘핑크림"
-    elif value in ["어름", "얼룸", "얼이", "얼음으", "어이스", "어룸", "얼잉",
-                   "어름이", "얼으", "얼이음", "어이슬", "어이스으"]:
-        return "얼음"
-    return value
+    return lexicons.current.normalizer.normalize("additional_options", value)
 
 # 테이크아웃을 표준화하는 메서드
+@metrics.timed("normalize_take")
 def standardize_take(value):
-    if value in ["테이크아웃", "들고", "가져", "먹을", "마실", "아니요"]:
-        return "포장"
-    elif value in ["먹고", "여기", "이곳", "네","마시"]:
-        return "매장"
-    return value
+    return lexicons.current.normalizer.normalize("take", value)
 
 
 # 커피의 종류가 정해지지 않으면 오류 발생 메서드
@@ -1151,6 +1056,7 @@ class ActionOrderConfirmation(Action):
         return "action_order_confirmation"
 
     #학습 된데이터를 받는곳으로 추정.
+    @metrics.instrument_action
     async def run(
         self,
         dispatcher: CollectingDispatcher,
@@ -1158,53 +1064,48 @@ class ActionOrderConfirmation(Action):
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # # 현재 주문 정보 초기화(주문을 하는데 이전 주문 정보가 남아있으면 안됨)
             # order_manager.clear_order()
-            # 최근 사용자 메시지에서 엔터티를 가져오기
-            entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
-            user_text = tracker.latest_message.get("text", "")
+            # 최근 사용자 메시지에서 엔터티를 가져오기 (메시지마다 한 번만 정리)
+            message = prepared_messages.get(tracker)
+            entities = message.entities
+            user_text = message.text
             
             if "사이즈 업" in user_text:
                 raise KeyError("size up")
                 
             # 엔티티를 위치 순서로 정렬
-            mapper = OrderMapper(entities)
+            mapper = mapped_orders.get(entities)
             
             # 주문 결과를 저장할 딕셔너리
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
 
             #(수정 변수)
-            logging.warning(f"주문 엔티티: {entities}")
-            logging.warning(f"온도, 커피, 사이즈, 잔 수, 옵션: {temperatures} {drink_types} {sizes} {quantities} {additional_options}")
+            logger.debug("주문 엔티티: %s", entities)
+            logger.debug("온도, 커피, 사이즈, 잔 수, 옵션: %s %s %s %s %s", temperatures, drink_types, sizes, quantities, additional_options)
             
             # 고정된 온도 음료의 온도 확인
-            hot_drinks = ["허브티"]
-            ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]
-            
-            # 온도 제한 확인
+            catalog = menu.catalog
             for i in range(len(drink_types)):
-                if drink_types[i] in hot_drinks and temperatures[i] != "핫":
-                    raise ValueError(f"{drink_types[i]}는(은) 온도를 변경하실 수 없습니다.")
-                if drink_types[i] in ice_only_drinks and temperatures[i] != "아이스":
+                if not catalog.allows_temperature(drink_types[i], temperatures[i]):
                     raise ValueError(f"{drink_types[i]}는(은) 온도를 변경하실 수 없습니다.")
             
             raise_missing_attribute_error(mapper.drinks)  # 음료 속성 검증
             
-            # 주문 처리 시 중복 옵션 제거
-            if drink_types and quantities:
-                for i in range(len(drink_types)):
-                    # 추가 옵션이 있는 경우 중복 제거
-                    if additional_options[i]:
-                        options_list = list(set(additional_options[i].split(", ")))
-                        additional_options[i] = ", ".join(options_list)
-                    
-                    order_manager.add_order(
-                        drink_types[i], 
-                        quantities[i], 
-                        temperatures[i], 
-                        sizes[i], 
-                        additional_options[i]
-                    )
+            # 주문 처리 (중복 옵션은 OrderManager가 옵션 키를 만들 때 제거)
+            # 여러 잔 중 하나라도 실패하면 모두 취소
+            with order_manager.transaction():
+                if drink_types and quantities:
+                    for i in range(len(drink_types)):
+                        order_manager.add_order(
+                            drink_types[i], 
+                            quantities[i], 
+                            temperatures[i], 
+                            sizes[i], 
+                            additional_options[i]
+                        )
             
             confirmation_message = f"주문하신 음료는 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
             # 출력
@@ -1213,6 +1114,7 @@ class ActionOrderConfirmation(Action):
         except ValueError as e:
             dispatcher.utter_message(text=str(e))
         except Exception as e:
+                metrics.count_error("action", self.name())
                 dispatcher.utter_message(text=f"주문 접수 중 오류가 발생했습니다: {str(e)}")
         return []
     
@@ -1222,70 +1124,57 @@ class ActionModifyOrder(Action):
     def name(self) -> Text:
         return "action_modify_order"
 
-    # 주어진 텍스트 범위 내에서 엔티티 추출
-    def extract_entities(self, text, tracker):
-        entities = []
-        for entity in tracker.latest_message.get("entities", []):
-            if entity.get("extractor") != "DIETClassifier" and entity["start"] >= text["start"] and entity["end"] <= text["end"]:
-                entities.append(entity)
-        return entities
-
     # 액션 실행 메소드
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 가장 최근 사용자 메시지에서 엔티티 추출
-            modify_entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
+            message = prepared_messages.get(tracker)
+            modify_entities = message.entities
+            catalog = menu.catalog
         
-            mapper = OrderMapper(modify_entities)
+            mapper = mapped_orders.get(modify_entities)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
-            user_text = tracker.latest_message.get("text", "")
+            user_text = message.text
 
-            logging.warning(f"사용자 주문 변경 입력 내용: {modify_entities}")
-            logging.warning(f"사용자 주문 변경 입력 내용: {user_text}")
+            logger.debug("사용자 주문 변경 입력 내용: %s", modify_entities)
+            logger.debug("사용자 주문 변경 입력 내용: %s", user_text)
 
             raise_missing_attribute_error(mapper.drinks)  # 음료 속성 검증
-            keywords = ["대신","말고","은","는","를","빼고","을","아니고","아닌","아니라","뺴고","있는","빼주시고"]
-            # '대신' 또는 '말고'를 사용하여 주문 변경 여부 확인
-            if any(keyword in user_text for keyword in keywords):
-                # '대신' 또는 '말고'를 기준으로 텍스트 분리
-                split_text = re.split("대신|말고|은|있는|는|를|빼고|을|아니고|아닌|아니라|빼주시고|뺴고", user_text)
-                logging.warning(f"매칭 시도: {split_text}")
-                if len(split_text) == 2:
-                    target_part = {"text": split_text[0].strip(), "start": 0, "end": len(split_text[0].strip())}
-                    new_part = {"text": split_text[1].strip(), "start": len(split_text[0]) + 2, "end": len(user_text)}
-
-                    logging.warning(f"target_part 내용: {target_part}")
-                    logging.warning(f"new_part 내용: {new_part}")
-
-                    # 각각의 텍스트 부분에서 엔티티 추출
-                    target_entities = self.extract_entities(target_part, tracker)
-                    new_entities = self.extract_entities(new_part, tracker)
-
-                    logging.warning(f"target_entities 내용: {target_entities}")
-                    logging.warning(f"new_entities 내용: {new_entities}")
-
-                    # 대상 및 새 엔티티를 매핑하여 데이터 추출
-                    target_mapper = OrderMapper(target_entities)
-                    target_temperatures, target_drink_types, target_sizes, target_quantities, target_additional_options = target_mapper.get_mapped_data()
-
-                    new_mapper = OrderMapper(new_entities)
-                    new_temperatures, new_drink_types, new_sizes, new_quantities, new_additional_options = new_mapper.get_mapped_data()
-
-                    logging.warning(f"target_mapper 내용: {target_temperatures, target_drink_types, target_sizes, target_quantities, target_additional_options}")
-                    logging.warning(f"new_mapper 내용: {new_temperatures, new_drink_types, new_sizes, new_quantities, new_additional_options}")
-
-                    # 고정된 온도 음료의 온도 확인
-                    hot_drinks = ["허브티"]
-                    ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]
-
-                    for i in range(len(new_drink_types)):
-                        if new_drink_types[i] in hot_drinks and new_temperatures[i] != "핫":
-                            raise ValueError(f"{new_drink_types[i]}는(은) 온도를 변경하실 수 없습니다.")
-                        if new_drink_types[i] in ice_only_drinks and new_temperatures[i] != "아이스":
-                            raise ValueError(f"{new_drink_types[i]}는(은) 온도를 변경하실 수 없습니다.")
+            # '대신', '말고' 등의 표현이나 엔티티 뒤 조사를 기준으로 바꿀 대상과 새 주문의 엔티티 분리
+            segments = modify_segmenter.segment(user_text, modify_entities)
+            if segments is not None:
+                target_entities, new_entities = segments
+                logger.debug("target_entities 내용: %s", target_entities)
+                logger.debug("new_entities 내용: %s", new_entities)
+
+                # 대상 및 새 엔티티를 매핑하여 데이터 추출
+                target_mapper = mapped_orders.get(target_entities)
+                target_temperatures, target_drink_types, target_sizes, target_quantities, target_additional_options = target_mapper.get_mapped_data()
+
+                new_mapper = mapped_orders.get(new_entities)
+                new_temperatures, new_drink_types, new_sizes, new_quantities, new_additional_options = new_mapper.get_mapped_data()
+
+                logger.debug("target_mapper 내용: %s", (target_temperatures, target_drink_types, target_sizes, target_quantities, target_additional_options))
+                logger.debug("new_mapper 내용: %s", (new_temperatures, new_drink_types, new_sizes, new_quantities, new_additional_options))
+
+                # 고정된 온도 음료의 온도 확인
+                for i in range(len(new_drink_types)):
+                    if not catalog.allows_temperature(new_drink_types[i], new_temperatures[i]):
+                        raise ValueError(f"{new_drink_types[i]}는(은) 온도를 변경하실 수 없습니다.")
+
+                # 현재 주문 목록을 가져와서 바꿀 음료가 모두 목록에 있는지 먼저 확인합니다. (없으면 아무것도 바꾸지 않음)
+                missing_drink = next((drink for drink in target_drink_types if drink not in order_manager.get_orders()), None)
+                if missing_drink is not None:
+                    dispatcher.utter_message(text=f"{missing_drink}은(는) 주문에 없습니다.")
+                    return []
 
+                # 제거와 추가를 하나의 트랜잭션으로 묶어 중간에 실패하면 원래 주문으로 되돌립니다.
+                with order_manager.transaction():
                     # 기존 주문에서 대상 항목 제거, 제거할 음료, 수량, 온도, 사이즈, 추가 옵션을 가져옵니다.
                     for i in range(len(target_drink_types)):
                         target_drink = target_drink_types[i]
@@ -1293,13 +1182,8 @@ class ActionModifyOrder(Action):
                         target_temperature = target_temperatures[i] if i < len(target_temperatures) else None
                         target_size = target_sizes[i] if i < len(target_sizes) else None
                         target_option = target_additional_options[i] if i < len(target_additional_options) else None
-                        # 현재 주문 목록을 가져와서 target_drink가 목록에 있는지 확인합니다.
-                        # 음료가 ㄻ하면 order_manager.subtract_order를 호출하여 해당 음료를 주문에서 제거합니다.
-                        if target_drink in order_manager.get_orders():
-                            order_manager.subtract_order(target_drink, target_quantity, target_temperature, target_size, target_option)
-                        else:
-                            dispatcher.utter_message(text=f"{target_drink}은(는) 주문에 없습니다.")
-                            return []
+                        # order_manager.subtract_order를 호출하여 해당 음료를 주문에서 제거합니다.
+                        order_manager.subtract_order(target_drink, target_quantity, target_temperature, target_size, target_option)
 
                     # 새 항목을 기존 주문에 추가, 추가할 음료, 수량, 온도, 사이즈, 추가 옵션을 가져옵니다.
                     for i in range(len(new_drink_types)):
@@ -1309,41 +1193,45 @@ class ActionModifyOrder(Action):
                         new_temperature = new_temperatures[i] if i < len(new_temperatures) else None
                         new_option = new_additional_options[i] if i < len(new_additional_options) else None
 
-                        if new_drink in order_manager.ice_only_drinks:
-                            dispatcher.utter_message(text=f"{new_drink}는 아이스만 가능합니다.")
-                            new_temperature = "아이스"
-                        elif new_drink in order_manager.hot_drinks:
-                            dispatcher.utter_message(text=f"{new_drink}는 핫만 가능합니다.")
-                            new_temperature = "핫"
+                        fixed_temperature = catalog.fixed_temperature(new_drink)
+                        if fixed_temperature is not None:
+                            dispatcher.utter_message(text=f"{new_drink}는 {fixed_temperature}만 가능합니다.")
+                            new_temperature = fixed_temperature
                         # 해당 음료를 주문에 추가합니다.
                         order_manager.add_order(new_drink, new_quantity, new_temperature, new_size, new_option)
+            elif modify_segmenter.has_marker(user_text):
+                # 변경 표현은 있지만 바꿀 대상과 새 주문으로 나눌 수 없는 경우 주문을 바꾸지 않고 다시 물어봅니다.
+                # (주문 전체를 비우고 다시 담으면 여러 음료가 담긴 장바구니가 사라질 수 있음)
+                dispatcher.utter_message(text="어떤 음료를 어떻게 바꿀지 이해하지 못했습니다. '아메리카노 말고 카페라떼로 바꿔주세요'처럼 말씀해주세요.")
+                return []
             else:
                 # '대신' 또는 '말고', '은', '는' 이 없을 경우, 기존 주문을 비우고 새로 추가
-                order_manager.clear_order()
+                # 비운 뒤 추가하다 실패하면 비우기 전 주문으로 되돌립니다.
+                with order_manager.transaction():
+                    order_manager.clear_order()
 
-                logging.warning(f"주문 변경 엔티티: {modify_entities}")
+                    logger.debug("주문 변경 엔티티: %s", modify_entities)
 
-                for i in range(len(drink_types)):
-                    new_drink = drink_types[i]
-                    new_quantity = quantities[i]
-                    new_size = sizes[i] if i < len(sizes) else None
-                    new_temperature = temperatures[i] if i < len(temperatures) else None
-                    new_option = additional_options[i] if i < len(additional_options) else None
+                    for i in range(len(drink_types)):
+                        new_drink = drink_types[i]
+                        new_quantity = quantities[i]
+                        new_size = sizes[i] if i < len(sizes) else None
+                        new_temperature = temperatures[i] if i < len(temperatures) else None
+                        new_option = additional_options[i] if i < len(additional_options) else None
 
-                    if new_drink in order_manager.ice_only_drinks:
-                        dispatcher.utter_message(text=f"{new_drink}는 아이스만 가능합니다.")
-                        new_temperature = "아이스"
-                    elif new_drink in order_manager.hot_drinks:
-                        dispatcher.utter_message(text=f"{new_drink}는 핫만 가능합니다.")
-                        new_temperature = "핫"
+                        fixed_temperature = catalog.fixed_temperature(new_drink)
+                        if fixed_temperature is not None:
+                            dispatcher.utter_message(text=f"{new_drink}는 {fixed_temperature}만 가능합니다.")
+                            new_temperature = fixed_temperature
 
-                    order_manager.add_order(new_drink, new_quantity, new_temperature, new_size, new_option)
+                        order_manager.add_order(new_drink, new_quantity, new_temperature, new_size, new_option)
 
             # 최종 주문 확인 메시지 생성 및 출력
             confirmation_message = f"주문이 수정되었습니다. 현재 주문은 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
             dispatcher.utter_message(text=confirmation_message)
             return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             dispatcher.utter_message(text=f"주문 변경 중 오류가 발생했습니다: {str(e)}")
             return []
 
@@ -1353,17 +1241,21 @@ class ActionSubtractFromOrders(Action):
     def name(self) -> Text:
         # 액션의 이름을 반환하는 메소드
         return "action_subtract_from_order"
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 현재 의도(intent)와 메시지 텍스트 확인
-            current_intent = tracker.latest_message.get('intent', {}).get('name')
-            user_message = tracker.latest_message.get('text', '').lower()
+            message = prepared_messages.get(tracker)
+            current_intent = message.intent
+            user_message = message.text.lower()
             
             # 디버깅을 위한 로그 추가
-            logging.warning(f"Current intent: {current_intent}")
-            logging.warning(f"User message: {user_message}")
+            logger.debug("Current intent: %s", current_intent)
+            logger.debug("User message: %s", user_message)
 
             # 제거 관련 키워드 정의
             removal_keywords = ['취소', '빼', '제거', '삭제', '지워', '없애', '안 넣어']
@@ -1373,32 +1265,33 @@ class ActionSubtractFromOrders(Action):
             
 
             # 여기서부터는 실제 제거 로직
-            subtract_entities = [entity for entity in tracker.latest_message.get("entities", []) 
-                            if entity.get("extractor") != "DIETClassifier"]
+            subtract_entities = message.entities
             
-            logging.warning(f"사용자 주문 제거 입력 내용: {subtract_entities}")
+            logger.debug("사용자 주문 제거 입력 내용: %s", subtract_entities)
             
-            mapper = OrderMapper(subtract_entities)
+            mapper = mapped_orders.get(subtract_entities)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
 
-            logging.warning(f"사용자 주문 제거 매핑 데이터: {temperatures, drink_types, sizes, quantities, additional_options}")
+            logger.debug("사용자 주문 제거 매핑 데이터: %s", (temperatures, drink_types, sizes, quantities, additional_options))
 
-            # 제거 로직 실행
-            for i in range(len(drink_types)):
-                drink = drink_types[i]
-                quantity = quantities[i]
-                size = sizes[i] if i < len(sizes) else None
-                temperature = temperatures[i] if i < len(temperatures) else None
-                additional_option = additional_options[i] if i < len(additional_options) else None
+            # 여러 음료를 제거해도 한 번의 변경으로 기록 (되돌리기 한 번에 모두 복구)
+            with order_manager.transaction():
+                # 제거 로직 실행
+                for i in range(len(drink_types)):
+                    drink = drink_types[i]
+                    quantity = quantities[i]
+                    size = sizes[i] if i < len(sizes) else None
+                    temperature = temperatures[i] if i < len(temperatures) else None
+                    additional_option = additional_options[i] if i < len(additional_options) else None
                 
-                try:
-                    if drink in order_manager.get_orders():
-                        logging.warning(f"Removing: {temperature, drink, size, quantity, additional_option}")
-                        order_manager.subtract_order(drink, quantity, temperature, size, additional_option)
-                    else:
-                        raise ValueError(f"{drink}은(는) 등록되지 않은 커피입니다! 다시 주문해주세요.")
-                except ValueError as e:
-                    dispatcher.utter_message(text=str(e))
+                    try:
+                        if drink in order_manager.get_orders():
+                            logger.debug("Removing: %s", (temperature, drink, size, quantity, additional_option))
+                            order_manager.subtract_order(drink, quantity, temperature, size, additional_option)
+                        else:
+                            raise ValueError(f"{drink}은(는) 등록되지 않은 커피입니다! 다시 주문해주세요.")
+                    except ValueError as e:
+                        dispatcher.utter_message(text=str(e))
 
             # 결과 메시지 생성
             if order_manager.get_orders():
@@ -1418,7 +1311,8 @@ class ActionSubtractFromOrders(Action):
             return []
             
         except Exception as e:
-            logging.exception("Error in action_subtract_from_order")
+            metrics.count_error("action", self.name())
+            logger.exception("Error in action_subtract_from_order")
             dispatcher.utter_message(text=f"주문 제거 중 오류가 발생했습니다: {str(e)}")
             return []
 
@@ -1427,12 +1321,15 @@ class ActionAddSubtract(Action):
     def name(self) -> Text:
         return "action_add_subtract"
 
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 최근 사용자 메시지에서 엔티티 가져오기
-            entities = sorted([entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"], key=lambda x: x['start'])
+            entities = prepared_messages.get(tracker).entities
 
             add_entities = []
             subtract_entities = []
@@ -1441,7 +1338,7 @@ class ActionAddSubtract(Action):
             # 추가하는 부분과 제거하는 부분을 나누기 위한 값을 저장.
             current_action = None
 
-            logging.warning(f"주문 다중처리 엔티티: {entities}")
+            logger.debug("주문 다중처리 엔티티: %s", entities)
             
             # 엔티티를 인덱스 값과 같이 가장 처음부터 순서대로 반복합니다.
             for i, entity in enumerate(entities):
@@ -1451,13 +1348,13 @@ class ActionAddSubtract(Action):
                     if current_order['drink_type']:
                         add_entities.append(current_order)
                     current_order = self._initialize_order() # 새로운 주문을 시작하기 위해 현재 주문을 초기화
-                    logging.warning(f"다중처리 추가 : {add_entities}")
+                    logger.debug("다중처리 추가 : %s", add_entities)
                 elif entity['entity'] == 'subtract':
                     current_action = 'subtract' # 제거하는 부분
                     if current_order['drink_type']:
                         subtract_entities.append(current_order)
                     current_order = self._initialize_order() # 새로운 주문을 시작하기 위해 현재 주문을 초기화
-                    logging.warning(f"다중처리 제거 : {subtract_entities}")
+                    logger.debug("다중처리 제거 : %s", subtract_entities)
                 else:
                     self._map_entity_to_order(entity, current_order)
 
@@ -1473,22 +1370,25 @@ class ActionAddSubtract(Action):
             self._set_default_temperature(subtract_entities)
 
             # 매핑된 데이터 출력
-            logging.warning(f"추가 엔티티: {add_entities}, 제거 엔티티: {subtract_entities}")
+            logger.debug("추가 엔티티: %s, 제거 엔티티: %s", add_entities, subtract_entities)
 
-            # 추가 엔티티가 있는 경우 처리
-            for order in add_entities:
-                self._process_add(order)
+            # 추가와 제거를 하나의 트랜잭션으로 묶어 추가 중에 실패하면 모두 되돌림
+            with order_manager.transaction():
+                # 추가 엔티티가 있는 경우 처리
+                for order in add_entities:
+                    self._process_add(order, order_manager)
 
-            # 제거 엔티티가 있는 경우 처리
-            for order in subtract_entities:
-                self._process_subtract(order, dispatcher)
+                # 제거 엔티티가 있는 경우 처리
+                for order in subtract_entities:
+                    self._process_subtract(order, dispatcher, order_manager)
 
             # 정리된 최종 주문 리스트를 생성
             confirmation_message = f"주문이 수정되었습니다. 현재 주문은 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
             dispatcher.utter_message(text=confirmation_message)
             return []
         except Exception as e:
-            logging.exception("Exception occurred in action_add_subtract")
+            metrics.count_error("action", self.name())
+            logger.exception("Exception occurred in action_add_subtract")
             dispatcher.utter_message(text=str(e))
             return []
 
@@ -1516,7 +1416,7 @@ class ActionAddSubtract(Action):
                 order['drink_type'] = standardize_drink_name(entity['value'])
         elif entity['entity'] == 'quantity':
             quantity = entity['value']
-            order['quantity'] = int(quantity) if quantity.isdigit() else korean_to_number(quantity)
+            order['quantity'] = korean_to_number(quantity)
         elif entity['entity'] == 'temperature':
             if order['temperature'] is None:
                 order['temperature'] = standardize_temperature(entity['value'])
@@ -1527,26 +1427,19 @@ class ActionAddSubtract(Action):
 
     # 온도 기본값 성정 메서드
     def _set_default_temperature(self, orders):
-        hot_drinks = ["허브티","복숭아티"]
-        ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]
+        catalog = menu.catalog
 
         for order in orders:
+            fixed_temperature = catalog.fixed_temperature(order['drink_type'])
             if order['temperature'] is None:
-                if order['drink_type'] in hot_drinks:
-                    order['temperature'] = "핫"
-                elif order['drink_type'] in ice_only_drinks:
-                    order['temperature'] = "아이스"
-                else:
-                    order['temperature'] = "핫"
-            else:
+                order['temperature'] = fixed_temperature or catalog.default_temperature
+            elif fixed_temperature is not None and order['temperature'] != fixed_temperature:
                 # 온도가 이미 설정되었고 온도가 고정된 음료의 온도가 잘못되었을 때
-                if order['drink_type'] in hot_drinks and order['temperature'] != "핫":
-                    raise ValueError(f"{order['drink_type']}는(은) 온도가 핫으로 고정된 음료입니다! 다시 주문해 주세요.")
-                elif order['drink_type'] in ice_only_drinks and order['temperature'] != "아이스":
-                    raise ValueError(f"{order['drink_type']}는(은) 온도가 아이스로 고정된 음료입니다! 다시 주문해 주세요.")
+                fixed_with_particle = "핫으로" if fixed_temperature == "핫" else f"{fixed_temperature}로"
+                raise ValueError(f"{order['drink_type']}는(은) 온도가 {fixed_with_particle} 고정된 음료입니다! 다시 주문해 주세요.")
 
     # 음료 제거 메서드
-    def _process_subtract(self, order, dispatcher):
+    def _process_subtract(self, order, dispatcher, order_manager):
         try:
             if order['drink_type'] in order_manager.get_orders():
                 order_manager.subtract_order(order['drink_type'], order['quantity'], order['temperature'], order['size'], ", ".join(order['additional_options']))
@@ -1556,7 +1449,7 @@ class ActionAddSubtract(Action):
             dispatcher.utter_message(text=str(e))
 
     # 음료 추가 메서드
-    def _process_add(self, order):
+    def _process_add(self, order, order_manager):
         order_manager.add_order(order['drink_type'], order['quantity'], order['temperature'], order['size'], ", ".join(order['additional_options']))
         
 # 주문 확인
@@ -1565,10 +1458,13 @@ class ActionOrderFinish(Action):
         return "action_order_finish"
 
     # 주문을 완료하는 액션 실행
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 주문 데이터 확인
             if not order_manager.get_orders():
                 # 주문이 없는 경우
@@ -1580,13 +1476,15 @@ class ActionOrderFinish(Action):
             dispatcher.utter_message(text=final_message)
             dispatcher.utter_message(response="utter_takeout")
 
-            # 주문 완료 후 저장된 커피 데이터 초기화
-            order_manager.clear_order()
+            # 주문 완료 후 저장된 커피 데이터 초기화하고 완료된 주문을 바로 기록
+            # (포장/매장 선택은 이 주문의 order_id로 나중에 따로 기록)
+            journal_completed_order(tracker.sender_id, order_manager.finish_order())
 
             return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 오류 발생 시 예외 처리
-            logging.exception("Exception occurred in action_order_finish")
+            logger.exception("Exception occurred in action_order_finish")
             dispatcher.utter_message(text="결제 중 오류가 발생했습니다. 다시 시도해주세요.")
             return []
 
@@ -1596,10 +1494,13 @@ class ActionCancelOrder(Action):
         return "action_cancel_order"
 
     # 주문을 취소하는 액션 실행
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 현재 주문된 음료 목록 가져오기
             current_orders = order_manager.get_orders()
 
@@ -1615,16 +1516,48 @@ class ActionCancelOrder(Action):
             dispatcher.utter_message(text=cancellation_message)
             return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 오류 발생 시 예외 처리
-            logging.exception("Exception occurred in action_cancel_order")
+            logger.exception("Exception occurred in action_cancel_order")
             dispatcher.utter_message(text="주문을 취소하는 중에 오류가 발생했습니다. 다시 시도해주세요.")
             return []
 
+# 마지막 주문 변경 되돌리기
+class ActionUndoOrder(Action):
+    def name(self) -> Text:
+        return "action_undo_order"
+
+    # 마지막 주문 변경을 되돌리는 액션 실행 (발화를 다시 해석하지 않고 변경 기록으로 복구)
+    @metrics.instrument_action
+    async def run(
+        self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
+    ) -> List[Dict[Text, Any]]:
+        try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
+            if not order_manager.undo():
+                # 되돌릴 변경이 없는 경우
+                dispatcher.utter_message(text="되돌릴 주문 변경이 없습니다.")
+                return []
+
+            if order_manager.get_orders():
+                dispatcher.utter_message(text=f"마지막 변경을 되돌렸습니다. 현재 주문은 {order_manager.get_order_summary()}입니다.")
+            else:
+                dispatcher.utter_message(text="마지막 변경을 되돌렸습니다. 장바구니가 비어 있습니다.")
+            return []
+        except Exception as e:
+            metrics.count_error("action", self.name())
+            # 오류 발생 시 예외 처리
+            logger.exception("Exception occurred in action_undo_order")
+            dispatcher.utter_message(text="주문 변경을 되돌리는 중에 오류가 발생했습니다. 다시 시도해주세요.")
+            return []
+
 # 커피 추천
 class ActionCoffeeRecommendation(Action):
     def name(self) -> Text:
         return "action_coffee_recommendation"
 
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
@@ -1652,25 +1585,29 @@ class ActionSelectCoffeeSize(Action):
         return None  # size 엔티티가 없을 경우 None 반환
 
     # 커피 사이즈를 변경하는 액션 실행
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
-            # 최근 사용자 메시지에서 엔터티를 가져오기
-            entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
-            user_text = tracker.latest_message.get("text", "")
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
+            # 최근 사용자 메시지에서 엔터티를 가져오기 (메시지마다 한 번만 정리)
+            message = prepared_messages.get(tracker)
+            entities = message.entities
+            user_text = message.text
 
             if "사이즈 업" in user_text:
                 raise KeyError("size up")
 
             # 엔티티를 위치 순서로 정렬하고 매핑
-            mapper = OrderMapper(entities, is_size_change=True)
+            mapper = mapped_orders.get(entities, is_size_change=True)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
 
             # 로그로 입력된 엔티티와 매핑된 데이터를 출력
-            logging.warning(f"커피 사이즈 변경 입력 내용 텍스트: {user_text}")
-            logging.warning(f"커피 사이즈 변경 입력 내용 엔티티: {entities}")
-            logging.warning(f"커피 사이즈 변경 매핑 데이터: {temperatures, drink_types, sizes, quantities, additional_options}")
+            logger.debug("커피 사이즈 변경 입력 내용 텍스트: %s", user_text)
+            logger.debug("커피 사이즈 변경 입력 내용 엔티티: %s", entities)
+            logger.debug("커피 사이즈 변경 매핑 데이터: %s", (temperatures, drink_types, sizes, quantities, additional_options))
 
             raise_missing_attribute_error(mapper.drinks)  # 음료 속성 검증
 
@@ -1686,24 +1623,28 @@ class ActionSelectCoffeeSize(Action):
             current_sizes = [entity["value"] for entity in entities if entity["entity"] == "size" and entity["value"] != new_size]
             current_size = current_sizes[-1] if current_sizes else "미디움"
 
-            for i in range(len(drink_types)):
-                drink = drink_types[i]  # 변경할 음료의 종류
-                quantity = quantities[i] if quantities[i] is not None else 1  # 변경할 음료의 수량
-                temperature = temperatures[i] if i < len(temperatures) else None  # 음료의 온도
-                additional_option = additional_options[i] if i < len(additional_options) else None  # 추가 옵션
-
-                # 로그로 변경할 음료의 정보 출력
-                logging.warning(f"온도: {temperature}, 변경 대상 음료: {drink}, 수량: {quantity}, 현재 사이즈: {current_size}, 새로운 사이즈: {new_size}")
-
-                try:
-                    # 현재 주문된 음료를 기존 사이즈로 제거
-                    order_manager.subtract_order(drink, quantity, temperature, current_size, additional_option)
-                    # 새로운 사이즈로 주문 추가
-                    order_manager.add_order(drink, quantity, temperature, new_size, additional_option)
-                except ValueError as e:
-                    # 오류 발생 시 사용자에게 메시지 전달
-                    dispatcher.utter_message(text=str(e))
-                    return []
+            # 여러 음료의 사이즈 변경을 한 번의 변경으로 기록
+            with order_manager.transaction():
+                for i in range(len(drink_types)):
+                    drink = drink_types[i]  # 변경할 음료의 종류
+                    quantity = quantities[i] if quantities[i] is not None else 1  # 변경할 음료의 수량
+                    temperature = temperatures[i] if i < len(temperatures) else None  # 음료의 온도
+                    additional_option = additional_options[i] if i < len(additional_options) else None  # 추가 옵션
+
+                    # 로그로 변경할 음료의 정보 출력
+                    logger.debug("온도: %s, 변경 대상 음료: %s, 수량: %s, 현재 사이즈: %s, 새로운 사이즈: %s", temperature, drink, quantity, current_size, new_size)
+
+                    try:
+                        # 제거 후 추가가 실패하면 이 음료의 제거도 되돌림
+                        with order_manager.transaction():
+                            # 현재 주문된 음료를 기존 사이즈로 제거
+                            order_manager.subtract_order(drink, quantity, temperature, current_size, additional_option)
+                            # 새로운 사이즈로 주문 추가
+                            order_manager.add_order(drink, quantity, temperature, new_size, additional_option)
+                    except ValueError as e:
+                        # 오류 발생 시 사용자에게 메시지 전달
+                        dispatcher.utter_message(text=str(e))
+                        return []
 
             # 사이즈 변경 완료 메시지 생성 및 사용자에게 전달
             confirmation_message = f"사이즈가 변경되었습니다. 주문하신 음료는 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
@@ -1712,6 +1653,7 @@ class ActionSelectCoffeeSize(Action):
             return []
         
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 예외 발생 시 사용자에게 메시지 전달
             dispatcher.utter_message(text=f"사이즈 변경 중 오류가 발생했습니다: {str(e)}")
             return []
@@ -1736,24 +1678,26 @@ class ActionSelectCoffeeTemperature(Action):
         return None  # temperature 엔티티가 없을 경우 None 반환
 
     # 커피 온도를 변경하는 액션 실행
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 최근 사용자 메시지에서 엔터티를 가져오기
-            entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
+            entities = prepared_messages.get(tracker).entities
             
             # 엔티티를 위치 순서로 정렬하고 매핑
-            mapper = OrderMapper(entities, is_temperature_change=True)
+            mapper = mapped_orders.get(entities, is_temperature_change=True)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
 
             # 로그로 입력된 엔티티와 매핑된 데이터를 출력
-            logging.warning(f"커피 온도 변경 입력 내용: {entities}")
-            logging.warning(f"커피 온도 변경 매핑 데이터: {temperatures, drink_types, sizes, quantities, additional_options}")
+            logger.debug("커피 온도 변경 입력 내용: %s", entities)
+            logger.debug("커피 온도 변경 매핑 데이터: %s", (temperatures, drink_types, sizes, quantities, additional_options))
 
             # 고정된 온도 음료의 온도 확인
-            hot_drinks = ["허브티"]
-            ice_only_drinks = ["토마토주스", "키위주스", "망고스무디", "딸기스무디", "레몬에이드", "복숭아아이스티"]
+            catalog = menu.catalog
 
             raise_missing_attribute_error(mapper.drinks)  # 음료 속성 검증
 
@@ -1764,34 +1708,38 @@ class ActionSelectCoffeeTemperature(Action):
                 dispatcher.utter_message(text="새로운 온도를 지정해주세요.")
                 return []  # 새로운 온도가 지정되지 않으면 메서드를 종료
 
-            for i in range(len(drink_types)):
-                drink = drink_types[i]  # 변경할 음료의 종류
-                quantity = quantities[i] if quantities[i] is not None else 1  # 변경할 음료의 수량
-                size = sizes[i] if i < len(sizes) else "미디움"  # 음료의 사이즈
-                additional_option = additional_options[i] if i < len(additional_options) else None  # 추가 옵션
-
-                # 기존 주문에서 현재 온도를 가져옴
-                current_temperature = temperatures[i] if i < len(temperatures) else None
-
-                # 음료가 핫 드링크인데 새로운 온도가 아이스라면 에러 발생
-                if drink in hot_drinks and new_temperature == "아이스":
-                    raise ValueError(f"{drink}는(은) 아이스로 변경할 수 없습니다.")
-                # 음료가 아이스 드링크인데 새로운 온도가 핫이라면 에러 발생
-                if drink in ice_only_drinks and new_temperature == "핫":
-                    raise ValueError(f"{drink}는(은) 핫으로 변경할 수 없습니다.")
-
-                # 로그로 변경할 음료의 정보 출력
-                logging.warning(f"변경 대상 음료: {drink}, 수량: {quantity}, 현재 온도: {current_temperature}, 새로운 온도: {new_temperature}, 사이즈: {size}, 추가 옵션: {additional_option}")
-
-                try:
-                    # 현재 주문된 음료를 기존 온도로 제거
-                    order_manager.subtract_order(drink, quantity, current_temperature, size, additional_option)
-                    # 새로운 온도로 주문 추가
-                    order_manager.add_order(drink, quantity, new_temperature, size, additional_option)
-                except ValueError as e:
-                    # 오류 발생 시 사용자에게 메시지 전달
-                    dispatcher.utter_message(text=str(e))
-                    return []
+            # 여러 음료의 온도 변경을 한 번의 변경으로 기록
+            with order_manager.transaction():
+                for i in range(len(drink_types)):
+                    drink = drink_types[i]  # 변경할 음료의 종류
+                    quantity = quantities[i] if quantities[i] is not None else 1  # 변경할 음료의 수량
+                    size = sizes[i] if i < len(sizes) else "미디움"  # 음료의 사이즈
+                    additional_option = additional_options[i] if i < len(additional_options) else None  # 추가 옵션
+
+                    # 기존 주문에서 현재 온도를 가져옴
+                    current_temperature = temperatures[i] if i < len(temperatures) else None
+
+                    # 음료가 핫 드링크인데 새로운 온도가 아이스라면 에러 발생
+                    if drink in catalog.hot_only and new_temperature == "아이스":
+                        raise ValueError(f"{drink}는(은) 아이스로 변경할 수 없습니다.")
+                    # 음료가 아이스 드링크인데 새로운 온도가 핫이라면 에러 발생
+                    if drink in catalog.ice_only and new_temperature == "핫":
+                        raise ValueError(f"{drink}는(은) 핫으로 변경할 수 없습니다.")
+
+                    # 로그로 변경할 음료의 정보 출력
+                    logger.debug("변경 대상 음료: %s, 수량: %s, 현재 온도: %s, 새로운 온도: %s, 사이즈: %s, 추가 옵션: %s", drink, quantity, current_temperature, new_temperature, size, additional_option)
+
+                    try:
+                        # 제거 후 추가가 실패하면 이 음료의 제거도 되돌림
+                        with order_manager.transaction():
+                            # 현재 주문된 음료를 기존 온도로 제거
+                            order_manager.subtract_order(drink, quantity, current_temperature, size, additional_option)
+                            # 새로운 온도로 주문 추가
+                            order_manager.add_order(drink, quantity, new_temperature, size, additional_option)
+                    except ValueError as e:
+                        # 오류 발생 시 사용자에게 메시지 전달
+                        dispatcher.utter_message(text=str(e))
+                        return []
 
             # 온도 변경 완료 메시지 생성 및 사용자에게 전달
             confirmation_message = f"온도를 변경하셨습니다. 주문하신 음료는 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
@@ -1799,6 +1747,7 @@ class ActionSelectCoffeeTemperature(Action):
 
             return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 예외 발생 시 사용자에게 메시지 전달
             dispatcher.utter_message(text=f"커피 온도 변경 중 오류가 발생했습니다: {str(e)}")
             return []
@@ -1810,41 +1759,46 @@ class  AdditionalOption(Action):
     def name(self) -> Text:
         return "action_add_additional_option"
     
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
-            entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
-            mapper = OrderMapper(entities)
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
+            entities = prepared_messages.get(tracker).entities
+            mapper = mapped_orders.get(entities)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
            
             # 디버깅을 위한 로그 출력
-            logging.warning(f"추가 옵션 추가 입력 내용: {entities}")
-            logging.warning(f"추가 옵션 추가 매핑 데이터: {temperatures, drink_types, sizes, quantities, additional_options}")     
+            logger.debug("추가 옵션 추가 입력 내용: %s", entities)
+            logger.debug("추가 옵션 추가 매핑 데이터: %s", (temperatures, drink_types, sizes, quantities, additional_options))     
 
             # 음료 속성 검증
             raise_missing_attribute_error(mapper.drinks)  
 
             # 매핑된 데이터를 사용하여 주문 정보 업데이트
-            for i in range(len(drink_types)):
-                drink = drink_types[i]
-                quantity = quantities[i] if quantities[i] is not None else 1
-                temperature = temperatures[i] if i < len(temperatures) else "핫"
-                size = sizes[i] if i < len(sizes) else "미디움"
-                add_additional_options = additional_options[i] if i < len(additional_options) else []
+            # 여러 음료의 옵션 변경을 하나의 트랜잭션으로 묶음
+            with order_manager.transaction():
+                for i in range(len(drink_types)):
+                    drink = drink_types[i]
+                    quantity = quantities[i] if quantities[i] is not None else 1
+                    temperature = temperatures[i] if i < len(temperatures) else "핫"
+                    size = sizes[i] if i < len(sizes) else "미디움"
+                    add_additional_options = additional_options[i] if i < len(additional_options) else []
 
-                current_option = []
+                    current_option = []
 
-                # 디버깅을 위한 로그 출력
-                logging.warning(f"현재 옵션: {current_option}")
-                logging.warning(f"추가 옵션: {add_additional_options}")
+                    # 디버깅을 위한 로그 출력
+                    logger.debug("현재 옵션: %s", current_option)
+                    logger.debug("추가 옵션: %s", add_additional_options)
                 
-                if add_additional_options:
-                    # add_additional_options 메서드를 호출하여 추가 옵션 추가
-                    order_manager.add_additional_options(drink, quantity, temperature, size, current_option, add_additional_options)
-                # else: 
-                #     # 추가라는 것을 받아들였을때 샷이 없을 경우에도 주문으로 처리 되도록
-                #     order_manager.add_order(drink, quantity, temperature, size, add_additional_options)
+                    if add_additional_options:
+                        # add_additional_options 메서드를 호출하여 추가 옵션 추가
+                        order_manager.add_additional_options(drink, quantity, temperature, size, current_option, add_additional_options)
+                    # else: 
+                    #     # 추가라는 것을 받아들였을때 샷이 없을 경우에도 주문으로 처리 되도록
+                    #     order_manager.add_order(drink, quantity, temperature, size, add_additional_options)
 
             # 최종 확인 메시지 생성 및 사용자에게 전달
             confirmation_message = f"말씀하신 옵션이 추가 되었습니다. 주문하신 음료는 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
@@ -1852,9 +1806,10 @@ class  AdditionalOption(Action):
             return []
 
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 예외 발생 시 사용자에게 메시지 전달
             dispatcher.utter_message(text="추가 옵션 추가 중 문제가 발생했습니다. 다시 시도해 주세요.")
-            logging.exception("Exception occurred in action_add_additional_option")
+            logger.exception("Exception occurred in action_add_additional_option")
             return []
                    
 # 커피 추가옵션 제거        
@@ -1862,20 +1817,23 @@ class ActionRemoveAdditionalOption(Action):
     def name(self) -> Text:
         return "action_remove_additional_option"
     
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
+            # 현재 대화(sender_id)의 주문 정보 가져오기
+            order_manager = order_sessions.get(tracker.sender_id)
             # 최신 사용자 메시지에서 DIETClassifier가 아닌 엔티티를 가져오기
-            entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
+            entities = prepared_messages.get(tracker).entities
             
             # 엔티티를 정렬하고 매핑
-            mapper = OrderMapper(entities)
+            mapper = mapped_orders.get(entities)
             temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
 
             # 디버깅을 위한 로그 출력
-            logging.warning(f"추가 옵션 제거 입력 내용: {entities}")
-            logging.warning(f"추가 옵션 제거 매핑 데이터: {temperatures, drink_types, sizes, quantities, additional_options}")
+            logger.debug("추가 옵션 제거 입력 내용: %s", entities)
+            logger.debug("추가 옵션 제거 매핑 데이터: %s", (temperatures, drink_types, sizes, quantities, additional_options))
 
             raise_missing_attribute_error(mapper.drinks)  # 음료 속성 검증
 
@@ -1885,27 +1843,29 @@ class ActionRemoveAdditionalOption(Action):
                 return []
 
             # 매핑된 데이터를 사용하여 주문 정보 업데이트
-            for i in range(len(drink_types)):
-                drink = drink_types[i]  # 음료 종류
-                quantity = quantities[i] if quantities[i] is not None else 1  # 잔 수
-                temperature = temperatures[i] if i < len(temperatures) else "핫"  # 온도
-                size = sizes[i] if i < len(sizes) else "미디움"  # 사이즈
-                current_additional_option = additional_options[i] if i < len(additional_options) else None  # 현재 추가 옵션
+            # 여러 음료의 옵션 변경을 하나의 트랜잭션으로 묶음
+            with order_manager.transaction():
+                for i in range(len(drink_types)):
+                    drink = drink_types[i]  # 음료 종류
+                    quantity = quantities[i] if quantities[i] is not None else 1  # 잔 수
+                    temperature = temperatures[i] if i < len(temperatures) else "핫"  # 온도
+                    size = sizes[i] if i < len(sizes) else "미디움"  # 사이즈
+                    current_additional_option = additional_options[i] if i < len(additional_options) else None  # 현재 추가 옵션
 
-                if current_additional_option:
-                    # 현재 옵션에서 중복된 옵션 제거
-                    current_options = list(set(current_additional_option.split(", ")))
-                    last_remove_option = current_options[-1]  # 마지막 옵션을 제거할 옵션으로 설정
+                    if current_additional_option:
+                        # 현재 옵션에서 중복된 옵션 제거
+                        current_options = list(set(current_additional_option.split(", ")))
+                        last_remove_option = current_options[-1]  # 마지막 옵션을 제거할 옵션으로 설정
 
-                    # 중복된 옵션이 있는지 확인 후 제거할 옵션 설정
-                    for option in reversed(current_options):
-                        if current_additional_option.count(option) > 1:
-                            last_remove_option = option
-                            break
+                        # 중복된 옵션이 있는지 확인 후 제거할 옵션 설정
+                        for option in reversed(current_options):
+                            if current_additional_option.count(option) > 1:
+                                last_remove_option = option
+                                break
 
-                    logging.warning(f"제거해야할 옵션 : {last_remove_option}, 현재 주문되어 있는 옵션 : {current_options}")
+                        logger.debug("제거해야할 옵션 : %s, 현재 주문되어 있는 옵션 : %s", last_remove_option, current_options)
 
-                    order_manager.remove_additional_options(drink, quantity, temperature, size, current_options, last_remove_option)
+                        order_manager.remove_additional_options(drink, quantity, temperature, size, current_options, last_remove_option)
 
             # 최종 확인 메시지 생성 및 사용자에게 전달
             confirmation_message = f"말씀하신 옵션이 제거 되었습니다. 주문하신 음료는 {order_manager.get_order_summary()}입니다. 다른 추가 옵션이 필요하신가요?"
@@ -1913,6 +1873,7 @@ class ActionRemoveAdditionalOption(Action):
 
             return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 예외 발생 시 사용자에게 메시지 전달
             dispatcher.utter_message(f"추가 옵션 제거 중 문제가 발생했습니다. 다시 시도해 주세요.")
             return []
@@ -1924,22 +1885,18 @@ class ActionTakeOut(Action):
         return "action_takeout"
 
     # 주문을 완료하는 액션 실행
+    @metrics.instrument_action
     async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         try:
-                # 최신 사용자 메시지에서 DIETClassifier가 아닌 엔티티를 가져오기
-                entities = [entity for entity in tracker.latest_message.get("entities", []) if entity.get("extractor") != "DIETClassifier"]
-                
-                manager = OrderManager()
+                # 최신 사용자 메시지에서 DIETClassifier가 아닌 엔티티를 위치 순으로 가져오기
+                message = prepared_messages.get(tracker)
                 # 테이크 엔티티 확인
-                logging.warning(f"테이크아웃 엔티티: {entities}")
-
-                # x 값을 기준으로 엔티티 정렬
-                sorted_entities = sorted(entities, key=lambda e: e.get("x", 0))
+                logger.debug("테이크아웃 엔티티: %s", message.entities)
 
                 # 'take' 엔티티 필터링
-                take_entities = [entity for entity in sorted_entities if entity.get("entity") == "take"]
+                take_entities = message.entities_of("take")
 
                 if take_entities:
                     if len(take_entities) == 1:
@@ -1952,13 +1909,27 @@ class ActionTakeOut(Action):
                     # take 엔티티 표준화
                     takeout = standardize_take(last_take_value)
 
+                    # 완료된 주문의 포장/매장 선택 기록
+                    order_manager = order_sessions.get(tracker.sender_id)
+                    journal_takeout(tracker.sender_id, order_manager.pop_completed_order(), takeout)
+
                     # 최종 주문 메시지 생성
                     final_message = f"{takeout} 주문이 완료되었습니다. 결제는 하단의 카드리더기로 결제해 주시기 바랍니다. 감사합니다."
                 # 메시지 출력
                 dispatcher.utter_message(text=final_message)
                 return []
         except Exception as e:
+            metrics.count_error("action", self.name())
             # 오류 발생 시 예외 처리
-            logging.exception("Exception occurred in action_order_finish")
+            logger.exception("Exception occurred in action_order_finish")
             dispatcher.utter_message(text="결제 중 오류가 발생했습니다. 다시 시도해주세요.")
             return []
+
+
+# METRICS_PORT(/metrics HTTP) 또는 METRICS_FILE(Prometheus 텍스트 파일) 환경 변수가 있으면 지표 내보내기 시작
+metrics.start_exporters_from_env()
+
+# LEXICON_RELOAD_INTERVAL초마다 사전과 메뉴 파일이 바뀌었는지 확인해 서버 재시작 없이 다시 읽음 (0이면 확인하지 않음)
+_reload_interval = float(os.getenv("LEXICON_RELOAD_INTERVAL", "5"))
+if _reload_interval > 0:
+    start_reload_watcher([lexicons, menu], interval=_reload_interval)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""커스텀 액션 재생 벤치마크
+
+data/stories.yml의 대화 흐름과 data/nlu.yml의 예문을 실제 액션 클래스에 그대로 재생하고
+액션별 처리량과 지연 시간(p50/p95/p99)을 측정한다.
+
+프로젝트 루트에서 실행:
+    python -m actions.benchmark_actions --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import replay
+
+
+class ActionBenchmark:
+    def __init__(self, repeat=10, include_stories=True, include_nlu=True):
+        self.repeat = repeat  # 전체 시나리오 반복 횟수
+        self.include_stories = include_stories
+        self.include_nlu = include_nlu
+        self.actions = replay.load_actions()
+        self.stories = replay.load_stories()
+        self.intent_actions = replay.build_intent_action_map(replay.load_rules(), self.stories)
+        self.nlu_examples = replay.load_nlu_examples()
+        self.samples = {}  # 액션 이름 -> 실행 시간(초) 리스트
+        self.errors = {}  # 액션 이름 -> 실패 횟수 (예외 또는 액션이 처리한 오류)
+        self.skipped = set()  # 커스텀 액션이 아니라 실행하지 않은 액션 (utter_* 등)
+        self.wall_time = 0.0
+
+    # 액션 하나를 실행하고 실행 시간을 기록하는 메서드
+    async def _run_action(self, name, tracker):
+        action = self.actions.get(name)
+        if action is None:
+            self.skipped.add(name)
+            return
+        dispatcher = CollectingDispatcher()
+        start = time.perf_counter()
+        _, failed = await replay.run_action(action, dispatcher, tracker)
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    # 스토리 하나를 새 대화(sender_id)로 처음부터 재생하는 메서드
+    async def _replay_story(self, story, sender_id):
+        for message, action_names in replay.story_turns(story):
+            tracker = replay.ReplayTracker(sender_id, message)
+            for name in action_names:
+                await self._run_action(name, tracker)
+
+    # NLU 예문을 해당 인텐트의 액션으로 재생하는 메서드
+    async def _replay_nlu(self, sender_id):
+        for intent, text, entities in self.nlu_examples:
+            name = self.intent_actions.get(intent)
+            if name is None:
+                continue
+            # 메시지 준비 단계가 엔티티를 수정할 수 없는 사본으로 만들어 쓰므로 예문의 엔티티를 그대로 전달
+            # (메시지마다 message_id가 새로 생기므로 반복 재생해도 준비 단계의 캐시를 재사용하지 않음)
+            message = replay.make_message(intent, text, entities)
+            tracker = replay.ReplayTracker(sender_id, message)
+            await self._run_action(name, tracker)
+
+    async def _run(self):
+        for iteration in range(self.repeat):
+            if self.include_stories:
+                for index, story in enumerate(self.stories):
+                    await self._replay_story(story, f"bench-story-{iteration}-{index}")
+            if self.include_nlu:
+                await self._replay_nlu(f"bench-nlu-{iteration}")
+
+    # 벤치마크 실행 메서드
+    def run(self):
+        start = time.perf_counter()
+        asyncio.run(self._run())
+        self.wall_time = time.perf_counter() - start
+        return self.report()
+
+    # 액션별 결과 요약 메서드
+    def report(self):
+        report = {
+            "metadata": {
+                "benchmark_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "repeat": self.repeat,
+                "wall_time_s": self.wall_time,
+                "skipped_actions": sorted(self.skipped),
+            },
+            "actions": {},
+        }
+        for name in sorted(self.samples):
+            samples = sorted(self.samples[name])
+            total = sum(samples)
+            report["actions"][name] = {
+                "calls": len(samples),
+                "errors": self.errors.get(name, 0),
+                "throughput_per_s": len(samples) / total if total else 0.0,
+                "mean_ms": total / len(samples) * 1000,
+                "p50_ms": replay.percentile(samples, 0.50) * 1000,
+                "p95_ms": replay.percentile(samples, 0.95) * 1000,
+                "p99_ms": replay.percentile(samples, 0.99) * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+        return report
+
+
+# 결과 표 출력 메서드
+def print_report(report):
+    print(f"{'action':<36}{'calls':>8}{'errors':>8}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report["actions"].items():
+        print(f"{name:<36}{stats['calls']:>8}{stats['errors']:>8}{stats['throughput_per_s']:>12.1f}"
+              f"{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+    print(f"\n전체 실행 시간: {report['metadata']['wall_time_s']:.2f}s")
+    if report["metadata"]["skipped_actions"]:
+        print(f"실행하지 않은 액션: {', '.join(report['metadata']['skipped_actions'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="커스텀 액션 재생 벤치마크")
+    parser.add_argument("--repeat", type=int, default=10, help="전체 시나리오 반복 횟수")
+    parser.add_argument("--source", choices=["stories", "nlu", "both"], default="both", help="재생할 데이터")
+    parser.add_argument("--output", help="결과를 저장할 JSON 파일 경로")
+    parser.add_argument("--with-logging", action="store_true", help="액션 로그 출력을 끄지 않고 측정")
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.CRITICAL)
+
+    benchmark = ActionBenchmark(
+        repeat=args.repeat,
+        include_stories=args.source in ("stories", "both"),
+        include_nlu=args.source in ("nlu", "both"),
+    )
+    report = benchmark.run()
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장 위치: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
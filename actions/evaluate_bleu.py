@@ -1,29 +1,112 @@
 #!/usr/bin/env python3
 import os
+import sys
 import json
 import time
+import argparse
+import hashlib
+import itertools
 import yaml
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from datetime import datetime
 
+# python actions/evaluate_bleu.py로 직접 실행하면 sys.path[0]이 actions/ 디렉토리라서
+# actions가 패키지가 아닌 actions.py로 잡히므로 프로젝트 루트로 바꿔 준다 (python -m actions.evaluate_bleu는 그대로)
+if not __package__:
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from actions.histogram import StreamingHistogram
+from actions.jsonl_writer import JsonlWriter, iter_jsonl
+
+# 요약에 표시할 분포 구간 경계
+RESPONSE_TIME_BOUNDARIES_MS = [0.01, 0.1, 1, 10, 100, 1000]
+BLEU_BOUNDARIES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+# 이보다 테스트 케이스가 적으면 프로세스 풀을 띄우는 비용이 더 커서 단일 프로세스로 채점
+MIN_PARALLEL_CASES = 1000
+
+# 평가 결과 기본 디렉토리
+RESULTS_BASE_DIR = "results/evaluations"
+
+# 케이스별 결과를 한 줄씩 기록하는 파일
+RESULTS_FILE = "results.jsonl"
+
+# 스토리 내용 해시 -> 이전 점수 색인 파일 (실행마다 공유하므로 기본 디렉토리에 저장)
+STORY_INDEX_FILE = "story_index.json"
+
+# 테스트 케이스 (cached_bleu가 있으면 이전 점수를 그대로 사용하고 tokens는 None)
+TestCase = namedtuple("TestCase", ["case_id", "story_idx", "story_hash", "step_no", "response",
+                                   "response_time", "tokens", "cached_bleu"])
+
+def story_hash(story: Dict) -> str:
+   """스토리 내용 해시 (키 순서와 관계없이 같은 내용이면 같은 값)"""
+   content = json.dumps(story, ensure_ascii=False, sort_keys=True, default=str)
+   return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def tokenize_response(bot_response: str):
+   """응답을 한 번만 분리해 (참조 문장들, 후보 문장) 토큰으로 변환"""
+   tokens = bot_response.split()
+   # 치환할 단어에 공백이 없으므로 토큰별 치환은 문장 치환 후 분리한 것과 같다
+   references = [
+       tokens,
+       [token.replace("핫", "따뜻한") for token in tokens],
+       [token.replace("아이스", "차가운") for token in tokens]
+   ]
+   return references, tokens
+
+def bleu_score(references: List[List[str]], hypothesis: List[str]) -> float:
+   """BLEU 점수 계산"""
+   return sentence_bleu(references, hypothesis,
+                        weights=(0.25, 0.25, 0.25, 0.25),
+                        smoothing_function=SmoothingFunction().method1)
+
+def _score_chunk(chunk: List) -> List[float]:
+   """작업 프로세스에서 토큰 묶음의 BLEU 점수 계산"""
+   return [bleu_score(references, hypothesis) for references, hypothesis in chunk]
+
 class RasaEvaluator:
-   def __init__(self):
-       self.results_dir = self._create_results_directory()
+   def __init__(self, workers: int = 1, chunk_size: int = 256, resume_dir: str = None,
+                flush_every: int = 100, flush_interval: float = 1.0, full: bool = False):
+       self.workers = max(1, workers)  # BLEU 채점 프로세스 수 (1이면 단일 프로세스)
+       self.full = full  # True면 색인을 무시하고 모든 스토리를 다시 채점
+       self.chunk_size = max(1, chunk_size)  # 작업 프로세스에 한 번에 넘기는 케이스 수
+       self.flush_every = flush_every  # 결과 파일에 내보내는 레코드 수 간격
+       self.flush_interval = flush_interval  # 결과 파일에 내보내는 최대 시간 간격(초)
+       self.results_dir = self._create_results_directory(resume_dir)
+       self.results_path = os.path.join(self.results_dir, RESULTS_FILE)
        self.test_data = self._load_test_data()
-       self.results = []
+       # 테스트 케이스 수와 관계없이 일정한 메모리로 요약 통계를 누적
+       self.response_time_histogram = StreamingHistogram(lowest=0.001, highest=3600000.0)
+       self.bleu_histogram = StreamingHistogram(lowest=0.0001, highest=1.0)
+       self.time_score_total = 0
+       self.completed_cases = set()  # 이전 실행에서 이미 기록된 케이스 ID (재개 모드)
+       self.story_index_path = os.path.join(RESULTS_BASE_DIR, STORY_INDEX_FILE)
+       self.story_index = {} if full else self._load_story_index()  # 이전 실행까지의 색인
+       self.next_story_index = {}  # 이번 실행의 스토리로 새로 만드는 색인
        self.evaluation_results = {
            "metadata": {
                "evaluation_time": datetime.now().strftime("%Y-%m-%=d %H:%M:%S"),
-               "total_test_cases": 0
+               "total_test_cases": 0,
+               "results_file": RESULTS_FILE,
+               "resumed_test_cases": 0,
+               "cached_test_cases": 0,
+               "scored_test_cases": 0
            },
-           "results": [],
            "summary": {}
        }
+       if resume_dir:
+           self._load_previous_results()
 
-   def _create_results_directory(self) -> str:
-       """결과 저장을 위한 디렉토리 생성"""
-       base_dir = "results/evaluations"
+   def _create_results_directory(self, resume_dir: str = None) -> str:
+       """결과 저장을 위한 디렉토리 생성 (재개 모드면 기존 디렉토리 사용)"""
+       if resume_dir:
+           if not os.path.isdir(resume_dir):
+               raise FileNotFoundError(f"재개할 결과 디렉토리가 없습니다: {resume_dir}")
+           return resume_dir
+       base_dir = RESULTS_BASE_DIR
        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
        results_dir = os.path.join(base_dir, timestamp)
        os.makedirs(results_dir, exist_ok=True)
@@ -44,30 +127,48 @@ class RasaEvaluator:
            self._save_json("error_log.json", error_msg)
            return {"stories": []}
 
-   def _calculate_scores(self, bot_response: str, response_time: float) -> Dict:
-       """응답에 대한 점수 계산"""
+   def _calculate_scores(self, bot_response: str, response_time: float, bleu: float = None) -> Dict:
+       """응답에 대한 점수 계산 (bleu가 주어지면 BLEU 계산 생략)"""
        # 응답 시간 점수 (0-10)
        time_score = max(0, 10 - int(response_time / 100))
        
        # BLEU 점수 계산
-       references = [
-           bot_response.split(),
-           bot_response.replace("핫", "따뜻한").split(),
-           bot_response.replace("아이스", "차가운").split()
-       ]
-
-       smoothing = SmoothingFunction().method1
-       
-       bleu_score = sentence_bleu(references, bot_response.split(), 
-                                weights=(0.25, 0.25, 0.25, 0.25),
-                                smoothing_function=smoothing)
+       if bleu is None:
+           bleu = bleu_score(*tokenize_response(bot_response))
        
        return {
            "time_score": time_score,
-           "bleu_score": bleu_score,
+           "bleu_score": bleu,
            "response_time_ms": response_time
        }
 
+   def _load_story_index(self) -> Dict:
+       """스토리 해시 색인 로드 (없거나 읽을 수 없으면 빈 색인)"""
+       try:
+           with open(self.story_index_path, 'r', encoding='utf-8') as f:
+               return json.load(f).get("stories", {})
+       except (OSError, ValueError):
+           return {}
+
+   def _save_story_index(self):
+       """스토리 해시 색인 저장 (임시 파일에 쓴 뒤 교체하므로 중간에 중단되어도 이전 색인이 남음)"""
+       os.makedirs(os.path.dirname(self.story_index_path), exist_ok=True)
+       tmp_path = self.story_index_path + ".tmp"
+       with open(tmp_path, 'w', encoding='utf-8') as f:
+           json.dump({"updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "stories": self.next_story_index},
+                     f, ensure_ascii=False)
+       os.replace(tmp_path, self.story_index_path)
+
+   def _index_case(self, story_key: str, step_no: int, scores: Dict):
+       """이번 실행 색인에 케이스 점수 기록"""
+       if story_key is None:
+           return
+       cases = self.next_story_index.setdefault(story_key, {"cases": {}})["cases"]
+       cases[str(step_no)] = {
+           "bleu_score": scores["bleu_score"],
+           "response_time_ms": scores["response_time_ms"]
+       }
+
    def _save_json(self, filename: str, data: Dict):
        """JSON 파일 저장"""
        file_path = os.path.join(self.results_dir, filename)
@@ -78,82 +179,166 @@ class RasaEvaluator:
        """평가 실행"""
        print(f"평가 시작: {self.evaluation_results['metadata']['evaluation_time']}")
        
-       for idx, story in enumerate(self.test_data.get('stories', []), 1):
-           for step in story.get('steps', []):
-               if 'bot' not in step:
-                   continue
-                   
-               # 응답 시간 측정
-               start_time = time.time()
-               bot_response = step['bot'].strip()
-               response_time = (time.time() - start_time) * 1000
-               
+       if self.completed_cases:
+           print(f"이전 결과 {len(self.completed_cases)}건을 건너뜁니다.")
+       
+       metadata = self.evaluation_results["metadata"]
+       # 결과는 메모리에 모으지 않고 나오는 대로 결과 파일에 기록
+       with JsonlWriter(self.results_path, self.flush_every, self.flush_interval) as writer:
+           for case, bleu in self._scored_cases():
                # 점수 계산
-               scores = self._calculate_scores(bot_response, response_time)
+               scores = self._calculate_scores(case.response, case.response_time, bleu)
+               cached = case.cached_bleu is not None
                
                # 결과 저장
                result = {
-                   "response": bot_response,
+                   "case_id": case.case_id,
+                   "story_hash": case.story_hash,
+                   "response": case.response,
                    "metrics": scores,
+                   "cached": cached,
                    "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3]
                }
                
-               self.results.append({
-                   "response": bot_response,
-                   "time_score": scores["time_score"],
-                   "bleu_score": scores["bleu_score"],
-                   "response_time_ms": scores["response_time_ms"]
-               })
-               
-               self.evaluation_results["results"].append(result)
+               self._record_scores(scores)
+               self._index_case(case.story_hash, case.step_no, scores)
+               writer.write(result)
+               metadata["cached_test_cases" if cached else "scored_test_cases"] += 1
                
                # 진행상황 출력
-               print(f"테스트 케이스 {idx} 평가 중: BLEU={scores['bleu_score']:.4f}, 응답시간={scores['response_time_ms']:.2f}ms")
+               if not cached:
+                   print(f"테스트 케이스 {case.story_idx} 평가 중: BLEU={scores['bleu_score']:.4f}, 응답시간={scores['response_time_ms']:.2f}ms")
 
-       self.evaluation_results["metadata"]["total_test_cases"] = len(self.results)
+       print(f"다시 채점: {metadata['scored_test_cases']}건, 이전 점수 사용: {metadata['cached_test_cases']}건")
+       self._save_story_index()
+       metadata["total_test_cases"] = self.response_time_histogram.count
        self._calculate_summary()
 
+   def _load_previous_results(self):
+       """이전 실행의 결과 파일을 읽어 요약 통계에 반영하고 완료된 케이스 ID 기록"""
+       for result in iter_jsonl(self.results_path):
+           case_id = result.get("case_id")
+           if case_id is None or case_id in self.completed_cases:
+               continue
+           self.completed_cases.add(case_id)
+           self._record_scores(result["metrics"])
+           step_no = case_id.rsplit("-", 1)[-1]
+           self._index_case(result.get("story_hash"), step_no, result["metrics"])
+       self.evaluation_results["metadata"]["resumed_test_cases"] = len(self.completed_cases)
+
+   def _iter_cases(self):
+       """테스트 케이스를 순서대로 생성 (내용이 바뀌지 않은 스토리는 이전 점수를 붙여서 생성)"""
+       for idx, story in enumerate(self.test_data.get('stories', []), 1):
+           key = story_hash(story)
+           cached_cases = self.story_index.get(key, {}).get("cases", {})
+           for step_no, step in enumerate(story.get('steps', [])):
+               if 'bot' not in step:
+                   continue
+               # 케이스 ID: 스토리 번호-스텝 번호
+               case_id = f"{idx}-{step_no}"
+               if case_id in self.completed_cases:
+                   continue
+               
+               cached = cached_cases.get(str(step_no))
+               if cached is not None:
+                   yield TestCase(case_id, idx, key, step_no, step['bot'].strip(),
+                                  cached["response_time_ms"], None, cached["bleu_score"])
+                   continue
+                   
+               # 응답 시간 측정
+               start_time = time.time()
+               bot_response = step['bot'].strip()
+               response_time = (time.time() - start_time) * 1000
+               
+               yield TestCase(case_id, idx, key, step_no, bot_response, response_time,
+                              tokenize_response(bot_response), None)
+
+   def _count_cases(self) -> int:
+       """채점할 테스트 케이스 수 (재개 모드로 건너뛰는 케이스와 이전 점수를 쓰는 스토리 제외)"""
+       return sum(
+           1
+           for story in self.test_data.get('stories', [])
+           if story_hash(story) not in self.story_index
+           for step in story.get('steps', [])
+           if 'bot' in step
+       ) - len(self.completed_cases)
+
+   def _scored_cases(self):
+       """(테스트 케이스, BLEU 점수)를 테스트 케이스 순서대로 생성"""
+       cases = self._iter_cases()
+       if self.workers == 1 or self._count_cases() < MIN_PARALLEL_CASES:
+           for case in cases:
+               if case.cached_bleu is not None:
+                   yield case, case.cached_bleu
+               else:
+                   yield case, bleu_score(*case.tokens)
+           return
+           
+       # 케이스를 묶음 단위로 작업 프로세스에 나눠 채점하고, map이 입력 순서대로 돌려주므로 결과 순서가 유지된다
+       # 한 번에 (프로세스 수 x 4) 묶음씩만 읽어 메모리 사용량을 제한
+       window = self.workers * self.chunk_size * 4
+       with ProcessPoolExecutor(max_workers=self.workers) as executor:
+           while True:
+               batch = list(itertools.islice(cases, window))
+               if not batch:
+                   break
+               pending = [case.tokens for case in batch if case.cached_bleu is None]
+               chunks = [
+                   pending[start:start + self.chunk_size]
+                   for start in range(0, len(pending), self.chunk_size)
+               ]
+               scores = itertools.chain.from_iterable(executor.map(_score_chunk, chunks))
+               for case in batch:
+                   if case.cached_bleu is not None:
+                       yield case, case.cached_bleu
+                   else:
+                       yield case, next(scores)
+
+   def _record_scores(self, scores: Dict):
+       """점수를 요약 통계에 누적"""
+       self.response_time_histogram.record(scores["response_time_ms"])
+       self.bleu_histogram.record(scores["bleu_score"])
+       self.time_score_total += scores["time_score"]
+
    def _calculate_summary(self):
        """결과 요약 계산"""
-       if not self.results:
+       total = self.response_time_histogram.count
+       if not total:
            print("평가 결과가 없습니다.")
            return
            
-       # 평균 계산
-       avg_time = sum(r['response_time_ms'] for r in self.results) / len(self.results)
-       avg_time_score = sum(r['time_score'] for r in self.results) / len(self.results)
-       avg_bleu = sum(r['bleu_score'] for r in self.results) / len(self.results)
+       response_time = self.response_time_histogram.summary(RESPONSE_TIME_BOUNDARIES_MS)
+       bleu = self.bleu_histogram.summary(BLEU_BOUNDARIES)
        
        self.evaluation_results["summary"] = {
-           "total_responses": len(self.results),
-           "average_response_time": avg_time,
-           "average_time_score": avg_time_score,
-           "average_bleu_score": avg_bleu,
-           "detailed_results": self.results,
-           "best_bleu_score": max(r['bleu_score'] for r in self.results),
-           "worst_bleu_score": min(r['bleu_score'] for r in self.results),
-           "fastest_response": min(r['response_time_ms'] for r in self.results),
-           "slowest_response": max(r['response_time_ms'] for r in self.results)
+           "total_responses": total,
+           "average_response_time": response_time["mean"],
+           "average_time_score": self.time_score_total / total,
+           "average_bleu_score": bleu["mean"],
+           "best_bleu_score": bleu["max"],
+           "worst_bleu_score": bleu["min"],
+           "fastest_response": response_time["min"],
+           "slowest_response": response_time["max"],
+           "response_time_ms": response_time,
+           "bleu_score": bleu
        }
 
    def save_results(self):
        """최종 결과 저장"""
-       if not self.results:
+       if not self.response_time_histogram.count:
            print("저장할 평가 결과가 없습니다.")
            return
            
-       # 전체 결과 저장
+       # 메타데이터와 요약 저장 (케이스별 결과는 평가 중에 results.jsonl에 기록됨)
        self._save_json("complete_evaluation.json", self.evaluation_results)
        
        # 요약 결과만 따로 저장
        self._save_json("summary.json", self.evaluation_results["summary"])
        
-       # 상세 결과 저장
-       self._save_json("detailed_results.json", self.results)
-       
        # 결과 위치 및 요약 출력
        print(f"\n평가 완료!")
        print(f"결과 저장 위치: {self.results_dir}")
+       print(f"케이스별 결과: {self.results_path}")
        print("\n=== 평가 요약 ===")
        summary = self.evaluation_results["summary"]
        print(f"총 테스트 케이스: {summary['total_responses']}")
@@ -164,10 +349,24 @@ class RasaEvaluator:
        print(f"최저 BLEU 점수: {summary['worst_bleu_score']:.4f}")
        print(f"가장 빠른 응답: {summary['fastest_response']:.2f}ms")
        print(f"가장 느린 응답: {summary['slowest_response']:.2f}ms")
+       for name, unit, stats in (("응답 시간", "ms", summary["response_time_ms"]), ("BLEU 점수", "", summary["bleu_score"])):
+           print(f"{name} 백분위: p50={stats['p50']:.4f}{unit}, p90={stats['p90']:.4f}{unit}, "
+                 f"p99={stats['p99']:.4f}{unit}, p999={stats['p999']:.4f}{unit}")
+           print(f"{name} 분포: " + ", ".join(f"{label}: {count}" for label, count in stats["distribution"].items()))
 
 def main():
+   parser = argparse.ArgumentParser(description="Rasa 응답 BLEU 평가")
+   parser.add_argument("--workers", type=int, default=1, help="BLEU 채점 프로세스 수 (1이면 단일 프로세스)")
+   parser.add_argument("--chunk-size", type=int, default=256, help="작업 프로세스에 한 번에 넘기는 케이스 수")
+   parser.add_argument("--resume", metavar="DIR", help="중단된 평가의 결과 디렉토리 (이미 기록된 케이스는 건너뜀)")
+   parser.add_argument("--flush-every", type=int, default=100, help="결과 파일에 내보내는 레코드 수 간격")
+   parser.add_argument("--flush-interval", type=float, default=1.0, help="결과 파일에 내보내는 최대 시간 간격(초)")
+   parser.add_argument("--full", action="store_true", help="이전 점수 색인을 무시하고 모든 스토리를 다시 채점")
+   args = parser.parse_args()
+   
    try:
-       evaluator = RasaEvaluator()
+       evaluator = RasaEvaluator(workers=args.workers, chunk_size=args.chunk_size, resume_dir=args.resume,
+                                 flush_every=args.flush_every, flush_interval=args.flush_interval, full=args.full)
        evaluator.evaluate()
        evaluator.save_results()
    except Exception as e:
@@ -0,0 +1,162 @@
+from functools import lru_cache
+
+# 한글 음절을 자모로 분해하기 위한 표 (초성 19개, 중성 21개, 종성 27개 + 받침 없음)
+CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+JUNGSEONG = "ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ"
+JONGSEONG = ("", "ㄱ", "ㄲ", "ㄳ", "ㄴ", "ㄵ", "ㄶ", "ㄷ", "ㄹ", "ㄺ", "ㄻ", "ㄼ", "ㄽ", "ㄾ", "ㄿ", "ㅀ",
+             "ㅁ", "ㅂ", "ㅄ", "ㅅ", "ㅆ", "ㅇ", "ㅈ", "ㅊ", "ㅋ", "ㅌ", "ㅍ", "ㅎ")
+HANGUL_BASE = 0xAC00
+HANGUL_LAST = 0xD7A3
+
+
+# 한글 음절 하나를 자모 문자열로 분해하는 메서드 (한글이 아니면 그대로 반환)
+@lru_cache(maxsize=4096)
+def _decompose_syllable(char):
+    code = ord(char)
+    if not HANGUL_BASE <= code <= HANGUL_LAST:
+        return char
+    index = code - HANGUL_BASE
+    return CHOSEONG[index // 588] + JUNGSEONG[(index % 588) // 28] + JONGSEONG[index % 28]
+
+
+# 문자열 전체를 자모 단위로 분해하는 메서드 ("카푸치노" -> "ㅋㅏㅍㅜㅊㅣㄴㅗ")
+def decompose_jamo(text):
+    return "".join(_decompose_syllable(char) for char in text)
+
+
+# 패턴 문자열의 글자별 위치 비트 계산 메서드 (글자 -> 패턴에서 그 글자가 나오는 위치의 비트)
+def pattern_masks(pattern):
+    masks = {}
+    for index, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << index)
+    return masks
+
+
+# 미리 계산한 패턴 비트와 문자열 사이의 편집 거리 계산 메서드
+# Myers/Hyyrö 비트 병렬 알고리즘으로 패턴의 모든 위치를 정수 하나로 한 번에 계산한다
+def _bit_parallel_distance(masks, pattern_length, text):
+    if not pattern_length:
+        return len(text)
+    mask = (1 << pattern_length) - 1
+    last_bit = 1 << (pattern_length - 1)
+    positive, negative, distance = mask, 0, pattern_length
+    for char in text:
+        equal = masks.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        plus = negative | ~(horizontal | positive)
+        minus = positive & horizontal
+        if plus & last_bit:
+            distance += 1
+        elif minus & last_bit:
+            distance -= 1
+        plus = (plus << 1) | 1
+        minus <<= 1
+        positive = (minus | ~(vertical | plus)) & mask
+        negative = plus & vertical
+    return distance
+
+
+# 두 문자열의 편집 거리(Levenshtein) 계산 메서드
+def edit_distance(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    return _bit_parallel_distance(pattern_masks(b), len(b), a)
+
+
+# 편집 거리 기반 BK-트리 (거리 제한 안의 단어만 탐색)
+class BKTree:
+    def __init__(self, words=()):
+        self.root = None  # (단어, 단어의 패턴 비트, {거리: 자식 노드})
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    # 단어 추가 메서드
+    def add(self, word):
+        new_node = (word, pattern_masks(word), {})
+        if self.root is None:
+            self.root = new_node
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = _bit_parallel_distance(node[1], len(node[0]), word)
+            if distance == 0:
+                return  # 이미 있는 단어
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = new_node
+                self.size += 1
+                return
+            node = child
+
+    # max_distance 이내의 단어를 (거리, 단어) 리스트로 반환하는 메서드
+    def search(self, word, max_distance):
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            node_word, node_masks, children = stack.pop()
+            # 노드마다 미리 계산해 둔 패턴 비트를 사용하므로 검색할 때는 입력만 한 번 훑는다
+            distance = _bit_parallel_distance(node_masks, len(node_word), word)
+            if distance <= max_distance:
+                results.append((distance, node_word))
+            # 삼각 부등식에 의해 |d - k| <= max_distance 인 자식만 탐색하면 된다
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return results
+
+    def __len__(self):
+        return self.size
+
+
+# 음성 인식 오타를 가장 가까운 메뉴 이름으로 바로잡는 퍼지 검색기
+# vocabulary는 {표면형: 표준 이름}이며, 자모 단위 편집 거리로 유사도를 계산한다
+class FuzzyResolver:
+    def __init__(self, vocabulary, min_confidence=0.75, min_jamo_length=6, cache_size=4096):
+        self.min_confidence = min_confidence  # 1 - (편집 거리 / 자모 길이)의 최솟값
+        self.min_jamo_length = min_jamo_length  # 너무 짧은 입력은 오인식 위험이 커서 보정하지 않음
+        self.canonical_by_jamo = {}  # 자모 문자열 -> 표준 이름
+        for surface, canonical in vocabulary.items():
+            self.canonical_by_jamo.setdefault(decompose_jamo(surface), canonical)
+        self.tree = BKTree(self.canonical_by_jamo)
+        # 같은 오타가 반복해서 들어오므로 결과를 캐시
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    # 입력과 가장 가까운 표준 이름 반환 메서드 (확신할 수 없으면 None)
+    def _resolve(self, name):
+        jamo = decompose_jamo(name)
+        if len(jamo) < self.min_jamo_length:
+            return None
+        exact = self.canonical_by_jamo.get(jamo)
+        if exact is not None:
+            return exact
+
+        max_distance = int(len(jamo) * (1 - self.min_confidence))
+        if max_distance < 1:
+            return None
+
+        best_distance = None
+        best_canonicals = set()
+        for distance, candidate in self.tree.search(jamo, max_distance):
+            # 길이가 긴 쪽 기준으로 신뢰도 계산
+            if 1 - distance / max(len(jamo), len(candidate)) < self.min_confidence:
+                continue
+            if best_distance is None or distance < best_distance:
+                best_distance = distance
+                best_canonicals = {self.canonical_by_jamo[candidate]}
+            elif distance == best_distance:
+                best_canonicals.add(self.canonical_by_jamo[candidate])
+
+        # 서로 다른 메뉴가 같은 거리로 가까우면 판단하지 않음
+        if len(best_canonicals) == 1:
+            return best_canonicals.pop()
+        return None
+
+    # 캐시 적중/실패 통계 반환 메서드
+    def cache_info(self):
+        return self.resolve.cache_info()
@@ -0,0 +1,112 @@
+import math
+
+
+# 값 분포를 로그 구간별 개수로만 저장하는 히스토그램 (HDR 히스토그램 방식)
+# 값을 몇 개 기록하든 구간 수는 (lowest ~ highest, 상대 오차)로 정해지므로 메모리가 일정하다
+class StreamingHistogram:
+    def __init__(self, lowest=0.001, highest=3600000.0, relative_error=0.01):
+        self.lowest = lowest  # 이 값 이하는 모두 0번 구간에 기록
+        self.highest = highest  # 이 값 이상은 모두 마지막 구간에 기록
+        self.relative_error = relative_error  # 구간 경계 사이의 상대 오차
+        self._log_base = math.log1p(relative_error)
+        self.max_index = self._index(highest)
+        self.counts = {}  # 구간 번호 -> 개수 (값이 있는 구간만 저장)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    # 값이 들어갈 구간 번호 계산 메서드
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        return 1 + int(math.log(value / self.lowest) / self._log_base)
+
+    # 구간 번호의 (하한, 상한) 반환 메서드
+    def bucket_bounds(self, index):
+        if index == 0:
+            return 0.0, self.lowest
+        lower = self.lowest * math.exp((index - 1) * self._log_base)
+        return lower, lower * (1 + self.relative_error)
+
+    # 값 하나를 기록하는 메서드
+    def record(self, value):
+        index = min(self._index(value), self.max_index)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # 다른 히스토그램의 기록을 합치는 메서드 (같은 설정끼리만 가능)
+    def merge(self, other):
+        if (other.lowest, other.highest, other.relative_error) != (self.lowest, self.highest, self.relative_error):
+            raise ValueError("설정이 다른 히스토그램은 합칠 수 없습니다.")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    # 구간의 대표값 (구간 상한, 단 실제 최솟값/최댓값 범위 안으로 제한)
+    def _representative(self, index):
+        value = self.bucket_bounds(index)[1]
+        return min(max(value, self.min), self.max)
+
+    # 백분위수 계산 메서드 (fraction: 0.0 ~ 1.0, nearest-rank)
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = max(1, min(self.count, math.ceil(fraction * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self._representative(index)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # 값이 있는 구간을 (하한, 상한, 개수)로 나열하는 메서드
+    def buckets(self):
+        for index in sorted(self.counts):
+            lower, upper = self.bucket_bounds(index)
+            yield lower, upper, self.counts[index]
+
+    # 주어진 경계값 기준으로 묶은 분포 반환 메서드
+    # boundaries=[1, 10] 이면 "<=1", "<=10", ">10" 세 구간의 개수를 반환한다
+    def distribution(self, boundaries):
+        labels = [f"<={boundary:g}" for boundary in boundaries] + [f">{boundaries[-1]:g}"]
+        result = dict.fromkeys(labels, 0)
+        for index, count in self.counts.items():
+            # 경계값과 같은 값(예: BLEU 1.0)이 다음 구간으로 넘어가지 않도록 구간 하한으로 분류
+            value = max(self.bucket_bounds(index)[0], self.min)
+            for label, boundary in zip(labels, boundaries):
+                if value <= boundary:
+                    result[label] += count
+                    break
+            else:
+                result[labels[-1]] += count
+        return result
+
+    # 요약 통계 반환 메서드
+    def summary(self, boundaries=None):
+        summary = {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min if self.min is not None else 0.0,
+            "max": self.max if self.max is not None else 0.0,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "p999": self.percentile(0.999),
+        }
+        if boundaries:
+            summary["distribution"] = self.distribution(boundaries)
+        return summary
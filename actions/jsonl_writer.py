@@ -0,0 +1,73 @@
+import json
+import os
+import time
+
+
+# 레코드를 한 줄에 하나씩 JSON으로 이어 쓰는 버퍼 기록기
+# flush_every개가 쌓이거나 flush_interval초가 지나면 파일에 내보내므로 중간에 중단되어도 그때까지의 결과가 남는다
+class JsonlWriter:
+    def __init__(self, path, flush_every=100, flush_interval=1.0, clock=time.monotonic):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.written = 0
+        self._buffer = []
+        self._last_flush = clock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 이어서 쓰기(재개)를 위해 append 모드로 연다
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write("\n")  # 이전 실행이 줄 중간에서 끊겼으면 잘린 줄과 붙지 않게 줄을 바꾼다
+
+    # 레코드 하나를 버퍼에 추가하는 메서드
+    def write(self, record):
+        self._buffer.append(json.dumps(record, ensure_ascii=False))
+        self.written += 1
+        if len(self._buffer) >= self.flush_every or self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    # 버퍼의 레코드를 파일에 내보내는 메서드
+    def flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+        self._last_flush = self.clock()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+# JSONL 파일의 레코드를 차례로 읽는 메서드
+# 기록 도중 중단되어 잘린 줄은 건너뛴다
+def iter_jsonl(path):
+    if not os.path.exists(path):
+        return
+    # 잘린 줄에 깨진 멀티바이트 문자가 있어도 읽을 수 있도록 errors="replace"
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
@@ -0,0 +1,41 @@
+import re
+from functools import lru_cache
+
+from actions.fuzzy import FuzzyResolver
+
+# 공백과 쉼표를 제거하는 정규식 (모듈 로드 시 한 번만 컴파일)
+SEPARATOR_PATTERN = re.compile(r'[\s,]+')
+
+# 음료 이름 사전 (사전 파일을 읽을 때 한 번만 생성하고 표준화 결과를 캐시한다)
+class DrinkLexicon:
+    def __init__(self, name_map, cache_size=4096, fuzzy=True):
+        self.name_map = dict(name_map)  # 변형 이름 -> 표준 이름
+        self.canonical_names = frozenset(self.name_map.values())  # 표준 이름 목록
+        # 사전에 없는 오타는 표준 이름과 등록된 변형 이름 중 가장 가까운 것으로 보정
+        self.fuzzy = None
+        if fuzzy:
+            vocabulary = {name: name for name in self.canonical_names}
+            vocabulary.update(self.name_map)
+            self.fuzzy = FuzzyResolver(vocabulary)
+        # 같은 입력이 반복되므로 표준화 결과를 크기가 제한된 LRU 캐시에 저장
+        self.standardize = lru_cache(maxsize=cache_size)(self._standardize)
+
+    # 공백과 쉼표 제거 메서드
+    def normalize(self, name):
+        return SEPARATOR_PATTERN.sub('', name)
+
+    # 변형 이름을 표준 이름으로 변환하는 메서드
+    # 사전에 없으면 퍼지 검색으로 보정하고, 그래도 없으면 공백만 제거한 이름 반환
+    def _standardize(self, name):
+        normalized_name = self.normalize(name)
+        canonical = self.name_map.get(normalized_name)
+        if canonical is not None:
+            return canonical
+        if normalized_name in self.canonical_names or self.fuzzy is None:
+            return normalized_name
+        return self.fuzzy.resolve(normalized_name) or normalized_name
+
+    # 캐시 적중/실패 통계 반환 메서드
+    def cache_info(self):
+        return self.standardize.cache_info()
+
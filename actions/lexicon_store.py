@@ -0,0 +1,96 @@
+import itertools
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import yaml
+
+from actions.lexicon import DrinkLexicon
+from actions.normalizer import NormalizationEngine, build_reverse_index
+from actions.spotter import EntitySpotter
+
+logger = logging.getLogger(__name__)
+
+# 기본 사전 파일 위치 (LEXICON_PATH 환경 변수로 변경 가능)
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "resources", "lexicons.yml")
+
+# 사전 조회로 표준화하는 엔티티 종류 (drink_type은 퍼지 보정이 있는 DrinkLexicon으로 처리)
+TERM_ENTITY_TYPES = ("temperature", "quantity", "size", "additional_options", "take")
+
+# 사전 파일 하나를 읽어 만든 표준화 도구 묶음
+# version은 새로 읽을 때마다 1씩 증가하므로 표준화 결과를 저장하는 캐시의 키로 사용할 수 있다
+CompiledLexicons = namedtuple("CompiledLexicons", ["version", "drinks", "normalizer", "spotter"])
+
+_versions = itertools.count(1)
+
+
+# 사전 데이터(엔티티 종류 -> 표준값 -> 변형 목록)로 표준화 도구를 만드는 메서드
+def compile_lexicons(data, version=None):
+    drinks = DrinkLexicon(build_reverse_index(data.get("drink_type") or {}))
+    normalizer = NormalizationEngine(
+        {entity_type: data.get(entity_type) or {} for entity_type in TERM_ENTITY_TYPES},
+        resolvers={"drink_type": drinks.standardize},
+    )
+    spotter = EntitySpotter.from_lexicons(data)
+    return CompiledLexicons(next(_versions) if version is None else version, drinks, normalizer, spotter)
+
+
+# 현재 표준화 사전을 들고 있는 객체
+# 새 사전은 요청을 처리하지 않는 스레드에서 완성한 뒤 참조만 바꾸므로, 요청 처리 중에는 항상 한 버전만 보게 된다
+class LexiconStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # 동시에 여러 번 다시 읽지 않도록 사용
+        self._mtime = os.path.getmtime(path)
+        self._current = self._compile()
+
+    def _compile(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return compile_lexicons(yaml.safe_load(f) or {})
+
+    # 현재 사전 (한 번 꺼내 쓰면 도중에 다른 버전으로 바뀌지 않는다)
+    @property
+    def current(self):
+        return self._current
+
+    # 현재 사전 버전
+    @property
+    def version(self):
+        return self._current.version
+
+    # 사전 파일을 다시 읽어 교체하는 메서드 (읽기에 실패하면 기존 사전 유지)
+    def reload(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            compiled = self._compile()
+            self._current, self._mtime = compiled, mtime
+            return compiled
+
+    # 파일이 바뀌었을 때만 다시 읽는 메서드 (다시 읽었으면 True)
+    def reload_if_changed(self):
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        self.reload()
+        return True
+
+
+# interval초마다 대상들의 파일 변경을 확인해 다시 읽는 백그라운드 스레드를 시작하는 메서드
+# 대상은 reload_if_changed()를 제공해야 하며, 다시 읽다 실패하면 기록만 남기고 기존 데이터를 계속 사용한다
+def start_reload_watcher(targets, interval=5.0):
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            for target in targets:
+                try:
+                    if target.reload_if_changed():
+                        logger.info("%s 다시 읽음", target.path)
+                except Exception:
+                    logger.exception("%s 다시 읽기 실패", target.path)
+
+    threading.Thread(target=loop, name="lexicon-watcher", daemon=True).start()
+    return stop
+
+
+lexicons = LexiconStore(os.getenv("LEXICON_PATH", DEFAULT_LEXICON_PATH))
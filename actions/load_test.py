@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""키오스크 동시 접속 부하 테스트
+
+data/stories.yml의 대화 흐름을 동시에 여러 세션(세션마다 다른 sender_id)으로 재생하면서
+동시 접속 수를 단계적으로 늘려 처리량, 지연 시간 백분위, 오류율을 측정한다.
+
+프로젝트 루트에서 실행:
+    # 액션 클래스를 같은 프로세스에서 직접 실행
+    python -m actions.load_test --levels 1,10,50,100 --duration 10
+
+    # 실행 중인 액션 서버(rasa run actions)에 HTTP로 요청
+    python -m actions.load_test --url http://localhost:5055/webhook --levels 1,10,50
+
+    # 액션 서버 대신 액션 클래스를 감싼 간이 HTTP 서버를 띄워서 HTTP 경로까지 측정
+    python -m actions.load_test --stand-in --levels 1,10,50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import replay
+from actions.histogram import StreamingHistogram
+
+
+# 액션 클래스를 같은 프로세스에서 직접 실행하는 전송 방식
+class InProcessTransport:
+    def __init__(self, actions):
+        self.actions = actions
+
+    # 액션이 오류를 처리하고 안내 메시지로 응답한 경우에도 실패로 집계되도록 예외를 발생
+    async def call(self, name, tracker):
+        _, failed = await replay.run_action(self.actions[name], CollectingDispatcher(), tracker)
+        if failed:
+            raise RuntimeError(f"{name} 실행 실패")
+
+    def close(self):
+        pass
+
+
+# 액션 서버의 /webhook 엔드포인트로 요청하는 전송 방식
+# urllib은 동기 방식이라 스레드 풀에서 실행한다
+class HttpTransport:
+    def __init__(self, url, timeout=10.0, max_workers=100):
+        self.url = url
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        # 2xx가 아닌 응답은 HTTPError로 올라와 오류로 집계된다
+        # (실제 액션 서버는 액션이 처리한 오류도 200으로 응답하므로, 그런 오류는 서버의 /metrics에서 확인)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def call(self, name, tracker):
+        payload = {
+            "next_action": name,
+            "sender_id": tracker.sender_id,
+            "tracker": tracker.current_state(),
+            "domain": {},
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._post, payload)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# 액션 서버 대신 /webhook 요청을 같은 프로세스의 액션 클래스로 처리하는 간이 HTTP 서버
+class StandInActionServer:
+    def __init__(self, actions, host="127.0.0.1", port=0):
+        actions_by_name = actions
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    payload = json.loads(body)
+                    state = payload["tracker"]
+                    tracker = replay.ReplayTracker(payload["sender_id"], state["latest_message"], state.get("slots"))
+                    dispatcher = CollectingDispatcher()
+                    # 요청마다 처리 스레드가 달라서 스레드별 이벤트 루프로 실행
+                    action = actions_by_name[payload["next_action"]]
+                    events, failed = asyncio.run(replay.run_action(action, dispatcher, tracker))
+                    if failed:
+                        # 액션이 처리한 오류도 부하 테스트에서 오류로 집계되도록 500으로 응답
+                        status, response = 500, {"error": f"{action.name()} 실행 실패", "responses": dispatcher.messages}
+                    else:
+                        status, response = 200, {"events": events or [], "responses": dispatcher.messages}
+                except Exception as e:
+                    status, response = 500, {"error": str(e)}
+                data = json.dumps(response, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # 요청마다 출력되는 접속 로그 끄기
+
+        # 기본 대기열(5)로는 동시 접속이 많을 때 연결이 거부되므로 늘려서 생성
+        server_class = type("StandInHTTPServer", (ThreadingHTTPServer,), {"request_queue_size": 1024})
+        self.server = server_class((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}/webhook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# 동시 접속 단계 하나의 측정 결과
+class LevelStats:
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.calls = 0
+        self.errors = 0
+        self.conversations = 0
+        self.latency_ms = StreamingHistogram(lowest=0.001, highest=60000.0)
+        self.elapsed = 0.0
+
+    def report(self):
+        latency = self.latency_ms
+        return {
+            "sessions": self.sessions,
+            "conversations": self.conversations,
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "throughput_per_s": self.calls / self.elapsed if self.elapsed else 0.0,
+            "mean_ms": latency.mean(),
+            "p50_ms": latency.percentile(0.50),
+            "p95_ms": latency.percentile(0.95),
+            "p99_ms": latency.percentile(0.99),
+            "max_ms": latency.max or 0.0,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, transport, custom_actions, stories, think_time=0.0):
+        self.transport = transport
+        self.custom_actions = custom_actions  # 실행할 커스텀 액션 이름 (utter_* 등은 건너뜀)
+        self.conversations = [replay.story_turns(story) for story in stories]
+        self.conversations = [turns for turns in self.conversations if any(actions for _, actions in turns)]
+        self.think_time = think_time  # 사용자 발화 사이 대기 시간(초)
+
+    # 대화 하나를 처음부터 끝까지 재생하는 메서드
+    async def _run_conversation(self, turns, sender_id, stats):
+        for message, action_names in turns:
+            # 같은 스토리를 여러 세션이 동시에 재생하므로 엔티티는 매번 복사
+            message = dict(message, entities=[dict(entity) for entity in message["entities"]])
+            tracker = replay.ReplayTracker(sender_id, message)
+            for name in action_names:
+                if name not in self.custom_actions:
+                    continue
+                start = time.perf_counter()
+                try:
+                    await self.transport.call(name, tracker)
+                except Exception:
+                    stats.errors += 1
+                stats.latency_ms.record((time.perf_counter() - start) * 1000)
+                stats.calls += 1
+            if self.think_time:
+                await asyncio.sleep(self.think_time)
+        stats.conversations += 1
+
+    # 세션(키오스크) 하나: 마감 시간까지 대화를 이어서 재생
+    async def _run_session(self, session, deadline, stats, prefix):
+        count = 0
+        while time.perf_counter() < deadline:
+            turns = self.conversations[(session + count) % len(self.conversations)]
+            await self._run_conversation(turns, f"{prefix}-{session}-{count}", stats)
+            count += 1
+            await asyncio.sleep(0)  # 다른 세션에 차례 넘기기
+
+    # 동시 접속 수 하나로 duration초 동안 부하를 거는 메서드
+    async def run_level(self, sessions, duration):
+        stats = LevelStats(sessions)
+        prefix = f"load-{sessions}-{int(time.time())}"
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(self._run_session(session, deadline, stats, prefix) for session in range(sessions)))
+        stats.elapsed = time.perf_counter() - start
+        return stats.report()
+
+    async def run(self, levels, duration):
+        results = []
+        for sessions in levels:
+            results.append(await self.run_level(sessions, duration))
+            print_level(results[-1])
+        return results
+
+
+def print_header():
+    print(f"{'sessions':>9}{'calls':>9}{'errors':>8}{'err %':>8}{'ops/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+
+
+def print_level(stats):
+    print(f"{stats['sessions']:>9}{stats['calls']:>9}{stats['errors']:>8}{stats['error_rate'] * 100:>8.2f}"
+          f"{stats['throughput_per_s']:>11.1f}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+          f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="키오스크 동시 접속 부하 테스트")
+    parser.add_argument("--levels", default="1,10,50,100", help="차례로 측정할 동시 세션 수 (쉼표로 구분)")
+    parser.add_argument("--duration", type=float, default=10.0, help="단계별 측정 시간(초)")
+    parser.add_argument("--url", help="액션 서버 webhook 주소 (없으면 같은 프로세스에서 액션 실행)")
+    parser.add_argument("--stand-in", action="store_true", help="액션 클래스를 감싼 간이 HTTP 서버를 띄워서 측정")
+    parser.add_argument("--timeout", type=float, default=10.0, help="HTTP 요청 제한 시간(초)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="사용자 발화 사이 대기 시간(초)")
+    parser.add_argument("--output", help="결과를 저장할 JSON 파일 경로")
+    parser.add_argument("--with-logging", action="store_true", help="액션 로그 출력을 끄지 않고 측정")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    if not args.with_logging:
+        logging.disable(logging.CRITICAL)
+
+    actions = replay.load_actions()
+    server = StandInActionServer(actions).start() if args.stand_in else None
+    url = server.url if server else args.url
+    if url:
+        transport = HttpTransport(url, timeout=args.timeout, max_workers=max(levels))
+    else:
+        transport = InProcessTransport(actions)
+    generator = LoadGenerator(transport, set(actions), replay.load_stories(), think_time=args.think_time)
+
+    print(f"대상: {url or '같은 프로세스'}, 대화 흐름 {len(generator.conversations)}개, 단계별 {args.duration:g}초")
+    print_header()
+    try:
+        results = asyncio.run(generator.run(levels, args.duration))
+    finally:
+        transport.close()
+        if server:
+            server.stop()
+
+    if args.output:
+        report = {
+            "metadata": {
+                "test_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "target": url or "in-process",
+                "duration_s": args.duration,
+                "think_time_s": args.think_time,
+            },
+            "levels": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장 위치: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# 환경 변수
+#   LOG_LEVEL: actions 패키지 로그 레벨 (기본값 INFO)
+#   LOG_LEVELS: 모듈별 로그 레벨 ("actions.actions=DEBUG,actions.fuzzy=WARNING")
+#   LOG_DEBUG_SAMPLE_RATE: DEBUG 로그 중 실제로 남길 비율 (0.0 ~ 1.0, 기본값 1.0)
+#   LOG_FORMAT: text 또는 json (기본값 text)
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# 로그 레코드의 기본 속성 (json 형식에서 extra로 넘긴 값만 골라내기 위해 사용)
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# 설정 대상 로거 (액션 서버가 설정한 루트 로거와 겹치지 않도록 actions 패키지 로거에만 적용)
+PACKAGE_LOGGER = "actions"
+
+_listener = None
+
+
+# DEBUG 레코드를 정해진 비율만 통과시키는 필터 (INFO 이상은 항상 통과)
+class DebugSampler(logging.Filter):
+    def __init__(self, rate=1.0, rng=random.random):
+        super().__init__()
+        self.rate = rate
+        self.rng = rng
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return self.rng() < self.rate
+
+
+# 레코드를 한 줄짜리 JSON으로 변환하는 포매터 (extra로 넘긴 필드도 함께 기록)
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+# "모듈=레벨,모듈=레벨" 형식의 설정을 {모듈: 레벨}로 변환하는 메서드
+def parse_levels(value):
+    levels = {}
+    for item in (value or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# 로깅 설정 메서드
+# 요청을 처리하는 코드는 레코드를 큐에 넣기만 하고, 포맷과 출력은 QueueListener 스레드에서 처리한다
+# 여러 번 호출해도 처음 한 번만 설정한다
+def configure_logging(level=None, module_levels=None, debug_sample_rate=None, fmt=None, stream=None):
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    module_levels = module_levels if module_levels is not None else parse_levels(os.getenv("LOG_LEVELS"))
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 큐에 넣기 전에 걸러야 버려질 DEBUG 레코드의 메시지를 만들지 않는다
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    package_logger = logging.getLogger(PACKAGE_LOGGER)
+    package_logger.setLevel(level)
+    package_logger.addHandler(queue_handler)
+    package_logger.propagate = False  # 루트 로거 핸들러로 같은 로그가 한 번 더 출력되지 않도록
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # 종료할 때 큐에 남은 로그까지 출력
+    return _listener
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+# OrderMapper 결과 (모든 값은 수정할 수 없는 튜플)
+class MappedOrder(namedtuple("MappedOrder", ["temperatures", "drink_types", "sizes", "quantities", "additional_options", "drinks"])):
+    __slots__ = ()
+
+    # OrderMapper.get_mapped_data()와 같은 순서로 반환하는 메서드
+    def get_mapped_data(self):
+        return self.temperatures, self.drink_types, self.sizes, self.quantities, self.additional_options
+
+
+# 엔티티 묶음을 캐시 키로 변환하는 메서드
+# (엔티티 종류, 값, 첫 엔티티 기준 상대 시작/끝 위치)를 시작 위치 순으로 나열한다
+def entity_signature(sorted_entities):
+    if not sorted_entities:
+        return ()
+    base = sorted_entities[0]['start']
+    return tuple(
+        (entity['entity'], entity['value'], entity['start'] - base, entity['end'] - base)
+        for entity in sorted_entities
+    )
+
+
+# 같은 발화가 반복될 때 OrderMapper를 다시 만들지 않도록 결과를 저장하는 캐시
+class MappedOrderCache:
+    def __init__(self, mapper_factory, maxsize=1024, version=None):
+        self.mapper_factory = mapper_factory  # OrderMapper(entities, is_temperature_change, is_size_change)
+        # 매핑 결과가 의존하는 데이터(사전, 메뉴)의 버전을 반환하는 함수
+        # 버전이 키에 포함되므로 데이터가 바뀌면 이전 결과는 다시 쓰이지 않고 LRU 순서대로 밀려난다
+        self.version = version
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # 키 -> MappedOrder
+        self._lock = threading.Lock()
+
+    # 엔티티를 매핑한 결과 반환 메서드 (캐시에 없으면 OrderMapper 실행)
+    def get(self, entities, is_temperature_change=False, is_size_change=False):
+        sorted_entities = sorted(entities, key=lambda x: x['start'])
+        try:
+            key = (entity_signature(sorted_entities), bool(is_temperature_change), bool(is_size_change))
+            if self.version is not None:
+                key += (self.version(),)
+            hash(key)
+        except TypeError:  # 해시할 수 없는 값이 섞여 있으면 캐시를 거치지 않음
+            return self._map(sorted_entities, is_temperature_change, is_size_change)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return entry
+
+        entry = self._map(sorted_entities, is_temperature_change, is_size_change)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    # OrderMapper를 실행하고 결과를 수정할 수 없는 형태로 변환하는 메서드
+    def _map(self, sorted_entities, is_temperature_change, is_size_change):
+        mapper = self.mapper_factory(sorted_entities, is_temperature_change=is_temperature_change, is_size_change=is_size_change)
+        temperatures, drink_types, sizes, quantities, additional_options = mapper.get_mapped_data()
+        drinks = tuple(
+            MappingProxyType({**drink, 'additional_options': tuple(drink.get('additional_options') or ())})
+            for drink in mapper.drinks
+        )
+        return MappedOrder(tuple(temperatures), tuple(drink_types), tuple(sizes), tuple(quantities), tuple(additional_options), drinks)
+
+    # 캐시 적중/실패 통계 반환 메서드
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    # 캐시 비우기 메서드
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import yaml
+
+# 기본 메뉴 파일 위치 (MENU_PATH 환경 변수로 변경 가능)
+DEFAULT_MENU_PATH = os.path.join(os.path.dirname(__file__), "resources", "menu.yml")
+
+# 음료 하나의 정보 (temperatures는 제공 가능한 온도의 frozenset)
+Drink = namedtuple("Drink", ["name", "price", "temperatures"])
+
+
+# 메뉴 카탈로그 (만든 뒤에는 바뀌지 않으며, 조회용 색인을 미리 만들어 둔다)
+class MenuCatalog:
+    def __init__(self, data):
+        self.default_temperature = data.get("default_temperature", "핫")
+        self.default_size = data.get("default_size", "미디움")
+        self.sizes = MappingProxyType(dict(data.get("sizes") or {}))  # 사이즈 -> 추가 금액
+        self.options = MappingProxyType(dict(data.get("options") or {}))  # 추가 옵션 -> 추가 금액
+        drinks = {}
+        for name, info in (data.get("drinks") or {}).items():
+            info = info or {}
+            temperatures = frozenset(info.get("temperatures") or (self.default_temperature,))
+            drinks[name] = Drink(name, info.get("price", 0), temperatures)
+        self.drinks = MappingProxyType(drinks)  # 표준 음료 이름 -> Drink
+        self.drink_names = frozenset(drinks)
+        # 온도가 하나로 고정된 음료 -> 고정 온도
+        self.fixed_temperatures = MappingProxyType({
+            name: next(iter(drink.temperatures)) for name, drink in drinks.items() if len(drink.temperatures) == 1
+        })
+        self.hot_only = frozenset(name for name, temp in self.fixed_temperatures.items() if temp == "핫")
+        self.ice_only = frozenset(name for name, temp in self.fixed_temperatures.items() if temp == "아이스")
+
+    # YAML 또는 JSON 파일에서 카탈로그를 읽는 메서드 (JSON은 YAML의 부분집합이라 같은 방법으로 읽는다)
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(yaml.safe_load(f) or {})
+
+    # 온도가 고정된 음료면 그 온도, 아니면 None 반환 메서드
+    def fixed_temperature(self, drink_name):
+        return self.fixed_temperatures.get(drink_name)
+
+    # 음료를 해당 온도로 제공할 수 있는지 확인하는 메서드 (메뉴에 없는 음료는 제한하지 않음)
+    def allows_temperature(self, drink_name, temperature):
+        fixed = self.fixed_temperatures.get(drink_name)
+        return fixed is None or temperature == fixed
+
+    # 음료 한 항목의 가격 계산 메서드 (메뉴에 없는 음료, 사이즈, 옵션은 0원으로 계산)
+    def price(self, drink_name, size=None, options=(), quantity=1):
+        drink = self.drinks.get(drink_name)
+        unit = (drink.price if drink else 0) + self.sizes.get(size or self.default_size, 0)
+        unit += sum(self.options.get(option, 0) for option in options or ())
+        return unit * quantity
+
+
+# 현재 메뉴 카탈로그를 들고 있는 객체
+# 다시 읽을 때는 새 카탈로그를 완성한 뒤 참조만 바꾸므로, 요청 처리 중에는 항상 완전한 카탈로그 하나를 보게 된다
+class MenuHolder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # 동시에 여러 번 다시 읽지 않도록 사용
+        self._mtime = os.path.getmtime(path)
+        self._catalog = MenuCatalog.from_file(path)
+        self.version = 1  # 다시 읽을 때마다 1씩 증가 (카탈로그에 따라 달라지는 캐시의 키로 사용)
+
+    # 현재 카탈로그 (한 요청 안에서는 한 번 꺼내 쓰면 도중에 바뀌지 않는다)
+    @property
+    def catalog(self):
+        return self._catalog
+
+    # 메뉴 파일을 다시 읽어 카탈로그를 교체하는 메서드 (읽기에 실패하면 기존 카탈로그 유지)
+    def reload(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            catalog = MenuCatalog.from_file(self.path)
+            self._catalog, self._mtime = catalog, mtime
+            self.version += 1
+            return catalog
+
+    # 파일이 바뀌었을 때만 다시 읽는 메서드 (다시 읽었으면 True)
+    def reload_if_changed(self):
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        self.reload()
+        return True
+
+
+menu = MenuHolder(os.getenv("MENU_PATH", DEFAULT_MENU_PATH))
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+# 규칙 기반 추출기 결과와 겹치므로 액션에서 사용하지 않는 추출기
+IGNORED_EXTRACTORS = frozenset({"DIETClassifier"})
+
+
+# 한 메시지를 액션에서 쓰기 좋게 정리한 결과
+# entities는 시작 위치 순으로 정렬된 수정할 수 없는 엔티티(MappingProxyType) 튜플
+class PreparedMessage(namedtuple("PreparedMessage", ["message_id", "text", "intent", "entities"])):
+    __slots__ = ()
+
+    # 지정한 종류의 엔티티만 반환하는 메서드
+    def entities_of(self, *entity_types):
+        return [entity for entity in self.entities if entity.get("entity") in entity_types]
+
+
+# NLU가 음료 엔티티를 놓쳤을 때 사전 검색 결과로 보충하는 메서드
+# 검색 결과에 음료가 있을 때만, NLU 엔티티와 겹치지 않는 것을 추가한다
+def _merge_spotted(entities, spotted):
+    if not any(entity.get("entity") == "drink_type" for entity in spotted):
+        return entities
+    spans = [(entity.get("start", 0), entity.get("end", 0)) for entity in entities]
+    merged = list(entities)
+    for entity in spotted:
+        if all(entity["end"] <= start or end <= entity["start"] for start, end in spans):
+            merged.append(entity)
+    return merged
+
+
+# 더 긴 수량 엔티티 안에 들어 있는 수량 엔티티를 제외하는 메서드
+# 정규식마다 따로 찾으므로 "열다섯 잔"에서 "열다섯"과 "다섯"이 함께 잡히는 경우가 있다
+def _drop_nested_quantities(entities):
+    spans = [(entity.get("start", 0), entity.get("end", 0)) for entity in entities if entity.get("entity") == "quantity"]
+    if len(spans) < 2:
+        return entities
+    return [
+        entity for entity in entities
+        if entity.get("entity") != "quantity"
+        or not any(
+            start <= entity.get("start", 0) and entity.get("end", 0) <= end and end - start > entity.get("end", 0) - entity.get("start", 0)
+            for start, end in spans
+        )
+    ]
+
+
+# 최신 사용자 메시지를 정리하는 메서드 (추출기 필터링, 음료 엔티티 보충, 겹친 수량 제거, 시작 위치 순 정렬, 읽기 전용 복사본 생성)
+# fallback은 발화 문자열에서 엔티티를 찾는 함수 (예: EntitySpotter.spot)
+def prepare_message(message, fallback=None):
+    text = message.get("text") or ""
+    entities = [entity for entity in message.get("entities") or [] if entity.get("extractor") not in IGNORED_EXTRACTORS]
+    if fallback is not None and text and not any(entity.get("entity") == "drink_type" for entity in entities):
+        entities = _merge_spotted(entities, fallback(text))
+    entities = [MappingProxyType(dict(entity)) for entity in _drop_nested_quantities(entities)]
+    entities.sort(key=lambda entity: entity.get("start", 0))
+    return PreparedMessage(
+        message.get("message_id"),
+        text,
+        (message.get("intent") or {}).get("name"),
+        tuple(entities),
+    )
+
+
+# 메시지 id별로 정리 결과를 저장하는 캐시
+# 규칙에 따라 한 턴에 여러 액션이 이어서 실행되어도 엔티티 정리는 한 번만 한다
+class PreparedMessageCache:
+    def __init__(self, maxsize=1024, fallback=None):
+        self.maxsize = maxsize
+        self.fallback = fallback  # NLU가 음료 엔티티를 놓쳤을 때 사용할 엔티티 검색 함수 (None이면 사용하지 않음)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (sender_id, message_id) -> PreparedMessage
+        self._lock = threading.Lock()
+
+    # 트래커의 최신 메시지를 정리한 결과 반환 메서드 (message_id가 없으면 캐시를 거치지 않음)
+    def get(self, tracker):
+        message = tracker.latest_message or {}
+        message_id = message.get("message_id")
+        if message_id is None:
+            return prepare_message(message, self.fallback)
+        key = (tracker.sender_id, message_id)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+        prepared = prepare_message(message, self.fallback)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = prepared
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return prepared
+
+    # 캐시 비우기 메서드
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+prepared_messages = PreparedMessageCache()
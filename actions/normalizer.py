@@ -0,0 +1,51 @@
+# 표준값 -> 변형 목록을 변형 -> 표준값 역색인으로 변환하는 메서드
+def build_reverse_index(terms):
+    index = {}
+    for canonical, variants in terms.items():
+        for variant in variants:
+            # 여러 표준값에 같은 변형이 있으면 먼저 나온 표준값을 사용
+            index.setdefault(variant, canonical)
+    return index
+
+
+# 엔티티 값 표준화 엔진 (엔티티 종류별 역색인을 한 번만 만들어 두고 조회)
+class NormalizationEngine:
+    def __init__(self, term_tables, resolvers=None):
+        # 엔티티 종류 -> {변형: 표준값}
+        self.indexes = {entity_type: build_reverse_index(terms) for entity_type, terms in term_tables.items()}
+        # 사전 조회 대신 별도의 함수로 표준화하는 엔티티 종류 (예: 음료 이름)
+        self.resolvers = dict(resolvers or {})
+
+    # 엔티티 값 하나를 표준화하는 메서드 (모르는 값은 그대로 반환)
+    def normalize(self, entity_type, value):
+        index = self.indexes.get(entity_type)
+        if index is not None:
+            try:
+                return index.get(value, value)
+            except TypeError:  # 리스트처럼 해시할 수 없는 값
+                return value
+        resolver = self.resolvers.get(entity_type)
+        if resolver is not None:
+            return resolver(value)
+        return value
+
+    # 엔티티 리스트 전체를 한 번에 표준화하는 메서드 (원본은 수정하지 않고 새 리스트 반환)
+    # OrderMapper는 접미사 제거 등에 원래 값이 필요해 normalize()로 값마다 표준화하므로 이 메서드를 쓰지 않는다
+    # 표준값만 필요한 곳(기록, 분석 등)에서 종류별 조회를 한 번의 순회로 처리할 때 사용
+    def normalize_entities(self, entities):
+        indexes = self.indexes
+        resolvers = self.resolvers
+        normalized = []
+        for entity in entities:
+            entity_type = entity.get("entity")
+            value = entity.get("value")
+            index = indexes.get(entity_type)
+            if index is not None:
+                try:
+                    value = index.get(value, value)
+                except TypeError:  # 리스트처럼 해시할 수 없는 값
+                    pass
+            elif entity_type in resolvers:
+                value = resolvers[entity_type](value)
+            normalized.append({**entity, "value": value})
+        return normalized
@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+
+# 고유어 수 (잔 수를 셀 때 쓰는 관형사형과 단독형, 발음이 줄어든 형태 포함)
+NATIVE_UNITS = {
+    "한": 1, "하나": 1, "두": 2, "둘": 2, "세": 3, "셋": 3, "석": 3, "서": 3, "네": 4, "넷": 4, "넉": 4, "너": 4,
+    "다섯": 5, "여섯": 6, "일곱": 7, "여덟": 8, "아홉": 9,
+}
+NATIVE_TENS = {
+    "열": 10, "스물": 20, "스무": 20, "서른": 30, "마흔": 40, "쉰": 50, "예순": 60, "일흔": 70, "여든": 80, "아흔": 90,
+}
+
+# 한자어 수와 자릿수
+SINO_DIGITS = {"일": 1, "이": 2, "삼": 3, "사": 4, "오": 5, "육": 6, "륙": 6, "칠": 7, "팔": 8, "구": 9}
+SINO_MULTIPLIERS = {"십": 10, "백": 100, "천": 1000}
+
+# 한 항목에 주문할 수 있는 최대 수량 (한국어 수와 아라비아 숫자 모두 같은 범위 적용)
+MAX_QUANTITY = 999
+
+# 수 뒤에 붙어도 무시하는 단위
+COUNTERS = ("잔", "개", "컵")
+
+# 수를 한국어로 쓸 때 사용하는 형태 (number_to_korean)
+NATIVE_UNIT_WORDS = ("", "한", "두", "세", "네", "다섯", "여섯", "일곱", "여덟", "아홉")
+NATIVE_TEN_WORDS = ("", "열", "스물", "서른", "마흔", "쉰", "예순", "일흔", "여든", "아흔")
+SINO_DIGIT_WORDS = ("", "", "이", "삼", "사", "오", "육", "칠", "팔", "구")
+
+# 토큰 종류
+_UNIT, _TEN, _MULTIPLIER = 0, 1, 2
+
+# 토큰 -> (값, 종류) 표
+_TOKENS = {}
+_TOKENS.update((word, (value, _UNIT)) for word, value in NATIVE_UNITS.items())
+_TOKENS.update((word, (value, _UNIT)) for word, value in SINO_DIGITS.items())
+_TOKENS.update((word, (value, _TEN)) for word, value in NATIVE_TENS.items())
+_TOKENS.update((word, (value, _MULTIPLIER)) for word, value in SINO_MULTIPLIERS.items())
+
+# 숫자 또는 수 단어 하나에 맞는 정규식 (긴 단어부터 나열해 "일곱"이 "일"로 잘리지 않게 함, 모듈 로드 시 한 번만 컴파일)
+TOKEN_PATTERN = re.compile(
+    r"(\d+)|(" + "|".join(re.escape(word) for word in sorted(_TOKENS, key=len, reverse=True)) + ")"
+)
+SPACE_PATTERN = re.compile(r"\s+")
+
+
+# 수 토큰 목록을 값으로 계산하는 메서드 (자릿수 순서가 맞지 않으면 None)
+# "스물세" = 20 + 3, "삼백이십" = 3 x 100 + 2 x 10, "백스물한" = 100 + 20 + 1, "2백" = 2 x 100
+def _evaluate(tokens):
+    total = 0
+    pending = None  # 아직 자릿수를 곱하지 않은 수
+    last_place = None  # 앞에서 사용한 가장 작은 자릿수 (뒤로 갈수록 작아져야 함)
+    for value, kind in tokens:
+        if kind == _UNIT:
+            if pending is not None:
+                return None
+            pending = value
+        elif kind == _TEN:
+            if pending is not None or (last_place is not None and last_place <= 10):
+                return None
+            total += value
+            last_place = 10
+        else:
+            if last_place is not None and last_place <= value:
+                return None
+            total += (1 if pending is None else pending) * value
+            pending = None
+            last_place = value
+    if pending is not None:
+        total += pending
+    return total or None
+
+
+# 수로 읽을 수 있지만 1~MAX_QUANTITY 범위를 벗어난 수량
+class QuantityOutOfRange(ValueError):
+    def __init__(self, value):
+        super().__init__(f"수량은 1잔부터 {MAX_QUANTITY}잔까지 주문할 수 있습니다.")
+        self.value = value
+
+
+# 한국어 수(고유어, 한자어, 아라비아 숫자, 혼합)를 정수로 변환하는 메서드
+# 수로 읽을 수 없으면 None, 1~MAX_QUANTITY 범위를 벗어나면 QuantityOutOfRange 발생
+def parse_korean_number(text):
+    value = _parse_number(text)
+    if value is not None and value > MAX_QUANTITY:
+        raise QuantityOutOfRange(value)
+    return value
+
+
+# 범위 확인 전의 변환 메서드 (같은 수량 표현이 반복해서 들어오므로 결과를 캐시)
+@lru_cache(maxsize=4096)
+def _parse_number(text):
+    text = SPACE_PATTERN.sub("", text)
+    for counter in COUNTERS:
+        if text.endswith(counter):
+            text = text[:-len(counter)]
+            break
+    if not text:
+        return None
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            return None
+        digits, word = match.groups()
+        if digits is not None:
+            tokens.append((int(digits), _UNIT))
+        else:
+            tokens.append(_TOKENS[word])
+        position = match.end()
+    return _evaluate(tokens)
+
+
+# 정수를 잔 수를 셀 때의 한국어로 변환하는 메서드 (parse_korean_number의 역변환)
+# 99까지는 고유어("스무", "열한"), 100부터는 백 단위만 한자어("백스물세"), 1000 이상은 숫자 문자열
+@lru_cache(maxsize=1024)
+def korean_number(number):
+    if not 0 < number < 1000:
+        return str(number)
+    hundreds, rest = divmod(number, 100)
+    tens, units = divmod(rest, 10)
+    prefix = SINO_DIGIT_WORDS[hundreds] + "백" if hundreds else ""
+    if tens == 2 and not units:
+        return prefix + "스무"
+    return prefix + NATIVE_TEN_WORDS[tens] + NATIVE_UNIT_WORDS[units]
+
+
+# 엔티티 검색기에 등록할 수 표현 목록 (1~99 고유어, 100~999 한국어 표기, 1~999 숫자)
+def numeral_terms(limit=999):
+    terms = []
+    for number in range(1, limit + 1):
+        terms.append(korean_number(number))
+        terms.append(str(number))
+    terms.extend(NATIVE_UNITS)
+    terms.extend(NATIVE_TENS)
+    return terms
@@ -0,0 +1,112 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from actions.jsonl_writer import iter_jsonl
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# 완료된 주문을 한 줄에 하나씩 기록하는 추가 전용(append-only) 주문 기록부
+# 여러 키오스크에서 동시에 들어온 기록을 commit_interval초 동안 모아 한 번에 쓰고 fsync도 한 번만 한다(group commit)
+class OrderJournal:
+    def __init__(self, path, commit_interval=0.01, max_batch=512, fsync=True):
+        self.path = path
+        self.commit_interval = commit_interval  # 첫 기록 뒤 같은 묶음으로 모으는 최대 대기 시간(초)
+        self.max_batch = max_batch  # 한 번에 기록하는 최대 레코드 수
+        self.fsync = fsync
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # 레코드 하나를 기록 대기열에 넣는 메서드
+    # 반환된 Event는 레코드가 디스크에 기록(fsync)되면 set 된다
+    def append(self, record):
+        if self._closed:
+            raise RuntimeError("닫힌 주문 기록부에는 기록할 수 없습니다.")
+        done = threading.Event()
+        self._queue.put((json.dumps(record, ensure_ascii=False, separators=(",", ":")), done))
+        return done
+
+    # 대기열에서 한 묶음을 꺼내는 메서드 (종료 신호를 받으면 stop=True)
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.commit_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        try:
+            self._file.write("".join(line + "\n" for line, _ in batch))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            logger.exception("주문 기록 실패 (%d건)", len(batch))
+        finally:
+            for _, done in batch:
+                done.set()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    # 남은 기록을 모두 쓰고 기록 스레드를 멈추는 메서드
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+
+
+# 주문 기록부의 레코드를 차례로 읽는 메서드 (보고서, POS 정산용)
+# since/until은 completed_at(ISO 8601 문자열) 기준 범위
+def iter_records(path, since=None, until=None):
+    for record in iter_jsonl(path):
+        completed_at = record.get("completed_at", "")
+        if since is not None and completed_at < since:
+            continue
+        if until is not None and completed_at >= until:
+            continue
+        yield record
+
+
+# 환경 변수 설정에 따라 주문 기록부를 만드는 메서드 (ORDER_JOURNAL_PATH가 없거나 빈 값이면 기록하지 않음)
+# 벤치마크나 부하 테스트처럼 actions.py를 불러오기만 하는 도구가 실제 기록부에 쓰지 않도록 기본값은 사용 안 함
+#   ORDER_JOURNAL_PATH: 기록 파일 경로 (예: journal/orders.jsonl)
+#   ORDER_JOURNAL_COMMIT_INTERVAL: group commit 대기 시간(초, 기본값 0.01)
+def create_journal_from_env():
+    path = os.getenv("ORDER_JOURNAL_PATH", "")
+    if not path:
+        return None
+    return OrderJournal(path, commit_interval=float(os.getenv("ORDER_JOURNAL_COMMIT_INTERVAL", "0.01")))
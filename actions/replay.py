@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import re
+import uuid
+
+import yaml
+
+# 프로젝트 기본 경로 및 학습 데이터 경로
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_DIR, "data")
+
+# NLU 예문의 [텍스트](엔티티) 또는 [텍스트]("entity": "...", "role": "...") 주석 패턴
+ANNOTATION_PATTERN = re.compile(r"\[([^\]]+)\]\(([^)]*)\)")
+
+# 스토리 엔티티에서 엔티티 이름이 아닌 키
+ENTITY_ATTRIBUTE_KEYS = ("role", "group", "value")
+
+
+# 주석 괄호 안의 내용을 엔티티 정보로 변환하는 메서드
+def _parse_annotation(body):
+    body = body.strip()
+    if body.startswith('"') or body.startswith("{"):
+        data = json.loads(body if body.startswith("{") else "{" + body + "}")
+        return data.get("entity"), data.get("role"), data.get("value")
+    # [텍스트](엔티티:동의어) 형식
+    entity, _, synonym = body.partition(":")
+    return entity, None, synonym or None
+
+
+# 주석이 달린 예문을 (텍스트, 엔티티 리스트)로 변환하는 메서드
+# 엔티티의 start/end는 주석을 제거한 텍스트 기준 위치
+def parse_annotated_text(example):
+    text_parts = []
+    entities = []
+    length = 0
+    position = 0
+    for match in ANNOTATION_PATTERN.finditer(example):
+        plain = example[position:match.start()]
+        text_parts.append(plain)
+        length += len(plain)
+
+        surface = match.group(1)
+        entity, role, synonym = _parse_annotation(match.group(2))
+        entity_data = {
+            "entity": entity,
+            "value": synonym or surface,
+            "start": length,
+            "end": length + len(surface),
+            "extractor": "replay",
+        }
+        if role:
+            entity_data["role"] = role
+        entities.append(entity_data)
+
+        text_parts.append(surface)
+        length += len(surface)
+        position = match.end()
+    text_parts.append(example[position:])
+    return "".join(text_parts), entities
+
+
+# 스토리 스텝의 엔티티 목록으로 발화 텍스트와 엔티티 위치를 만드는 메서드
+# 스토리에는 원문이 없으므로 엔티티 값을 띄어쓰기로 이어 붙인 문장을 사용한다
+def build_story_message(step_entities):
+    words = []
+    entities = []
+    length = 0
+    for item in step_entities or []:
+        if isinstance(item, str):
+            entity, value, role = item, item, None
+        else:
+            names = [key for key in item if key not in ENTITY_ATTRIBUTE_KEYS]
+            if not names:
+                continue
+            entity = names[0]
+            value = item.get("value", item[entity])
+            role = item.get("role")
+        value = str(value)
+        if words:
+            length += 1  # 띄어쓰기
+        entity_data = {"entity": entity, "value": value, "start": length, "end": length + len(value), "extractor": "replay"}
+        if role:
+            entity_data["role"] = role
+        entities.append(entity_data)
+        words.append(value)
+        length += len(value)
+    return " ".join(words), entities
+
+
+# 트래커의 latest_message 형태로 메시지를 만드는 메서드
+def make_message(intent, text, entities):
+    return {
+        "intent": {"name": intent, "confidence": 1.0},
+        "text": text,
+        "entities": entities,
+        "message_id": uuid.uuid4().hex,
+    }
+
+
+# YAML 파일 로드 메서드
+def _load_yaml(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+# nlu.yml의 예문을 (인텐트, 텍스트, 엔티티) 리스트로 로드하는 메서드
+def load_nlu_examples(path=None):
+    data = _load_yaml(path or os.path.join(DATA_DIR, "nlu.yml"))
+    examples = []
+    for block in data.get("nlu", []):
+        intent = block.get("intent")
+        if not intent:
+            continue
+        for line in (block.get("examples") or "").splitlines():
+            line = line.strip()
+            if not line.startswith("- "):
+                continue
+            text, entities = parse_annotated_text(line[2:].strip())
+            examples.append((intent, text, entities))
+    return examples
+
+
+# 스토리(또는 룰)를 대화 턴 리스트로 변환하는 메서드
+# 각 턴은 (사용자 메시지, 이어서 실행되는 액션 이름 리스트)
+def story_turns(story):
+    turns = []
+    for step in story.get("steps", []):
+        if "intent" in step:
+            text, entities = build_story_message(step.get("entities"))
+            turns.append((make_message(step["intent"], text, entities), []))
+        elif "action" in step and turns:
+            turns[-1][1].append(step["action"])
+    return turns
+
+
+# stories.yml의 스토리 리스트 로드 메서드
+def load_stories(path=None):
+    return _load_yaml(path or os.path.join(DATA_DIR, "stories.yml")).get("stories", [])
+
+
+# rules.yml의 룰 리스트 로드 메서드
+def load_rules(path=None):
+    return _load_yaml(path or os.path.join(DATA_DIR, "rules.yml")).get("rules", [])
+
+
+# 인텐트 -> 처음 실행되는 액션 이름 매핑 생성 메서드 (룰, 스토리 순서로 우선)
+def build_intent_action_map(rules, stories):
+    intent_actions = {}
+    for story in list(rules) + list(stories):
+        for message, actions in story_turns(story):
+            if actions:
+                intent_actions.setdefault(message["intent"]["name"], actions[0])
+    return intent_actions
+
+
+# actions.actions 모듈의 커스텀 액션을 이름별로 생성하는 메서드
+def load_actions(module=None):
+    if module is None:
+        from actions import actions as module
+    from rasa_sdk import Action
+
+    registry = {}
+    for obj in vars(module).values():
+        if isinstance(obj, type) and issubclass(obj, Action) and obj is not Action and obj.__module__ == module.__name__:
+            action = obj()
+            registry[action.name()] = action
+    return registry
+
+
+# 액션을 실행하고 (이벤트, 실패 여부)를 반환하는 메서드
+# 액션은 예외를 직접 잡아 오류 안내 메시지로 응답하므로, 예외뿐 아니라 실행 중 늘어난
+# 지표의 오류 수(metrics.count_error, instrument_action)로 실패를 판단한다
+# (지표는 스레드별로 모으므로 같은 스레드에서 실행한 액션의 오류만 센다)
+async def run_action(action, dispatcher, tracker, domain=None):
+    from actions.metrics import metrics
+
+    series = metrics.series("action", action.name())
+    errors = series.errors
+    try:
+        events = await action.run(dispatcher, tracker, domain or {})
+    except Exception:
+        return None, True
+    return events, series.errors != errors
+
+
+# 액션 서버 밖에서 액션을 실행하기 위한 간단한 트래커
+# (액션에서 사용하는 sender_id, latest_message, 슬롯 조회만 지원)
+class ReplayTracker:
+    def __init__(self, sender_id, latest_message, slots=None):
+        self.sender_id = sender_id
+        self.latest_message = latest_message
+        self.slots = dict(slots or {})
+        self.events = []
+        self.active_loop = {}
+        self.latest_action_name = None
+
+    def get_slot(self, key):
+        return self.slots.get(key)
+
+    def get_latest_entity_values(self, entity_type, entity_role=None, entity_group=None):
+        return (
+            entity.get("value")
+            for entity in self.latest_message.get("entities", [])
+            if entity.get("entity") == entity_type
+            and (entity_role is None or entity.get("role") == entity_role)
+            and (entity_group is None or entity.get("group") == entity_group)
+        )
+
+    # rasa_sdk Tracker.current_state()와 같은 형태 (HTTP로 액션 서버에 보낼 때 사용)
+    def current_state(self):
+        return {
+            "sender_id": self.sender_id,
+            "slots": self.slots,
+            "latest_message": self.latest_message,
+            "events": self.events,
+            "paused": False,
+            "followup_action": None,
+            "active_loop": self.active_loop,
+            "latest_action_name": self.latest_action_name,
+        }
+
+
+# 지연 시간 샘플(초)의 백분위수를 계산하는 메서드 (nearest-rank)
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, min(len(sorted_samples), math.ceil(fraction * len(sorted_samples))))
+    return sorted_samples[rank - 1]
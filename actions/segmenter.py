@@ -0,0 +1,62 @@
+import re
+
+# 바꿀 대상과 새 주문을 나누는 표현 ("아메리카노 말고 카페라떼로 주세요")
+MODIFY_KEYWORDS = ("대신", "말고", "빼고", "뺴고", "빼주시고", "아니고", "아닌", "아니라", "있는")
+
+# 엔티티 바로 뒤에 붙었을 때만 나누는 기준으로 쓰는 조사 ("아메리카노는 카페라떼로 바꿔 주세요")
+MODIFY_PARTICLES = ("은", "는", "을", "를")
+
+# 수량 엔티티와 조사 사이에 올 수 있는 단위 ("한 잔은")
+COUNTERS = ("잔",)
+
+
+# 주문 변경 발화를 바꿀 대상 부분과 새 주문 부분으로 나누는 분리기 (모듈 로드 시 한 번만 생성)
+# - 표현과 조사를 긴 것부터 나열한 정규식 하나로 발화를 한 번만 훑는다
+# - 엔티티 안에 걸친 위치에서는 나누지 않고, 조사는 엔티티(또는 엔티티 + 단위) 바로 뒤에서만 기준으로 삼는다
+# - 표현이 있으면 처음 나온 표현, 없으면 처음 나온 조사 위치에서 나눈다
+class ModifySegmenter:
+    def __init__(self, keywords=MODIFY_KEYWORDS, particles=MODIFY_PARTICLES, counters=COUNTERS):
+        self.particles = frozenset(particles)
+        self.counters = frozenset(counters)
+        words = sorted(set(keywords) | self.particles, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(word) for word in words))
+
+    # 발화에 변경 표현이나 조사가 하나라도 있는지 확인하는 메서드 (엔티티 위치와 관계없이)
+    def has_marker(self, text):
+        return self.pattern.search(text) is not None
+
+    # 나눌 위치 (시작, 끝) 반환 메서드 (나눌 곳이 없으면 None)
+    def split_point(self, text, entities):
+        spans = sorted((entity["start"], entity["end"]) for entity in entities)
+        ends = {end for _, end in spans}
+        index = 0
+        particle_point = None
+        for match in self.pattern.finditer(text):
+            start, end = match.span()
+            # match 앞에서 끝난 엔티티는 건너뛰고, 겹치는 엔티티가 있으면 엔티티 안쪽이므로 제외
+            # (표현 자체가 엔티티로 잡힌 경우("[대신](change)")는 그대로 나누는 기준으로 사용)
+            while index < len(spans) and spans[index][1] <= start:
+                index += 1
+            overlapping = index
+            while overlapping < len(spans) and spans[overlapping] == (start, end):
+                overlapping += 1
+            if overlapping < len(spans) and spans[overlapping][0] < end:
+                continue
+            if match.group() not in self.particles:
+                return start, end
+            if particle_point is None and (start in ends or (start - 1 in ends and text[start - 1] in self.counters)):
+                particle_point = (start, end)
+        return particle_point
+
+    # (바꿀 대상 엔티티, 새 주문 엔티티) 반환 메서드 (나눌 곳이 없으면 None)
+    def segment(self, text, entities):
+        point = self.split_point(text, entities)
+        if point is None:
+            return None
+        start, end = point
+        target_entities = [entity for entity in entities if entity["end"] <= start]
+        new_entities = [entity for entity in entities if entity["start"] >= end]
+        return target_entities, new_entities
+
+
+modify_segmenter = ModifySegmenter()
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# 대화(sender_id)별 주문 관리자를 보관하는 세션 저장소
+# - capacity를 넘으면 가장 오래 사용하지 않은 세션부터 제거(LRU)
+# - ttl(초) 동안 접근이 없던 세션은 만료되어 제거
+# - backend가 있으면 메모리에 없는 세션을 backend에서 불러오고, 변경 내용은 backend가 저장
+class OrderSessionStore:
+    def __init__(self, factory, capacity=512, ttl=1800, clock=time.monotonic, backend=None):
+        if capacity < 1:
+            raise ValueError("capacity는 1 이상이어야 합니다.")
+        self.factory = factory  # 새 세션에 사용할 주문 관리자 생성 함수
+        self.capacity = capacity  # 최대 동시 세션 수
+        self.ttl = ttl  # 세션 유휴 만료 시간(초), None이면 만료하지 않음
+        self.clock = clock
+        self.backend = backend  # 영속 저장소 (None이면 메모리에만 보관)
+        self._sessions = OrderedDict()  # sender_id -> (주문 관리자, 마지막 접근 시각), 오래된 순서
+        self._lock = threading.Lock()
+
+    # sender_id에 해당하는 주문 관리자 반환 메서드 (없으면 새로 생성)
+    def get(self, sender_id):
+        now = self.clock()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.pop(sender_id, None)
+            if entry:
+                manager = entry[0]
+                if self.backend is not None:
+                    self.backend.touch(sender_id)
+            else:
+                manager = self._load(sender_id)
+            # 가장 최근에 사용한 세션으로 맨 뒤에 다시 넣기
+            self._sessions[sender_id] = (manager, now)
+            while len(self._sessions) > self.capacity:
+                self._release(*self._sessions.popitem(last=False))
+            return manager
+
+    # 메모리에 없는 세션을 backend에서 불러오거나 새로 만드는 메서드
+    def _load(self, sender_id):
+        if self.backend is None:
+            return self.factory()
+        manager = self.backend.load(sender_id, max_age=self.ttl) or self.factory()
+        self.backend.track(sender_id, manager)
+        return manager
+
+    # 메모리에서 빠지는 세션을 backend에 넘기는 메서드
+    def _release(self, sender_id, entry):
+        if self.backend is not None:
+            self.backend.release(sender_id, entry[0])
+
+    # 세션 제거 메서드
+    def discard(self, sender_id):
+        with self._lock:
+            self._sessions.pop(sender_id, None)
+            if self.backend is not None:
+                self.backend.delete(sender_id)
+
+    # 전체 세션 초기화 메서드 (메모리에서만 비우며, backend에 저장된 세션은 유지)
+    def clear(self):
+        with self._lock:
+            while self._sessions:
+                self._release(*self._sessions.popitem(last=False))
+
+    # 만료된 세션 제거 메서드
+    def _evict_expired(self, now):
+        if self.ttl is None:
+            return
+        # 접근 순서대로 정렬되어 있으므로 앞에서부터 만료된 세션만 제거하면 된다
+        while self._sessions:
+            sender_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl:
+                break
+            self._release(sender_id, self._sessions.pop(sender_id))
+
+    def __contains__(self, sender_id):
+        with self._lock:
+            entry = self._sessions.get(sender_id)
+            return entry is not None and (self.ttl is None or self.clock() - entry[1] < self.ttl)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+# 환경 변수 설정에 따라 영속 저장소를 만드는 메서드 (기본값은 메모리 전용이라 None)
+#   ORDER_STORE_BACKEND: memory 또는 sqlite
+#   ORDER_STORE_PATH: SQLite 파일 경로 (기본값 order_sessions.db)
+#   ORDER_STORE_FLUSH_INTERVAL: 변경 내용을 모아서 기록하는 주기(초, 기본값 1)
+def create_backend_from_env(loader):
+    backend = os.getenv("ORDER_STORE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        from actions.sqlite_store import SQLiteOrderBackend
+
+        return SQLiteOrderBackend(
+            os.getenv("ORDER_STORE_PATH", "order_sessions.db"),
+            loader,
+            flush_interval=float(os.getenv("ORDER_STORE_FLUSH_INTERVAL", "1.0")),
+        )
+    raise ValueError(f"지원하지 않는 ORDER_STORE_BACKEND입니다: {backend}")
@@ -0,0 +1,175 @@
+from collections import deque
+
+from actions.numerals import numeral_terms
+
+# 찾아낸 엔티티의 extractor 값
+SPOTTER_EXTRACTOR = "EntitySpotter"
+
+# 사전에서 찾는 엔티티 종류 (같은 표현이 여러 종류에 있으면 앞에 있는 종류로 본다)
+SPOTTED_ENTITY_TYPES = ("drink_type", "additional_options", "size", "temperature", "quantity")
+
+# 수량 표현 뒤에 와야 하는 단위 ("두 잔", "두잔")
+QUANTITY_COUNTER = "잔"
+
+# 이 길이 이하의 표현은 앞뒤가 단어 경계일 때만 인정 ("바라는"의 "바라", "카라멜"의 "카라" 제외)
+SHORT_TERM_LENGTH = 2
+
+# 음료 변형 이름은 이 길이 이상만 검색 대상 ("아메", "라떼", "초라"처럼 짧은 변형은 일반 단어와 너무 자주 겹친다)
+MIN_DRINK_ALIAS_LENGTH = 3
+
+# 짧은 표현 뒤에 붙어도 단어 경계로 보는 조사 (긴 것부터 확인)
+PARTICLES = ("이랑", "으로", "하고", "은", "는", "이", "가", "을", "를", "로", "랑", "와", "과", "도", "만", "에", "요")
+
+# 잘못 찾던 문장과 기대 결과 (python -m actions.spotter로 확인)
+REGRESSION_CASES = (
+    ("바라는 건 없어요", []),
+    ("카라멜 시럽 추가", []),
+    ("아라비카 원두", []),
+    ("초라한 주문", []),
+    ("아이스 아메리카노 두 잔", [("temperature", "아이스"), ("drink_type", "아메리카노"), ("quantity", "두")]),
+    ("카페라떼 라지로 샷 추가", [("drink_type", "카페라떼"), ("size", "라지"), ("additional_options", "샷")]),
+)
+
+
+# 표현 앞이 단어 경계(문장 처음, 공백, 문장 부호)인지 확인하는 메서드
+def _is_left_boundary(text, start):
+    return start == 0 or not text[start - 1].isalnum()
+
+
+# 표현 뒤가 단어 경계인지 확인하는 메서드 (조사 하나는 건너뛴다)
+def _is_right_boundary(text, end):
+    if end == len(text) or not text[end].isalnum():
+        return True
+    for particle in PARTICLES:
+        if text.startswith(particle, end):
+            after = end + len(particle)
+            if after == len(text) or not text[after].isalnum():
+                return True
+    return False
+
+
+# 수량 표현 뒤에 (공백을 건너뛰고) 단위가 오는지 확인하는 메서드
+def _is_followed_by_counter(text, end):
+    while end < len(text) and text[end] == " ":
+        end += 1
+    return text.startswith(QUANTITY_COUNTER, end)
+
+
+# 엔티티 사전의 모든 표현을 한 번에 찾는 Aho-Corasick 검색기 (사전을 읽을 때 한 번만 생성)
+# NLU가 음료 엔티티를 놓친 경우 발화를 한 번만 훑어 OrderMapper가 받는 형태의 엔티티를 만든다
+# - 여러 표현이 겹치면 먼저 시작하는 것, 시작이 같으면 긴 것을 사용한다
+# - 두 글자 이하 표현("큰", "샷", "라지")은 앞뒤가 단어 경계일 때만(뒤에 조사 허용), 수량 표현은 뒤에 "잔"이 올 때만 인정한다
+# - 두 글자 이하 음료 변형 이름은 검색하지 않는다 (NLU가 놓친 발화에 없는 음료를 넣지 않도록)
+class EntitySpotter:
+    def __init__(self, terms_by_type):
+        # 노드마다 (다음 글자 -> 노드), 실패 링크, 이 노드에서 끝나는 (길이, 엔티티 종류) 목록
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for entity_type in SPOTTED_ENTITY_TYPES:
+            for term in terms_by_type.get(entity_type) or ():
+                self._add(str(term), entity_type)
+        self._build_failure_links()
+
+    # 사전 데이터(엔티티 종류 -> 표준값 -> 변형 목록)로 검색기를 만드는 메서드 (표준값과 수 표현도 검색 대상)
+    @classmethod
+    def from_lexicons(cls, data):
+        terms_by_type = {}
+        for entity_type in SPOTTED_ENTITY_TYPES:
+            terms = []
+            for canonical, variants in (data.get(entity_type) or {}).items():
+                terms.append(canonical)
+                if entity_type == "drink_type":
+                    variants = [variant for variant in variants or () if len(variant) >= MIN_DRINK_ALIAS_LENGTH]
+                terms.extend(variants or ())
+            terms_by_type[entity_type] = terms
+        # 사전에 없는 큰 수량("스무 잔", "열다섯 잔", "12잔")도 찾도록 수 표현 추가
+        terms_by_type["quantity"].extend(numeral_terms())
+        return cls(terms_by_type)
+
+    def _add(self, term, entity_type):
+        if not term:
+            return
+        node = 0
+        for char in term:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            node = next_node
+        # 같은 표현이 이미 다른 종류로 등록되어 있으면 먼저 등록한 종류 유지
+        if not self._outputs[node]:
+            self._outputs[node].append((len(term), entity_type))
+
+    # 너비 우선으로 실패 링크를 만들고, 실패 링크 쪽 출력(접미사로 끝나는 표현)을 미리 합쳐 두는 메서드
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                queue.append(child)
+
+    # 발화에서 찾은 모든 표현을 (시작, 끝, 엔티티 종류)로 반환하는 메서드 (경계 조건 확인 전)
+    def _matches(self, text):
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            end = index + 1
+            for length, entity_type in outputs[node]:
+                yield end - length, end, entity_type
+
+    # 발화에서 엔티티를 찾아 시작 위치 순 리스트로 반환하는 메서드
+    def spot(self, text):
+        candidates = []
+        for start, end, entity_type in self._matches(text):
+            if end - start <= SHORT_TERM_LENGTH and not _is_left_boundary(text, start):
+                continue
+            if entity_type == "quantity":
+                if not _is_followed_by_counter(text, end):
+                    continue
+            elif end - start <= SHORT_TERM_LENGTH and not _is_right_boundary(text, end):
+                continue
+            candidates.append((start, -end, entity_type))
+        candidates.sort()
+
+        entities = []
+        last_end = 0
+        for start, negative_end, entity_type in candidates:
+            end = -negative_end
+            if start < last_end:
+                continue
+            entities.append({
+                "entity": entity_type,
+                "start": start,
+                "end": end,
+                "value": text[start:end],
+                "extractor": SPOTTER_EXTRACTOR,
+            })
+            last_end = end
+        return entities
+
+
+if __name__ == "__main__":
+    from actions.lexicon_store import lexicons
+
+    spotter = lexicons.current.spotter
+    failed = 0
+    for text, expected in REGRESSION_CASES:
+        spotted = [(entity["entity"], entity["value"]) for entity in spotter.spot(text)]
+        if spotted != expected:
+            failed += 1
+            print(f"실패: {text!r} -> {spotted} (기대값 {expected})")
+    print(f"{len(REGRESSION_CASES) - failed}/{len(REGRESSION_CASES)} 통과")
+    raise SystemExit(1 if failed else 0)
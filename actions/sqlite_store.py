@@ -0,0 +1,197 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_sessions (
+    sender_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+# 주문 세션을 SQLite(WAL 모드)에 저장하는 영속 백엔드
+# - 요청 처리 중에는 DB에 쓰지 않고, 백그라운드 스레드가 flush_interval마다 바뀐 세션만 한 트랜잭션으로 기록(write-behind)
+# - 서버 재시작 후 처음 접근한 세션만 DB에서 읽어 온다(lazy load)
+# - updated_at은 마지막 접근 시각이므로, 접근만 있었던 세션은 updated_at만 갱신한다
+# 주문 관리자는 revision, to_dict(), lock 속성을 제공해야 한다
+class SQLiteOrderBackend:
+    def __init__(self, path, loader, flush_interval=1.0, clock=time.time):
+        self.path = path
+        self.loader = loader  # 저장된 dict -> 주문 관리자 (예: OrderManager.from_dict)
+        self.flush_interval = flush_interval
+        self.clock = clock  # 재시작 후에도 비교할 수 있도록 벽시계 시간 사용
+        self._local = threading.local()  # 스레드별 연결 (읽기용)
+        self._lock = threading.Lock()
+        # sender_id -> [주문 관리자, 마지막으로 저장한 revision, 마지막 접근 시각, 마지막으로 저장한 접근 시각]
+        self._tracked = {}
+        self._pending = {}  # sender_id -> (저장할 상태 JSON (None이면 삭제), 마지막 접근 시각), 메모리에서 빠진 세션용
+        self._inflight = {}  # flush()가 기록 중인 _pending 묶음 (커밋이 끝날 때까지 load()에서 보이도록 유지)
+        self._stop = threading.Event()
+        self._write_conn = self._connect()
+        self._write_conn.execute(SCHEMA)
+        self._write_conn.commit()
+        self._thread = threading.Thread(target=self._run, name="order-store-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL에서는 체크포인트 때만 fsync
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # 저장된 세션을 불러오는 메서드 (없거나 마지막 접근 후 max_age초가 지났으면 None)
+    def load(self, sender_id, max_age=None):
+        with self._lock:
+            # 아직 DB에 기록되지 않았거나 기록 중인 최신 상태가 있으면 그것을 사용
+            entry = self._pending.get(sender_id) or self._inflight.get(sender_id)
+        if entry is not None:
+            state, updated_at = entry
+        else:
+            row = self._reader().execute(
+                "SELECT state, updated_at FROM order_sessions WHERE sender_id = ?", (sender_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            state, updated_at = row
+        if state is None:
+            return None
+        if max_age is not None and self.clock() - updated_at >= max_age:
+            # 만료된 세션은 다음 기록 주기에 DB에서 삭제
+            with self._lock:
+                if sender_id not in self._tracked:
+                    self._pending[sender_id] = (None, updated_at)
+            return None
+        return self.loader(json.loads(state))
+
+    # 메모리에 올라온 세션을 변경 감시 대상으로 등록하는 메서드
+    def track(self, sender_id, manager):
+        now = self.clock()
+        with self._lock:
+            # 기록 대기 중(또는 기록 중)이던 상태에서 불러온 세션은 DB와 다를 수 있으므로
+            # 다음 주기에 기록되도록 revision을 비워 둔다
+            unsaved = sender_id in self._pending or sender_id in self._inflight
+            saved_revision = None if unsaved else manager.revision
+            self._pending.pop(sender_id, None)
+            self._tracked[sender_id] = [manager, saved_revision, now, None]
+
+    # 메모리에 있는 세션에 접근했음을 기록하는 메서드 (다음 주기에 updated_at 갱신)
+    def touch(self, sender_id):
+        with self._lock:
+            entry = self._tracked.get(sender_id)
+            if entry is not None:
+                entry[2] = self.clock()
+
+    # 메모리에서 빠지는 세션의 마지막 상태를 기록 대기열로 옮기는 메서드
+    def release(self, sender_id, manager):
+        with self._lock:
+            entry = self._tracked.pop(sender_id, None)
+            if entry is not None and (entry[1] != manager.revision or entry[2] != entry[3]):
+                self._pending[sender_id] = (self._serialize(manager)[0], entry[2])
+
+    # 세션 삭제 메서드 (DB에서도 삭제)
+    def delete(self, sender_id):
+        with self._lock:
+            self._tracked.pop(sender_id, None)
+            self._pending[sender_id] = (None, self.clock())
+
+    # (상태 JSON, revision) 반환 메서드
+    # 주문이 비어 있고 포장/매장 선택을 기다리는 완료 주문도 없으면 상태 대신 None을 반환해 DB에서 삭제
+    @staticmethod
+    def _serialize(manager):
+        # 주문 관리자의 잠금을 잡아 변경 도중의 상태가 저장되지 않도록 한다
+        with manager.lock:
+            revision = manager.revision
+            state = manager.to_dict()
+        if not state["line_items"] and not state.get("completed_order"):
+            return None, revision
+        return json.dumps(state, ensure_ascii=False), revision
+
+    # 바뀐 세션을 한 트랜잭션으로 기록하는 메서드
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+            changed, touched = [], []
+            for sender_id, entry in self._tracked.items():
+                if entry[0].revision != entry[1]:
+                    changed.append((sender_id, entry, entry[2]))
+                elif entry[2] != entry[3]:
+                    touched.append((sender_id, entry, entry[2]))
+        if not pending and not changed and not touched:
+            return 0
+
+        upserts, deletes, touches, saved = [], [], [], []
+        for sender_id, (state, updated_at) in pending.items():
+            if state is None:
+                deletes.append((sender_id,))
+            else:
+                upserts.append((sender_id, state, 0, updated_at))
+        for sender_id, entry, last_access in changed:
+            state, revision = self._serialize(entry[0])
+            if state is None:
+                deletes.append((sender_id,))
+            else:
+                upserts.append((sender_id, state, revision, last_access))
+            saved.append((entry, revision, last_access))
+        for sender_id, entry, last_access in touched:
+            touches.append((last_access, sender_id))
+            saved.append((entry, entry[1], last_access))
+
+        conn = self._write_conn
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO order_sessions (sender_id, state, revision, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sender_id) DO UPDATE SET state = excluded.state, revision = excluded.revision, "
+                "updated_at = excluded.updated_at",
+                upserts,
+            )
+            conn.executemany("UPDATE order_sessions SET updated_at = ? WHERE sender_id = ?", touches)
+            conn.executemany("DELETE FROM order_sessions WHERE sender_id = ?", deletes)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            # 다음 주기에 다시 기록하도록 대기열 복구 (그 사이 새로 들어온 상태가 우선)
+            with self._lock:
+                for sender_id, entry in pending.items():
+                    self._pending.setdefault(sender_id, entry)
+                self._inflight = {}
+            raise
+
+        with self._lock:
+            self._inflight = {}
+            for entry, revision, last_access in saved:
+                entry[1] = revision
+                entry[3] = last_access
+        return len(upserts) + len(touches) + len(deletes)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("주문 세션 저장 실패")
+
+    # 백그라운드 스레드를 멈추고 남은 변경을 기록하는 메서드
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._write_conn.close()